@@ -1,47 +1,236 @@
-from flask import Flask, render_template
+import os
+import threading
+from flask import Flask, Response, render_template, request, jsonify
 from flask_socketio import SocketIO
-from utils import emit
-from voiceAssistant import VoiceAssistant
-import numpy as np
-from speech_to_text.funASR import (
-    FunASRVAD,
-    FunASRUnifiedTranscription,
-    FunASRSpeakerVerification,
+from utils import emit, CHUNK_DURATION
+from concurrent.futures import ThreadPoolExecutor
+from speech_to_text.speakerProfileStore import SpeakerProfileStore
+from speech_to_text.energyGateVAD import EnergyGateVAD
+from speech_to_text.microBatching import BatchedUnifiedTranscription
+from speech_to_text.speechRecognizer import internal_pause_silence_ms
+from text_to_speech.textSegmenter import TextSegmenter
+from text_to_speech.audioCache import AudioCache, CachedTTSModel
+from sessionManager import SessionManager
+from responseCache import ResponseCache
+from audioTransport import AudioTransport
+from startup import StartupOrchestrator, synthetic_speech
+from tracing import Metrics, SamplingProfiler
+from inferenceWorkers import (
+    ModelSpec,
+    InferenceWorkerPool,
+    RemoteVAD,
+    RemoteUnifiedTranscription,
+    RemoteSpeakerVerification,
+    RemoteTTSModel,
 )
 
-from speech_to_text.speechRecognizer import SpeechRecognizer, SpeechRecognizerState
-from text_to_speech.speechGenerator import SpeechGenerator
-from llm import AnswerGenerator
-from text_to_speech.kokoroModel import kokoroModel
+# Ollama model of the answers, and its server (the local one by default). Load tests point it at a stand-in:
+# LLM_BASE_URL=http://127.0.0.1:11435 python app.py, see benchmarks.fakeOllama
+LLM_MODEL = "wizardlm2:7b"
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL")
+
+# Streaming VAD, turns are endpointed on the measured silence (ms) after the speech instead of counting chunks
+STREAMING_VAD_ENABLED = True
+# 500 ms is longer than the usual pauses within a sentence and leaves 200 ms of the 700 ms response target
+ENDPOINT_SILENCE_MS = 500
+IDLE_SILENCE_MS = 1000
+# A shorter silence within the speech, where the utterance so far is transcribed offline while the user goes on.
+# The VAD closes its segments after that much silence, the endpoint above is measured from their end. The silence
+# is only seen at the end of a chunk, so the window before the endpoint spans one chunk
+PAUSE_SILENCE_MS = internal_pause_silence_ms(ENDPOINT_SILENCE_MS, CHUNK_DURATION * 1000)
+
+# Cross-session micro-batching of the online ASR calls. fsmn-vad decodes one stream per call, the VAD is not batched
+BATCHING_ENABLED = True
+BATCH_MAX_SIZE = 8
+BATCH_MAX_WAIT_MS = 10
+
+# Answer obvious silence with an energy check instead of the neural VAD, between the speech segments of the
+# streaming VAD
+ENERGY_GATE_ENABLED = True
+
+# Bounded per-session audio queue (in chunks of 0.6 s) and what to do when it is full:
+# "block", "coalesce" or "drop_silent", see AudioIngestQueue
+AUDIO_QUEUE_MAXSIZE = 16
+AUDIO_QUEUE_POLICY = "coalesce"
+
+# Convert the mic chunks into preallocated slots instead of new arrays. A slot is reused once its chunk has been
+# processed, when all of them are taken the chunk gets a new array. Enough for the queue bound plus the chunks
+# being processed or blocked on a full queue, 0 allocates every chunk
+MIC_RING_BUFFER_SLOTS = (AUDIO_QUEUE_MAXSIZE or 16) + 16
+
+# Start streaming the LLM answer into a held buffer as soon as the offline transcription lands
+SPECULATIVE_LLM = True
+
+# Enrolled voice embeddings, persisted so returning users skip enrollment
+SPEAKER_PROFILE_DIR = "speaker_profiles"
+
+# Reuse the answer (and its audio) for a question already asked after the same context, shared by all sessions
+RESPONSE_CACHE_ENABLED = True
+
+# Synthesize the next segments of an answer on a thread pool shared by all sessions while the current one is
+# emitted, 0 synthesizes one segment at a time on the session's event loop
+TTS_WORKERS = 2
+TTS_LOOKAHEAD = 2
+
+# Cut the answer into a short first clause, then growing sentence groups, instead of every 50 characters
+LATENCY_AWARE_SEGMENTER = True
+
+# Synthesized audio of short recurring phrases, persisted so it survives restarts, pre-warmed from a phrase list
+TTS_CACHE_ENABLED = True
+TTS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+TTS_CACHE_DIR = "tts_cache"
+TTS_CACHE_PHRASES = "text_to_speech/commonPhrases.txt"
+
+# Load the models concurrently and run one synthetic inference through each before accepting connections
+STARTUP_WORKERS = 4
+STARTUP_WARM_UP = True
+
+# Threads shared by all connections to encode and decode compressed audio (Opus, mu-law), see audioCodecs
+CODEC_WORKERS = 2
+
+# Run the models in worker processes (this many per model) instead of threads of the server process, which then
+# only does the networking and orchestration. Audio goes through shared memory rather than being pickled
+INFERENCE_WORKERS_ENABLED = False
+INFERENCE_WORKERS = {"vad": 1, "asr": 1, "speaker_verification": 1, "tts": 1}
+
+# Sample the stacks of the audio threads, served as folded stacks on /profile for flame graphs
+PROFILE_AUDIO_THREADS = False
+PROFILER_INTERVAL_S = 0.01
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# In worker mode the speaker verification worker has the store
+speaker_profiles = SpeakerProfileStore(SPEAKER_PROFILE_DIR) if not INFERENCE_WORKERS_ENABLED else None
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+tts_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts") if TTS_WORKERS else None
+codec_executor = ThreadPoolExecutor(max_workers=CODEC_WORKERS, thread_name_prefix="codec") if CODEC_WORKERS else None
+# Per-turn latency histograms of all the sessions, served on /metrics
+metrics = Metrics()
+profiler = SamplingProfiler(interval=PROFILER_INTERVAL_S) if PROFILE_AUDIO_THREADS else None
+if profiler is not None:
+    profiler.start()
+
+
+def vad_spec():
+    if STREAMING_VAD_ENABLED:
+        return ModelSpec(
+            "speech_to_text.funASR:FunASRStreamingVAD", model_name="fsmn-vad", max_end_silence_time=PAUSE_SILENCE_MS
+        )
+    return ModelSpec("speech_to_text.funASR:FunASRVAD", model_name="fsmn-vad")
+
+
+def load_model(name, spec, remote_class):
+    """Build the model in this process, or start its worker processes and return a proxy in worker mode."""
+    if not INFERENCE_WORKERS_ENABLED:
+        return spec.build()
+    return remote_class(InferenceWorkerPool(spec, workers=INFERENCE_WORKERS[name], name=name))
+
+
+# Each worker process has its own store, which is why there is a single speaker verification worker
+profile_store_spec = ModelSpec("speech_to_text.speakerProfileStore:SpeakerProfileStore", directory=SPEAKER_PROFILE_DIR)
+
+# The models are loaded once, concurrently and in the background, and shared by every session
+startup = StartupOrchestrator(max_workers=STARTUP_WORKERS)
+warm_up_audio = synthetic_speech()
 # speech to text
-vad_model = FunASRVAD(model_name="fsmn-vad")
-unified_model = FunASRUnifiedTranscription(model_name="FunAudioLLM/SenseVoiceSmall")
-sv_model = FunASRSpeakerVerification(model_name="iic/speech_campplus_sv_zh-cn_16k-common")
-speech_recognizer = SpeechRecognizer(
-    vad_model=vad_model, unified_model=unified_model, sv_model=sv_model, socketio=socketio
+startup.add(
+    "vad",
+    lambda: load_model("vad", vad_spec(), RemoteVAD),
+    lambda model: model.warm_up(warm_up_audio) if STARTUP_WARM_UP else None,
+)
+startup.add(
+    "asr",
+    lambda: load_model(
+        "asr",
+        ModelSpec("speech_to_text.funASR:FunASRUnifiedTranscription", model_name="FunAudioLLM/SenseVoiceSmall"),
+        RemoteUnifiedTranscription,
+    ),
+    lambda model: model.warm_up(warm_up_audio) if STARTUP_WARM_UP else None,
+)
+startup.add(
+    "speaker_verification",
+    lambda: load_model(
+        "speaker_verification",
+        ModelSpec(
+            "speech_to_text.funASR:FunASRSpeakerVerification",
+            model_name="iic/speech_campplus_sv_zh-cn_16k-common",
+            profile_store=profile_store_spec if INFERENCE_WORKERS_ENABLED else speaker_profiles,
+        ),
+        RemoteSpeakerVerification,
+    ),
+    lambda model: model.warm_up(warm_up_audio) if STARTUP_WARM_UP else None,
 )
-interrupt_event = speech_recognizer.listening_to_user_event
-
 # text to speech
-kokoro = kokoroModel("kokoro/kokoro-v1.0.onnx", "kokoro/voices-v1.0.bin")
-speech_generator = SpeechGenerator(model=kokoro, interrupt_event=interrupt_event, socketio=socketio)
-
-# llm
-answer_generator = AnswerGenerator(model="wizardlm2:7b", socketio=socketio, interrupt_event=interrupt_event)
-
-# assistant
-assistant = VoiceAssistant(
-    speech_recognizer,
-    speech_generator,
-    answer_generator,
-    socketio,
+startup.add(
+    "tts",
+    lambda: load_model(
+        "tts",
+        ModelSpec(
+            "text_to_speech.kokoroModel:kokoroModel",
+            model_path="kokoro/kokoro-v1.0.onnx",
+            voices_path="kokoro/voices-v1.0.bin",
+        ),
+        RemoteTTSModel,
+    ),
+    lambda model: model.warm_up() if STARTUP_WARM_UP else None,
 )
-process_audio_thread = assistant.run()
-process_audio_thread.start()
+
+# Set once the models are ready
+vad_model = unified_model = sv_model = tts_model = session_manager = None
+gated_vad = None
+
+
+def setup_sessions(models):
+    global vad_model, unified_model, sv_model, tts_model, session_manager, gated_vad
+
+    vad_model = models["vad"]
+    unified_model = models["asr"]
+    sv_model = models["speaker_verification"]
+    if BATCHING_ENABLED:
+        unified_model = BatchedUnifiedTranscription(
+            unified_model, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS
+        )
+    if ENERGY_GATE_ENABLED:
+        vad_model = gated_vad = EnergyGateVAD(vad_model)
+
+    tts_model = models["tts"]
+    phrases = []
+    if TTS_CACHE_ENABLED:
+        tts_model = CachedTTSModel(tts_model, AudioCache(max_bytes=TTS_CACHE_MAX_BYTES, directory=TTS_CACHE_DIR))
+        with open(TTS_CACHE_PHRASES, encoding="utf-8") as f:
+            phrases = [line.strip() for line in f if line.strip()]
+        # Synthesized in the background, sessions can start right away
+        threading.Thread(target=tts_model.prewarm, args=(phrases,), daemon=True).start()
+
+    # One assistant (recognizer state, TTS queue, chat history, interrupt event) per Socket.IO connection
+    session_manager = SessionManager(
+        vad_model=vad_model,
+        unified_model=unified_model,
+        sv_model=sv_model,
+        tts_model=tts_model,
+        llm_model=LLM_MODEL,
+        socketio=socketio,
+        audio_queue_maxsize=AUDIO_QUEUE_MAXSIZE,
+        audio_queue_policy=AUDIO_QUEUE_POLICY,
+        endpoint_silence_ms=ENDPOINT_SILENCE_MS if STREAMING_VAD_ENABLED else None,
+        idle_silence_ms=IDLE_SILENCE_MS if STREAMING_VAD_ENABLED else None,
+        pause_silence_ms=PAUSE_SILENCE_MS if STREAMING_VAD_ENABLED else None,
+        speculative_llm=SPECULATIVE_LLM,
+        response_cache=response_cache,
+        tts_executor=tts_executor,
+        tts_lookahead=TTS_LOOKAHEAD,
+        # Answers starting with a prewarmed phrase get it as their first segment, however short
+        segmenter_factory=(lambda: TextSegmenter(known_phrases=phrases)) if LATENCY_AWARE_SEGMENTER else None,
+        metrics=metrics,
+        profiler=profiler,
+        llm_base_url=LLM_BASE_URL,
+    )
+
+
+# Worker processes are spawned, they import this module again as __mp_main__ and must not load the models too
+if __name__ != "__mp_main__":
+    startup.start(on_ready=setup_sessions)
 
 
 @app.route("/")
@@ -49,26 +238,114 @@ def index():
     return render_template("index.html")
 
 
+@app.route("/ready")
+def ready():
+    # For load balancers: 200 once every model is loaded and warm, 503 with the progress until then
+    status = startup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+@app.route("/stats")
+def stats():
+    if not startup.is_ready():
+        return jsonify({"startup": startup.status()})
+
+    result = {
+        "startup": startup.status(),
+        "sessions": session_manager.stats(),
+        # The store of the speaker verification model, in its worker process in worker mode
+        "speaker_profiles": sv_model.profile_count(),
+    }
+    if gated_vad is not None:
+        result["vad_gate"] = gated_vad.stats()
+    if BATCHING_ENABLED:
+        result["batching"] = {"online_asr": unified_model.stats()}
+    if response_cache is not None:
+        result["response_cache"] = response_cache.stats()
+    if TTS_CACHE_ENABLED:
+        result["tts_cache"] = tts_model.cache.stats()
+    if INFERENCE_WORKERS_ENABLED:
+        result["inference_workers"] = {name: model.stats() for name, model in startup.models.items()}
+    return jsonify(result)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    gauges = {"ready": int(startup.is_ready()), "sessions": len(session_manager) if session_manager is not None else 0}
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/profile")
+def profile():
+    if profiler is None:
+        return "Profiling is disabled, set PROFILE_AUDIO_THREADS\n", 404
+    return Response(profiler.collapsed(), mimetype="text/plain")
+
+
+def get_session(sid):
+    return session_manager.get_session(sid) if session_manager is not None else None
+
+
 @socketio.on("audio_data")
-def handle_audio_data(mic_bytes):
-    print(f"Received audio data: {len(mic_bytes)} bytes")
+def handle_audio_data(data):
+    assistant = get_session(request.sid)
+    if assistant is None:
+        return
+
+    transport = assistant.speech_generator.transport
+    sid = request.sid
 
-    audio_array = np.frombuffer(mic_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+    def decoded(seq, audio_array):
+        assistant.audio_queue.put(audio_array)
 
-    assistant.audio_queue.put(audio_array)
+        # Only clients that asked for flow control get acks
+        if transport.flow_control:
+            socketio.emit("audio_ack", {"seq": seq}, to=sid)
 
-    socketio.emit("audio_ack", {"message": "Audio received and processed"})
+    transport.decode_mic(data, decoded)
+
+
+@socketio.on("audio_frame_ack")
+def handle_audio_frame_ack(data):
+    assistant = get_session(request.sid)
+    if assistant is None:
+        return
+
+    assistant.speech_generator.ack(int(data["seq"]))
 
 
 @socketio.on("connect")
-def handle_connect():
-    emit(
-        socketio,
-        "user_idle_counter_threshold",
-        {"threshold": assistant.speech_recognizer.is_idle_counter_threshold},
+def handle_connect(auth=None):
+    if not startup.is_ready():
+        # Refuse the connection until the models are warm, the client retries
+        return False
+
+    # Clients may identify their user, e.g. io.connect(url, {query: {user: "alice"}}), and negotiate the audio
+    # transport in the auth payload, see AudioTransport. A claimed name only loads the stored voice profile, it is
+    # updated for users authenticated by a proxy in front of the server (REMOTE_USER)
+    transport = AudioTransport.from_auth(auth, executor=codec_executor, mic_buffer_slots=MIC_RING_BUFFER_SLOTS)
+    authenticated_user = request.environ.get("REMOTE_USER")
+    assistant = session_manager.create_session(
+        request.sid,
+        user=authenticated_user or request.args.get("user"),
+        transport=transport,
+        user_authenticated=authenticated_user is not None,
     )
+    emit(assistant.socketio, "audio_codec", {"codec": transport.codec})
+    if not STREAMING_VAD_ENABLED:
+        # The turns are endpointed on the idle counter, shown by the client
+        emit(
+            assistant.socketio,
+            "user_idle_counter_threshold",
+            {"threshold": assistant.speech_recognizer.is_idle_counter_threshold},
+        )
+
+
+@socketio.on("disconnect")
+def handle_disconnect():
+    if session_manager is not None:
+        session_manager.close_session(request.sid)
 
 
 if __name__ == "__main__":
     socketio.run(app, debug=True, port=8080)
-    process_audio_thread.join()
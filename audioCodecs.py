@@ -0,0 +1,144 @@
+import collections
+import struct
+import threading
+from concurrent.futures import Future
+import numpy as np
+
+try:
+    # Optional, needs libopus: pip install opuslib
+    import opuslib
+except ImportError:
+    opuslib = None
+
+MULAW_MU = 255
+
+
+class PCM16Codec:
+    """Raw little-endian int16, what the page always sent."""
+
+    name = "pcm16"
+
+    def encode(self, samples):
+        return samples.astype(np.int16, copy=False).tobytes()
+
+    def decode(self, payload):
+        return np.frombuffer(payload, dtype=np.int16)
+
+
+class MulawCodec:
+    """8 bit mu-law companding, half the bandwidth of pcm16 at no real CPU cost."""
+
+    name = "mulaw"
+
+    def encode(self, samples):
+        x = samples.astype(np.float32) / 32768.0
+        y = np.sign(x) * np.log1p(MULAW_MU * np.abs(x)) / np.log1p(MULAW_MU)
+        return np.round((y + 1) * 127.5).astype(np.uint8).tobytes()
+
+    def decode(self, payload):
+        y = np.frombuffer(payload, dtype=np.uint8).astype(np.float32) / 127.5 - 1
+        x = np.sign(y) * np.expm1(np.abs(y) * np.log1p(MULAW_MU)) / MULAW_MU
+        return (x * 32767).astype(np.int16)
+
+
+class OpusCodec:
+    """
+    Opus in 20 ms frames, a payload is the frames of one chunk, each prefixed with its uint16 length. The
+    encoder and decoder are stateful, so one instance serves a single stream and its frames must go in order.
+    """
+
+    name = "opus"
+
+    def __init__(self, sample_rate, frame_ms=20, bitrate=24000):
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.encoder = opuslib.Encoder(sample_rate, 1, opuslib.APPLICATION_VOIP)
+        self.encoder.bitrate = bitrate
+        self.decoder = opuslib.Decoder(sample_rate, 1)
+
+    def encode(self, samples):
+        samples = samples.astype(np.int16, copy=False)
+        # The last frame is padded with silence, the receiver trims it to the sample count it is told
+        padding = -len(samples) % self.frame_size
+        samples = np.concatenate([samples, np.zeros(padding, dtype=np.int16)]) if padding else samples
+
+        packets = []
+        for start in range(0, len(samples), self.frame_size):
+            packet = self.encoder.encode(samples[start : start + self.frame_size].tobytes(), self.frame_size)
+            packets.append(struct.pack("<H", len(packet)) + packet)
+        return b"".join(packets)
+
+    def decode(self, payload):
+        frames = []
+        offset = 0
+        while offset < len(payload):
+            (length,) = struct.unpack_from("<H", payload, offset)
+            packet = bytes(payload[offset + 2 : offset + 2 + length])
+            offset += 2 + length
+            # Up to 120 ms per packet, browsers may send longer frames than we do
+            frames.append(self.decoder.decode(packet, self.sample_rate * 120 // 1000))
+        return np.frombuffer(b"".join(frames), dtype=np.int16)
+
+
+def available_codecs():
+    return ["opus", "mulaw", "pcm16"] if opuslib is not None else ["mulaw", "pcm16"]
+
+
+def negotiate_codec(preferences):
+    """The first of the client's codecs this server supports, pcm16 if there is none."""
+    supported = available_codecs()
+    for codec in preferences or []:
+        if codec in supported:
+            return codec
+    return "pcm16"
+
+
+def create_codec(name, sample_rate):
+    if name == "opus":
+        return OpusCodec(sample_rate)
+    if name == "mulaw":
+        return MulawCodec()
+    return PCM16Codec()
+
+
+class OrderedCodecStream:
+    """
+    Runs the codec work of one stream on a pool shared by all connections.
+
+    Only one job of the stream is on the pool at a time, in submission order, so stateful codecs see their frames
+    in order while different connections are coded in parallel. submit() returns a future of the result, whoever
+    waits on it does the rest (e.g. a blocking put) so the pool threads never wait on a session.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.jobs = collections.deque()
+        self.running = False
+        self.lock = threading.Lock()
+
+    def submit(self, fn, data):
+        result = Future()
+        with self.lock:
+            self.jobs.append((fn, data, result))
+            if self.running:
+                return result
+            self.running = True
+        self.run_next()
+        return result
+
+    def run_next(self):
+        with self.lock:
+            if not self.jobs:
+                self.running = False
+                return
+            fn, data, result = self.jobs.popleft()
+
+        future = self.executor.submit(fn, data)
+        future.add_done_callback(lambda future: self.done(future, result))
+
+    def done(self, future, result):
+        try:
+            result.set_result(future.result())
+        except Exception as e:
+            result.set_exception(e)
+        self.run_next()
@@ -0,0 +1,147 @@
+import queue
+import time
+import numpy as np
+from utils import audio_rms
+
+
+class AudioIngestQueue(queue.Queue):
+    """
+    Bounded queue of incoming audio chunks.
+
+    Each chunk is timestamped when it is put, so the consumer can tell how far it is behind wall-clock time.
+    When the queue is full (maxsize entries) the overload policy decides what happens to a new chunk:
+
+    - "block": the producer waits for room, like queue.Queue.
+    - "coalesce": the chunk is appended to the newest queued entry, and the consumer takes up to max_coalesce
+      pending chunks at once as one larger chunk, so a slow box catches up with fewer, larger model calls.
+    - "drop_silent": a silent chunk (RMS energy below silence_rms) is dropped, otherwise the oldest queued
+      silent chunk makes room for it. If there is no silence to drop the producer waits.
+
+    None is passed through as an end of stream marker regardless of the bound.
+
+    Chunks may live in a shared buffer (see AudioRingBuffer): release is then called with every chunk the queue
+    merges or drops, and the consumer calls release() with each chunk it got once done with it.
+    """
+
+    POLICIES = ("block", "coalesce", "drop_silent")
+
+    def __init__(self, maxsize=0, policy="block", max_coalesce=4, silence_rms=0.01, release=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown overload policy {policy!r}, expected one of {self.POLICIES}.")
+
+        super().__init__(maxsize)
+        self.policy = policy
+        self.max_coalesce = max_coalesce
+        self.silence_rms = silence_rms
+        self.release_chunk = release
+
+        self.last_put_time = time.monotonic()
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.lag_count = 0
+
+        self.blocked = 0
+        self.coalesced = 0
+        self.dropped_silent = 0
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if item is not None and 0 < self.maxsize <= self._qsize():
+                if self.policy == "coalesce" and self.coalesce_into_newest(item):
+                    return
+                if self.policy == "drop_silent" and self.drop_silent(item):
+                    return
+
+            if item is not None and 0 < self.maxsize <= self._qsize():
+                self.blocked += 1
+                if not block:
+                    raise queue.Full
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._qsize() >= self.maxsize:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Full
+                    self.not_full.wait(remaining)
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def coalesce_into_newest(self, item):
+        put_time, newest, chunks = self.queue[-1]
+        if newest is None or chunks >= self.max_coalesce:
+            return False
+
+        self.queue[-1] = (put_time, np.concatenate([newest, item]), chunks + 1)
+        self.release(newest)
+        self.release(item)
+        self.coalesced += 1
+        return True
+
+    def drop_silent(self, item):
+        if audio_rms(item) < self.silence_rms:
+            self.release(item)
+            self.dropped_silent += 1
+            return True
+
+        for i, (_, queued, _) in enumerate(self.queue):
+            if queued is not None and audio_rms(queued) < self.silence_rms:
+                del self.queue[i]
+                self.release(queued)
+                self.dropped_silent += 1
+                self._put(item)
+                self.not_empty.notify()
+                return True
+
+        return False
+
+    def release(self, item):
+        if self.release_chunk is not None:
+            self.release_chunk(item)
+
+    def _put(self, item):
+        self.queue.append((time.monotonic(), item, 1))
+
+    def _get(self):
+        put_time, item, chunks = self.queue.popleft()
+
+        if self.policy == "coalesce" and item is not None and self.queue:
+            # Take the backlog as one larger chunk, keeping the age of the oldest one
+            items = [item]
+            while self.queue and chunks < self.max_coalesce and self.queue[0][1] is not None:
+                _, queued, queued_chunks = self.queue.popleft()
+                items.append(queued)
+                chunks += queued_chunks
+                # Chunks merged when they were put are already counted
+                self.coalesced += 1
+                self.unfinished_tasks -= 1
+            if len(items) > 1:
+                item = np.concatenate(items)
+                for merged in items:
+                    self.release(merged)
+                self.not_full.notify_all()
+
+        if item is not None:
+            self.last_put_time = put_time
+            self.record_lag(time.monotonic() - put_time)
+        return item
+
+    def record_lag(self, lag):
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.total_lag += lag
+        self.lag_count += 1
+
+    def stats(self):
+        with self.mutex:
+            return {
+                "queued_chunks": sum(chunks for _, _, chunks in self.queue),
+                "lag_last_s": self.last_lag,
+                "lag_max_s": self.max_lag,
+                "lag_mean_s": self.total_lag / self.lag_count if self.lag_count else 0.0,
+                "policy": self.policy,
+                "blocked": self.blocked,
+                "coalesced": self.coalesced,
+                "dropped_silent": self.dropped_silent,
+            }
@@ -0,0 +1,161 @@
+import base64
+import threading
+import numpy as np
+from audioCodecs import OrderedCodecStream, create_codec, negotiate_codec
+from speech_to_text.audioRingBuffer import AudioRingBuffer, INT16_SCALE
+
+SAMPLE_FORMATS = ("int16", "float32")
+
+
+def to_int16(samples):
+    if samples.dtype == np.int16:
+        return samples
+    return (samples * 32767).astype(np.int16)
+
+
+def to_float32(samples):
+    if samples.dtype == np.int16:
+        # Same scale as the mic chunks, int16 samples map to [-1, 1)
+        return samples.astype(np.float32) * INT16_SCALE
+    return samples.astype(np.float32, copy=False)
+
+
+class AudioTransport:
+    """
+    How audio is exchanged with one client, negotiated through the Socket.IO auth payload on connect, e.g.
+    io.connect(url, {auth: {audio_transport: "binary", audio_format: "float32", flow_control: true}}).
+
+    Clients that send no auth get what the page always used: base64 int16 in "audio_stream" and no acks.
+    In binary mode TTS audio goes out as "audio_frame" events whose samples are a binary attachment, and mic
+    chunks may come as {seq, samples}. With flow control, the server acks every mic chunk with its seq and
+    keeps at most window TTS frames unacked by the client.
+
+    Binary clients may also list the codecs they support in audio_codecs, the first one this server supports
+    is used in both directions (see audioCodecs), pcm16 otherwise. Compressed audio is coded on the executor.
+
+    With mic_buffer_slots, mic chunks are converted into the slots of an AudioRingBuffer instead of new arrays.
+    """
+
+    def __init__(
+        self,
+        binary=False,
+        sample_format="int16",
+        flow_control=False,
+        window=8,
+        codec="pcm16",
+        executor=None,
+        mic_sample_rate=16000,
+        mic_buffer_slots=0,
+        mic_chunk_size=9600,
+    ):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported audio format: {sample_format}")
+
+        self.binary = binary
+        self.sample_format = sample_format
+        self.flow_control = flow_control
+        self.window = window
+
+        self.codec = codec
+        self.executor = executor
+        self.uplink_codec = create_codec(codec, mic_sample_rate)
+        self.uplink_stream = OrderedCodecStream(executor) if executor is not None else None
+        # Chunks decoded on the executor are handed over in the order they were submitted
+        self.uplink_order = threading.Condition()
+        self.uplink_submitted = 0
+        self.uplink_delivered = 0
+        # Created for the sample rate of the first TTS chunk
+        self.downlink_codec = None
+        self.mic_buffer = AudioRingBuffer(mic_buffer_slots, mic_chunk_size) if mic_buffer_slots else None
+
+    @classmethod
+    def from_auth(cls, auth, executor=None, mic_buffer_slots=0):
+        auth = auth if isinstance(auth, dict) else {}
+        sample_format = auth.get("audio_format", "int16")
+        binary = auth.get("audio_transport") == "binary"
+        return cls(
+            binary=binary,
+            # Fall back to int16 for formats this server does not know
+            sample_format=sample_format if sample_format in SAMPLE_FORMATS else "int16",
+            flow_control=bool(auth.get("flow_control", False)),
+            window=int(auth.get("flow_control_window", 8)),
+            # Compressed payloads only travel as binary attachments
+            codec=negotiate_codec(auth.get("audio_codecs")) if binary else "pcm16",
+            executor=executor,
+            mic_buffer_slots=mic_buffer_slots,
+        )
+
+    @property
+    def compressed(self):
+        return self.codec != "pcm16"
+
+    def encode_audio(self, samples, sample_rate, seq):
+        """Return the event and payload to send TTS samples (float32 from the model or int16 from the cache)."""
+        if not self.binary:
+            audio_base64 = base64.b64encode(to_int16(samples).tobytes()).decode("utf-8")
+            return "audio_stream", {"samplerate": sample_rate, "samples": audio_base64, "stopped": False, "seq": seq}
+
+        if self.compressed:
+            if self.downlink_codec is None or getattr(self.downlink_codec, "sample_rate", sample_rate) != sample_rate:
+                self.downlink_codec = create_codec(self.codec, sample_rate)
+            samples = to_int16(samples)
+            return "audio_frame", {
+                "seq": seq,
+                "samplerate": sample_rate,
+                "codec": self.codec,
+                # Lets the client trim the padding of the last codec frame
+                "length": len(samples),
+                "samples": self.downlink_codec.encode(samples),
+            }
+
+        samples = to_float32(samples) if self.sample_format == "float32" else to_int16(samples)
+        # python-socketio only sends bytes as a binary attachment, so this is the one copy out of the array
+        return "audio_frame", {
+            "seq": seq,
+            "samplerate": sample_rate,
+            "format": self.sample_format,
+            "samples": samples.tobytes(),
+        }
+
+    def decode_payload(self, payload):
+        samples = self.uplink_codec.decode(payload)
+        if self.mic_buffer is not None:
+            return self.mic_buffer.write(samples)
+        return to_float32(samples)
+
+    def decode_mic(self, data, callback):
+        """
+        Decode a mic chunk, raw int16 bytes or {seq, samples}, and call callback(seq, float32 samples). Compressed
+        chunks are decoded on the executor, but the callback (which may block on a full audio queue) runs on the
+        calling thread, in the order the chunks arrived, so one busy session does not hold the shared pool.
+        """
+        seq = None
+        if isinstance(data, dict):
+            seq = data.get("seq")
+            data = data["samples"]
+
+        if not self.compressed or self.uplink_stream is None:
+            callback(seq, self.decode_payload(data))
+            return
+
+        with self.uplink_order:
+            turn = self.uplink_submitted
+            self.uplink_submitted += 1
+            decoded = self.uplink_stream.submit(self.decode_payload, data)
+
+        try:
+            audio = decoded.result()
+        except Exception as e:
+            audio = None
+            print(f"Audio codec failed: {e}")
+
+        with self.uplink_order:
+            self.uplink_order.wait_for(lambda: self.uplink_delivered == turn)
+        try:
+            # Outside the lock, the next chunks are still submitted while this one waits for room
+            if audio is not None:
+                callback(seq, audio)
+        finally:
+            with self.uplink_order:
+                self.uplink_delivered += 1
+                self.uplink_order.notify_all()
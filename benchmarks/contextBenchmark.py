@@ -0,0 +1,107 @@
+"""
+Time to first token of a long conversation, with the unbounded history the assistant used to send
+(instruction appended to every user message) and with ChatContext.
+
+    ollama serve
+    python -m benchmarks.contextBenchmark --turns 50 --output context_ttft.json
+"""
+
+import argparse
+import json
+import statistics
+import time
+from langchain_ollama import ChatOllama
+from langchain_core.messages import HumanMessage, AIMessage
+from chatContext import ChatContext
+from llm import AnswerGenerator
+
+QUESTIONS = [
+    "What is a good way to start learning the piano?",
+    "How long should I practice every day?",
+    "Which pieces are good for beginners?",
+    "Can you explain what a chord is?",
+    "What is the difference between a major and a minor chord?",
+    "How do I keep a steady rhythm?",
+    "Should I learn to read sheet music first?",
+    "What about playing by ear?",
+    "How do I avoid getting tension in my hands?",
+    "What is a good first goal for the next month?",
+]
+
+
+def time_to_first_token(llm, messages):
+    start = time.perf_counter()
+    ttft = None
+    answer = ""
+    for chunk in llm.stream(messages):
+        if ttft is None and chunk.content:
+            ttft = time.perf_counter() - start
+        answer += chunk.content
+    return ttft, answer
+
+
+def run_unbounded(llm, turns):
+    history = []
+    ttfts = []
+    for i in range(turns):
+        history.append(HumanMessage(content=QUESTIONS[i % len(QUESTIONS)] + " " + AnswerGenerator.INSTRUCTION))
+        ttft, answer = time_to_first_token(llm, history)
+        history.append(AIMessage(content=answer))
+        ttfts.append(ttft)
+        print(f"unbounded turn {i + 1}: ttft {ttft:.3f}s")
+    return ttfts
+
+
+def run_context(llm, turns, token_budget):
+    context = ChatContext(llm, AnswerGenerator.INSTRUCTION, token_budget=token_budget)
+    ttfts = []
+    for i in range(turns):
+        context.add_message(HumanMessage(content=QUESTIONS[i % len(QUESTIONS)]))
+        ttft, answer = time_to_first_token(llm, context.messages())
+        context.add_message(AIMessage(content=answer))
+        ttfts.append(ttft)
+        print(f"context turn {i + 1}: ttft {ttft:.3f}s")
+    return ttfts, context.stats()
+
+
+def summarize(ttfts):
+    ttfts = [ttft for ttft in ttfts if ttft is not None]
+    return {
+        "mean_s": statistics.mean(ttfts),
+        "median_s": statistics.median(ttfts),
+        "last_10_mean_s": statistics.mean(ttfts[-10:]),
+        "per_turn_s": ttfts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="wizardlm2:7b")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--token-budget", type=int, default=2048)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    llm = ChatOllama(model=args.model)
+    unbounded = run_unbounded(llm, args.turns)
+    bounded, context_stats = run_context(llm, args.turns, args.token_budget)
+
+    results = {
+        "model": args.model,
+        "turns": args.turns,
+        "unbounded": summarize(unbounded),
+        "context": {**summarize(bounded), "stats": context_stats},
+    }
+    print(
+        f"mean ttft unbounded {results['unbounded']['mean_s']:.3f}s, context {results['context']['mean_s']:.3f}s; "
+        f"last 10 turns unbounded {results['unbounded']['last_10_mean_s']:.3f}s, "
+        f"context {results['context']['last_10_mean_s']:.3f}s"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
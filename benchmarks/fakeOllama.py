@@ -0,0 +1,199 @@
+"""
+A local stand-in for the Ollama chat API, streams canned answers with a fixed time to first token and token rate
+so the rest of the pipeline can be measured without a GPU or a model download.
+
+    python -m benchmarks.fakeOllama --port 11435 --ttft 0.3 --token-interval 0.03
+
+The defaults can also be set with FAKE_OLLAMA_PORT, FAKE_OLLAMA_TTFT_S and FAKE_OLLAMA_TOKEN_INTERVAL_S. Point the
+assistant at it with AnswerGenerator(base_url="http://127.0.0.1:11435").
+"""
+
+import argparse
+import json
+import os
+import re
+import select
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWERS = [
+    "Sure. Start with a few minutes of scales every day, then learn one simple piece you enjoy. "
+    "Keep your wrists relaxed and play slowly at first, speed comes with time.",
+    "The Hobbit was published in 1937. Tolkien started writing it around 1930 while he was a professor at Oxford.",
+    "Open the settings, tap Wi-Fi and turn it on. Then pick your network from the list and enter the password.",
+    "A chord is three or more notes played together. A major chord sounds bright, a minor chord sounds darker "
+    "because its middle note is a half step lower.",
+]
+
+
+def split_tokens(text):
+    # Roughly the size of the tokens of a 7B model, a word with its trailing space
+    return re.findall(r"\S+\s*", text)
+
+
+class FakeOllama:
+    """Serves /api/chat in a background thread, every request answers with the next of the canned answers."""
+
+    def __init__(self, host="127.0.0.1", port=0, ttft_s=0.3, token_interval_s=0.03, answers=ANSWERS, model="fake"):
+        self.ttft_s = ttft_s
+        self.token_interval_s = token_interval_s
+        self.answers = answers
+        self.model = model
+
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "completed": 0, "cancelled": 0, "tokens": 0}
+
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self.send_json({"models": [{"name": fake.model, "model": fake.model}]})
+                else:
+                    self.send_json({"version": "0.0.0-fake"})
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+                fake.chat(self, request)
+
+            def send_json(self, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def next_answer(self):
+        with self.lock:
+            self.counters["requests"] += 1
+            return self.answers[(self.counters["requests"] - 1) % len(self.answers)]
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def chunk(self, request, content, done, **fields):
+        return {
+            "model": request.get("model", self.model),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+            **fields,
+        }
+
+    def wait(self, handler, seconds):
+        """Sleep like the model computes, but notice a client that goes away meanwhile, as Ollama does."""
+        readable, _, _ = select.select([handler.connection], [], [], seconds)
+        if readable and not handler.connection.recv(1, socket.MSG_PEEK):
+            raise ConnectionResetError("client closed the connection")
+
+    def chat(self, handler, request):
+        tokens = split_tokens(self.next_answer())
+        start = time.perf_counter_ns()
+
+        if not request.get("stream", True):
+            time.sleep(self.ttft_s + self.token_interval_s * (len(tokens) - 1))
+            handler.send_json(self.chunk(request, "".join(tokens), True, done_reason="stop"))
+            self.count("completed")
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def write(body):
+            data = json.dumps(body).encode("utf-8") + b"\n"
+            handler.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            handler.wfile.flush()
+
+        try:
+            self.wait(handler, self.ttft_s)
+            for i, token in enumerate(tokens):
+                if i:
+                    self.wait(handler, self.token_interval_s)
+                write(self.chunk(request, token, False))
+                self.count("tokens")
+            write(
+                self.chunk(
+                    request,
+                    "",
+                    True,
+                    done_reason="stop",
+                    total_duration=time.perf_counter_ns() - start,
+                    prompt_eval_count=sum(len(m.get("content", "")) // 4 for m in request.get("messages", [])),
+                    eval_count=len(tokens),
+                )
+            )
+            handler.wfile.write(b"0\r\n\r\n")
+            handler.wfile.flush()
+            self.count("completed")
+        except OSError:
+            # The client aborted the generation, e.g. a barge-in
+            self.count("cancelled")
+            handler.close_connection = True
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("FAKE_OLLAMA_PORT", 11435)))
+    parser.add_argument("--ttft", type=float, default=float(os.environ.get("FAKE_OLLAMA_TTFT_S", 0.3)))
+    parser.add_argument(
+        "--token-interval", type=float, default=float(os.environ.get("FAKE_OLLAMA_TOKEN_INTERVAL_S", 0.03))
+    )
+    args = parser.parse_args()
+
+    fake = FakeOllama(args.host, args.port, ttft_s=args.ttft, token_interval_s=args.token_interval)
+    print(f"Fake Ollama listening on {fake.base_url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stopped: {fake.stats()}")
+
+
+if __name__ == "__main__":
+    main()
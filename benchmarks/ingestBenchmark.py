@@ -0,0 +1,111 @@
+"""
+Memory allocated per mic chunk on its way from the Socket.IO payload to the accumulated speech, measured with
+tracemalloc: a new float32 array per chunk and a list concatenated for the offline pass (the assistant used to
+do that) vs. the AudioRingBuffer slots and the preallocated SpeechBuffer.
+
+    python -m benchmarks.ingestBenchmark --chunks 2000 --output ingest.json
+
+Utterances of --utterance chunks are decoded, appended to the speech and handed to the offline pass as one
+contiguous array. The allocation of a chunk is the peak of traced memory while it is ingested, over what was
+allocated before, the offline pass (one copy of the utterance either way) is reported apart.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from audioTransport import AudioTransport
+from speech_to_text.audioRingBuffer import SpeechBuffer
+from utils import CHUNK_SIZE
+
+
+class ListSpeech:
+    """The accumulation the assistant used to do."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+
+    def snapshot(self):
+        return np.concatenate(self.chunks)
+
+    def reset(self):
+        self.chunks = []
+
+
+def measure(transport, speech, payloads, utterance):
+    chunk_bytes = []
+    offline_bytes = []
+    decoded = []
+    start = time.perf_counter()
+
+    for i, payload in enumerate(payloads):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        transport.decode_mic(payload, lambda seq, audio: decoded.append(audio))
+        chunk = decoded.pop()
+        speech.append(chunk)
+        if transport.mic_buffer is not None:
+            transport.mic_buffer.release(chunk)
+        chunk_bytes.append(tracemalloc.get_traced_memory()[1] - before)
+
+        if (i + 1) % utterance == 0:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            audio = speech.snapshot()
+            speech.reset()
+            offline_bytes.append(tracemalloc.get_traced_memory()[1] - before)
+            del audio
+
+    elapsed = time.perf_counter() - start
+    # The first utterance warms up the lists and caches, steady state is what matters
+    steady = chunk_bytes[utterance:]
+    return {
+        "bytes_per_chunk_mean": float(np.mean(steady)),
+        "bytes_per_chunk_max": int(np.max(steady)),
+        "bytes_per_offline_pass_mean": float(np.mean(offline_bytes)),
+        "us_per_chunk": 1e6 * elapsed / len(payloads),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--utterance", type=int, default=10, help="chunks per offline pass")
+    parser.add_argument("--slots", type=int, default=32)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    payloads = [
+        (rng.normal(0, 3000, CHUNK_SIZE).clip(-32768, 32767).astype(np.int16)).tobytes() for _ in range(args.chunks)
+    ]
+
+    tracemalloc.start()
+    results = {
+        "chunks": args.chunks,
+        "chunk_bytes_int16": CHUNK_SIZE * 2,
+        "allocating": measure(AudioTransport(), ListSpeech(), payloads, args.utterance),
+        "ring_buffer": measure(
+            AudioTransport(mic_buffer_slots=args.slots), SpeechBuffer(args.utterance + 2), payloads, args.utterance
+        ),
+    }
+    tracemalloc.stop()
+
+    for name in ("allocating", "ring_buffer"):
+        result = results[name]
+        print(
+            f"{name}: {result['bytes_per_chunk_mean']:.0f} bytes per chunk (max {result['bytes_per_chunk_max']}), "
+            f"{result['bytes_per_offline_pass_mean']:.0f} per offline pass, {result['us_per_chunk']:.1f} us per chunk"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
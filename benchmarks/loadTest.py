@@ -0,0 +1,415 @@
+"""
+Opens N simulated clients against a running app.py to find how many concurrent conversations one box sustains.
+
+Every client behaves like the page: it connects with the binary transport and flow control, sends its microphone
+as {seq, samples} int16 chunks of 0.6 s at real-time pace (silence between turns, recorded speech for a turn),
+plays the received audio frames back on a simulated clock and acks them when they start playing. With
+--barge-in, a turn's answer is interrupted by the next utterance with that probability.
+
+Reported per client and overall: turn latency (end of speech to first audio frame), barge-in latency (speech over
+the answer to the server's listening_to_user), missing and out of order audio frames, playback underruns (late
+audio), microphone ack latency, and the audio queue lag of every session from /stats.
+
+Fully offline, with the Ollama stand-in, either let this script start both:
+    python -m benchmarks.loadTest --launch --clients 8 --output load.json
+or run them yourself:
+    python -m benchmarks.fakeOllama --port 11435
+    LLM_BASE_URL=http://127.0.0.1:11435 python app.py
+    python -m benchmarks.loadTest --clients 8 --turns 5 speech/*.wav
+
+Replaying the same utterances hits the response and TTS caches of the server after the first turns, turn them off
+in app.py to load the whole path.
+
+Needs python-socketio with the client extras (pip install "python-socketio[client]").
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import numpy as np
+from benchmarks.fakeOllama import FakeOllama
+from benchmarks.replayBenchmark import distribution
+from startup import synthetic_speech
+from utils import read_wav, CHUNK_DURATION, CHUNK_SIZE
+
+try:
+    import socketio
+except ImportError:
+    socketio = None
+
+# Playback gaps shorter than this are not counted as underruns
+UNDERRUN_TOLERANCE_S = 0.02
+
+
+def to_chunks(audio):
+    """int16 bytes of CHUNK_SIZE samples, the last chunk padded with silence."""
+    padded = np.zeros(-(-len(audio) // CHUNK_SIZE) * CHUNK_SIZE, dtype=np.float32)
+    padded[: len(audio)] = audio
+    samples = np.clip(padded * 32768, -32768, 32767).astype(np.int16)
+    return [samples[i : i + CHUNK_SIZE].tobytes() for i in range(0, len(samples), CHUNK_SIZE)]
+
+
+class SimulatedClient:
+    def __init__(self, index, url, utterances, turns, barge_in, pause_s, turn_timeout, window, seed):
+        self.index = index
+        self.url = url
+        self.utterances = utterances
+        self.turns = turns
+        self.barge_in = barge_in
+        self.pause_s = pause_s
+        self.turn_timeout = turn_timeout
+        self.window = window
+        self.rng = random.Random(seed)
+        # Low noise rather than digital silence, like a real microphone
+        noise = np.random.default_rng(seed).normal(0, 0.001, CHUNK_SIZE).astype(np.float32)
+        self.silence = to_chunks(noise)[0]
+
+        self.sio = socketio.Client(reconnection=False)
+        self.lock = threading.Lock()
+        self.sid = None
+
+        # Microphone
+        self.sent_seq = 0
+        self.acked_seq = 0
+        self.sent_at = {}
+        self.mic_ack_latencies = []
+        self.mic_backlog_max = 0
+
+        # Playback of the audio frames received
+        self.last_frame_seq = 0
+        self.playback_end = 0.0
+        self.frames = 0
+        self.missing_frames = 0
+        self.out_of_order_frames = 0
+        self.underruns = 0
+        self.underrun_s = 0.0
+        self.stopped = False
+
+        # The turn in flight
+        self.state = "pausing"
+        self.speech = []
+        self.next_speech_at = 0.0
+        self.end_of_speech = None
+        self.first_audio = None
+        self.all_sent = False
+        self.barge_in_at = None
+        self.barge_in_started = None
+
+        self.turn_latencies = []
+        self.barge_in_latencies = []
+        self.completed_turns = 0
+        self.barge_ins = 0
+        self.timeouts = 0
+        self.error = None
+
+        self.sio.on("audio_frame", self.on_audio_frame)
+        self.sio.on("audio_ack", self.on_audio_ack)
+        self.sio.on("all_speech_sent", self.on_all_speech_sent)
+        self.sio.on("listening_to_user", self.on_listening_to_user)
+
+    def auth(self):
+        # What static/websocket.js negotiates, without the compressed codecs
+        return {
+            "audio_transport": "binary",
+            "audio_format": "int16",
+            "flow_control": True,
+            "flow_control_window": self.window,
+            "audio_codecs": ["pcm16"],
+        }
+
+    def on_audio_ack(self, data):
+        now = time.monotonic()
+        with self.lock:
+            seq = data.get("seq")
+            if seq is None:
+                return
+            self.acked_seq = max(self.acked_seq, seq)
+            sent = self.sent_at.pop(seq, None)
+            if sent is not None:
+                self.mic_ack_latencies.append(now - sent)
+
+    def on_audio_frame(self, data):
+        now = time.monotonic()
+        with self.lock:
+            seq = data["seq"]
+            if seq <= self.last_frame_seq:
+                self.out_of_order_frames += 1
+                return
+            if self.last_frame_seq and seq > self.last_frame_seq + 1:
+                self.missing_frames += seq - self.last_frame_seq - 1
+            self.last_frame_seq = seq
+            self.frames += 1
+
+            if self.stopped or self.state != "waiting":
+                # Dropped like playback.js does once the user speaks, still acked for the flow control
+                self.ack_frame(seq)
+                return
+
+            if self.first_audio is None:
+                self.first_audio = now
+                self.turn_latencies.append(now - self.end_of_speech)
+                self.playback_end = now
+            elif now > self.playback_end + UNDERRUN_TOLERANCE_S:
+                self.underruns += 1
+                self.underrun_s += now - self.playback_end
+
+            samples = data.get("length") or len(data["samples"]) // (4 if data.get("format") == "float32" else 2)
+            start = max(now, self.playback_end)
+            self.playback_end = start + samples / data["samplerate"]
+
+        # The page acks a frame when it starts playing it
+        threading.Timer(max(start - now, 0.0), self.ack_frame, args=(seq,)).start()
+
+    def ack_frame(self, seq):
+        try:
+            self.sio.emit("audio_frame_ack", {"seq": seq})
+        except Exception:
+            pass
+
+    def on_all_speech_sent(self, data):
+        with self.lock:
+            if self.state == "waiting" and self.first_audio is not None:
+                self.all_sent = True
+
+    def on_listening_to_user(self, data):
+        now = time.monotonic()
+        with self.lock:
+            self.stopped = data.get("listening", False)
+            if self.stopped and self.barge_in_started is not None:
+                self.barge_in_latencies.append(now - self.barge_in_started)
+                self.barge_in_started = None
+
+    def start_speaking(self):
+        self.speech = list(self.rng.choice(self.utterances))
+        self.state = "speaking"
+        self.end_of_speech = self.first_audio = None
+        self.all_sent = False
+        self.barge_in_at = None
+
+    def finish_turn(self, now):
+        self.state = "pausing"
+        self.next_speech_at = now + self.rng.uniform(*self.pause_s)
+
+    def next_chunk(self, now):
+        """Advance the conversation by one chunk and return what the microphone hears."""
+        with self.lock:
+            if self.state == "speaking":
+                chunk = self.speech.pop(0)
+                if not self.speech:
+                    # The chunk is recorded by the time it is sent, the speech ends with it
+                    self.state = "waiting"
+                    self.end_of_speech = now
+                    # The last turn is heard to the end
+                    if self.completed_turns + self.timeouts + 1 < self.turns and self.rng.random() < self.barge_in:
+                        self.barge_in_at = self.rng.uniform(0.2, 1.5)
+                return chunk
+
+            if self.state == "waiting":
+                if self.first_audio is not None and self.barge_in_at is not None:
+                    if now - self.first_audio >= self.barge_in_at and now < self.playback_end:
+                        self.barge_ins += 1
+                        self.completed_turns += 1
+                        self.barge_in_started = now
+                        self.start_speaking()
+                        return self.speech.pop(0)
+                if self.all_sent and now >= self.playback_end:
+                    self.completed_turns += 1
+                    self.finish_turn(now)
+                elif now - self.end_of_speech > self.turn_timeout:
+                    self.timeouts += 1
+                    self.finish_turn(now)
+            elif self.state == "pausing" and now >= self.next_speech_at:
+                if self.completed_turns + self.timeouts < self.turns:
+                    self.start_speaking()
+                    return self.speech.pop(0)
+            return self.silence
+
+    def send(self, chunk, now):
+        with self.lock:
+            self.sent_seq += 1
+            seq = self.sent_seq
+            self.sent_at[seq] = now
+            self.mic_backlog_max = max(self.mic_backlog_max, seq - self.acked_seq)
+        self.sio.emit("audio_data", {"seq": seq, "samples": chunk})
+
+    def done(self):
+        with self.lock:
+            return self.state == "pausing" and self.completed_turns + self.timeouts >= self.turns
+
+    def run(self, deadline):
+        try:
+            self.sio.connect(self.url, auth=self.auth(), wait_timeout=30)
+            self.sid = self.sio.get_sid()
+            started = time.monotonic()
+            self.next_speech_at = started + self.rng.uniform(*self.pause_s)
+            tick = 0
+            while not self.done() and time.monotonic() < deadline:
+                tick += 1
+                # A microphone delivers a chunk once it has been recorded, whether the server keeps up or not
+                delay = started + tick * CHUNK_DURATION - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                now = time.monotonic()
+                self.send(self.next_chunk(now), now)
+        except Exception as e:
+            self.error = str(e)
+
+    def disconnect(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+    def results(self):
+        with self.lock:
+            return {
+                "client": self.index,
+                "sid": self.sid,
+                "error": self.error,
+                "completed_turns": self.completed_turns,
+                "timeouts": self.timeouts,
+                "barge_ins": self.barge_ins,
+                "turn_latency": distribution(self.turn_latencies),
+                "barge_in_latency": distribution(self.barge_in_latencies),
+                "audio_frames": self.frames,
+                "missing_frames": self.missing_frames,
+                "out_of_order_frames": self.out_of_order_frames,
+                "underruns": self.underruns,
+                "underrun_s": self.underrun_s,
+                "mic_chunks_sent": self.sent_seq,
+                "mic_chunks_unacked": len(self.sent_at),
+                "mic_ack_latency": distribution(self.mic_ack_latencies),
+                "mic_backlog_max": self.mic_backlog_max,
+            }
+
+
+def fetch_json(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if fetch_json(url + "/ready").get("ready"):
+                return True
+        except OSError:
+            pass
+        time.sleep(1)
+    return False
+
+
+def launch_server(llm_url):
+    env = dict(os.environ, LLM_BASE_URL=llm_url)
+    # Its own process group, so the reloader of the debug server goes down with it
+    return subprocess.Popen([sys.executable, "app.py"], env=env, start_new_session=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wavs", nargs="*", help="utterances, 16-bit PCM, synthetic speech when none is given")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=3, help="per client")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds between two clients connecting")
+    parser.add_argument("--barge-in", type=float, default=0.2, help="probability to interrupt an answer")
+    parser.add_argument("--pause", type=float, nargs=2, default=(1.0, 3.0), help="silence between turns (s)")
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--window", type=int, default=8, help="flow control window")
+    parser.add_argument("--duration", type=float, default=600.0, help="stop the clients after this long")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--launch", action="store_true", help="start the Ollama stand-in and app.py")
+    parser.add_argument("--llm-port", type=int, default=11435)
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if socketio is None:
+        parser.error('the load test needs python-socketio, pip install "python-socketio[client]"')
+
+    if args.wavs:
+        utterances = [to_chunks(read_wav(path)) for path in args.wavs]
+    else:
+        utterances = [to_chunks(synthetic_speech(seconds=seconds)) for seconds in (1.2, 2.0, 3.0)]
+
+    fake_llm = server = None
+    if args.launch:
+        fake_llm = FakeOllama(port=args.llm_port)
+        server = launch_server(fake_llm.start())
+    try:
+        if not wait_until_ready(args.url, args.ready_timeout):
+            sys.exit(f"{args.url} is not ready")
+
+        clients = [
+            SimulatedClient(
+                i,
+                args.url,
+                utterances,
+                args.turns,
+                args.barge_in,
+                args.pause,
+                args.turn_timeout,
+                args.window,
+                args.seed + i,
+            )
+            for i in range(args.clients)
+        ]
+        deadline = time.monotonic() + args.duration
+        threads = []
+        for client in clients:
+            thread = threading.Thread(target=client.run, args=(deadline,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(args.ramp)
+        for thread in threads:
+            thread.join()
+
+        # The sessions are gone once the clients disconnect
+        sessions = fetch_json(args.url + "/stats").get("sessions", {})
+        for client in clients:
+            client.disconnect()
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+        if fake_llm is not None:
+            fake_llm.stop()
+
+    per_client = [client.results() for client in clients]
+    for result in per_client:
+        result["audio_queue"] = sessions.get(result["sid"], {}).get("audio_queue")
+
+    turn_latencies = [latency for client in clients for latency in client.turn_latencies]
+    barge_in_latencies = [latency for client in clients for latency in client.barge_in_latencies]
+    queue_lags = [result["audio_queue"]["lag_max_s"] for result in per_client if result["audio_queue"]]
+    summary = {
+        "clients": args.clients,
+        "errors": sum(result["error"] is not None for result in per_client),
+        "completed_turns": sum(result["completed_turns"] for result in per_client),
+        "timeouts": sum(result["timeouts"] for result in per_client),
+        "barge_ins": sum(result["barge_ins"] for result in per_client),
+        "turn_latency": distribution(turn_latencies),
+        "barge_in_latency": distribution(barge_in_latencies),
+        "missing_frames": sum(result["missing_frames"] for result in per_client),
+        "out_of_order_frames": sum(result["out_of_order_frames"] for result in per_client),
+        "underruns": sum(result["underruns"] for result in per_client),
+        "underrun_s": sum(result["underrun_s"] for result in per_client),
+        "audio_queue_lag_max_s": max(queue_lags, default=None),
+    }
+    print(json.dumps(summary, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "summary": summary, "clients": per_client}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Replays recorded user turns through the whole STT -> LLM -> TTS pipeline, headless, and reports the latency of
+every stage, the real-time factors, the time from the end of speech to the first audio and the peak memory.
+
+Every WAV file is one user turn. It is streamed in chunks of utils.CHUNK_SIZE at real-time pace (--speed) into a
+session built by SessionManager like the server does, followed by --tail-silence seconds of silence so the turn
+is endpointed. Socket.IO is replaced by a recorder of the emitted events, the LLM by benchmarks.fakeOllama unless
+--llm-url is given and, with --stub-models, the models by benchmarks.stubModels.
+
+    python -m benchmarks.replayBenchmark --stub-models --output replay.json
+    python -m benchmarks.replayBenchmark turns/*.wav --output replay.json
+
+Without WAV files, --synthetic turns of synthetic speech are replayed. Compare the JSON of two commits to spot
+regressions.
+"""
+
+import argparse
+import inspect
+import json
+import resource
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from benchmarks.fakeOllama import FakeOllama
+from sessionManager import SessionManager
+from speech_to_text.speechRecognizer import internal_pause_silence_ms
+from startup import synthetic_speech
+from text_to_speech.textSegmenter import TextSegmenter
+from utils import audio_rms, read_wav, CHUNK_DURATION, CHUNK_SIZE, SAMPLE_RATE
+
+AUDIO_EVENTS = ("audio_stream", "audio_frame")
+
+
+class StageTimings:
+    """Durations of the model calls, by stage, shared by every fork of the timed models."""
+
+    def __init__(self):
+        self.durations = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, duration):
+        with self.lock:
+            self.durations.setdefault(stage, []).append(duration)
+
+    def total(self, *stages):
+        with self.lock:
+            return sum(sum(self.durations.get(stage, [])) for stage in stages)
+
+    def summary(self):
+        with self.lock:
+            durations = {stage: list(values) for stage, values in self.durations.items()}
+        return {stage: distribution(values) for stage, values in durations.items()}
+
+
+class TimedModel:
+    """Forwards to the model and records the duration of the methods mapped to a stage."""
+
+    def __init__(self, model, stages, timings: StageTimings):
+        self.model = model
+        self.stages = stages
+        self.timings = timings
+
+    def fork(self):
+        return TimedModel(self.model.fork(), self.stages, self.timings)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.model, name)
+        stage = self.stages.get(name)
+        if stage is None:
+            return attribute
+
+        if inspect.isasyncgenfunction(attribute):
+            # Streaming synthesis, the time to the first chunk is what delays the audio
+            async def timed_stream(*args, **kwargs):
+                start = time.perf_counter()
+                first = True
+                async for chunk in attribute(*args, **kwargs):
+                    if first:
+                        self.timings.record(stage, time.perf_counter() - start)
+                        first = False
+                    yield chunk
+
+            return timed_stream
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                self.timings.record(stage, time.perf_counter() - start)
+
+        return timed
+
+
+class RecordingSocketIO:
+    """Stands in for Flask-SocketIO, keeps the time of every emitted event (without the audio payloads)."""
+
+    def __init__(self):
+        self.events = []
+        self.audio_s = 0.0
+        self.condition = threading.Condition()
+
+    def emit(self, event, data, **kwargs):
+        with self.condition:
+            self.events.append((time.perf_counter(), event, None if event in AUDIO_EVENTS else data))
+            if event in AUDIO_EVENTS:
+                self.audio_s += audio_seconds(event, data)
+            self.condition.notify_all()
+
+    def first(self, event, after, events=None):
+        """Time of the first of the events emitted after the given time, None if there is none."""
+        names = events or (event,)
+        with self.condition:
+            return next((t for t, name, _ in self.events if t >= after and name in names), None)
+
+    def wait_for(self, event, after, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.first(event, after) is not None, timeout)
+        return self.first(event, after)
+
+    def count(self, events, after, before=None):
+        with self.condition:
+            return sum(
+                1 for t, name, _ in self.events if t >= after and (before is None or t <= before) and name in events
+            )
+
+
+def audio_seconds(event, data):
+    if "length" in data:
+        samples = data["length"]
+    elif event == "audio_stream":
+        samples = len(data["samples"]) * 3 // 4 // 2
+    else:
+        samples = len(data["samples"]) // (4 if data.get("format") == "float32" else 2)
+    return samples / data["samplerate"]
+
+
+def distribution(values):
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values)
+    return {
+        "count": len(values),
+        "mean_s": float(values.mean()),
+        "p50_s": float(np.percentile(values, 50)),
+        "p95_s": float(np.percentile(values, 95)),
+        "max_s": float(values.max()),
+    }
+
+
+def load_models(stub, pause_silence_ms):
+    if stub:
+        from benchmarks.stubModels import StubVAD, StubTranscription, StubSpeakerVerification, StubTTS
+
+        return StubVAD(), StubTranscription(), StubSpeakerVerification(), StubTTS()
+
+    from speech_to_text.funASR import FunASRStreamingVAD, FunASRUnifiedTranscription, FunASRSpeakerVerification
+    from text_to_speech.kokoroModel import kokoroModel
+
+    models = (
+        FunASRStreamingVAD(model_name="fsmn-vad", max_end_silence_time=pause_silence_ms),
+        FunASRUnifiedTranscription(model_name="FunAudioLLM/SenseVoiceSmall"),
+        FunASRSpeakerVerification(model_name="iic/speech_campplus_sv_zh-cn_16k-common"),
+        kokoroModel("kokoro/kokoro-v1.0.onnx", "kokoro/voices-v1.0.bin"),
+    )
+    warm_up_audio = synthetic_speech()
+    for model in models[:3]:
+        model.warm_up(warm_up_audio)
+    models[3].warm_up()
+    return models
+
+
+def replay_turn(assistant, socketio, audio, tail_silence_s, speed, speech_threshold, timeout):
+    """Stream one turn into the session and return its latencies."""
+    silence = np.zeros(int(tail_silence_s * SAMPLE_RATE), dtype=np.float32)
+    stream = np.concatenate([audio, silence])
+    chunks = np.array_split(stream, range(CHUNK_SIZE, len(stream), CHUNK_SIZE))
+
+    started = time.perf_counter()
+    end_of_speech = None
+    for i, chunk in enumerate(chunks):
+        if speed > 0:
+            # A microphone hands over a chunk once it has been recorded
+            delay = started + (i + 1) * CHUNK_DURATION / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        assistant.audio_queue.put(chunk)
+        if audio_rms(chunk) >= speech_threshold:
+            end_of_speech = time.perf_counter()
+
+    done = socketio.wait_for("all_speech_sent", started, timeout)
+    assistant.speech_generator.idle_event.wait(timeout)
+
+    llm_started = socketio.first("llm_started", started)
+    first_token = socketio.first("llm_answer", started)
+    first_audio = socketio.first(None, started, AUDIO_EVENTS)
+
+    def elapsed(end, start):
+        return end - start if end is not None and start is not None else None
+
+    return {
+        "audio_s": len(audio) / SAMPLE_RATE,
+        "completed": done is not None,
+        "llm_ttft_s": elapsed(first_token, llm_started),
+        "tts_first_chunk_s": elapsed(first_audio, first_token),
+        "end_of_speech_to_llm_s": elapsed(llm_started, end_of_speech),
+        "end_of_speech_to_first_audio_s": elapsed(first_audio, end_of_speech),
+        "audio_chunks_sent": socketio.count(AUDIO_EVENTS, started, done),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wavs", nargs="*", help="one user turn per file, 16-bit PCM")
+    parser.add_argument("--synthetic", type=int, default=3, help="synthetic turns to replay when no WAV is given")
+    parser.add_argument("--stub-models", action="store_true")
+    parser.add_argument("--llm-url", help="an Ollama server, the fake one is started otherwise")
+    parser.add_argument("--llm-model", default="wizardlm2:7b")
+    parser.add_argument("--fake-ttft", type=float, default=0.3)
+    parser.add_argument("--fake-token-interval", type=float, default=0.03)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 0 feeds the chunks at once")
+    parser.add_argument("--tail-silence", type=float, default=2.0)
+    parser.add_argument("--speech-threshold", type=float, default=0.02, help="RMS above which a chunk is speech")
+    parser.add_argument("--endpoint-silence-ms", type=int, default=500)
+    parser.add_argument("--idle-silence-ms", type=int, default=1000)
+    parser.add_argument("--pause-silence-ms", type=int, help="derived from the endpoint and the chunk length if unset")
+    parser.add_argument("--tts-workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=60.0, help="per turn")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.wavs:
+        turns = [(path, read_wav(path)) for path in args.wavs]
+    else:
+        turns = [(f"synthetic-{i}", synthetic_speech(seconds=2.0)) for i in range(args.synthetic)]
+
+    fake_llm = None
+    llm_url = args.llm_url
+    if llm_url is None:
+        fake_llm = FakeOllama(ttft_s=args.fake_ttft, token_interval_s=args.fake_token_interval)
+        llm_url = fake_llm.start()
+
+    if args.pause_silence_ms is None:
+        args.pause_silence_ms = internal_pause_silence_ms(args.endpoint_silence_ms, CHUNK_DURATION * 1000)
+
+    load_start = time.perf_counter()
+    vad, asr, sv, tts = load_models(args.stub_models, args.pause_silence_ms)
+    load_s = time.perf_counter() - load_start
+
+    timings = StageTimings()
+    socketio = RecordingSocketIO()
+    tts_executor = ThreadPoolExecutor(max_workers=args.tts_workers) if args.tts_workers else None
+    session_manager = SessionManager(
+        vad_model=TimedModel(vad, {"detect": "vad"}, timings),
+        unified_model=TimedModel(
+            asr, {"online_transcribe": "online_asr", "offline_transcribe": "offline_asr"}, timings
+        ),
+        sv_model=TimedModel(sv, {"verify": "speaker_verification"}, timings),
+        tts_model=TimedModel(tts, {"synthesize": "tts_stream_first_chunk", "synthesize_full": "tts"}, timings),
+        llm_model=args.llm_model,
+        socketio=socketio,
+        endpoint_silence_ms=args.endpoint_silence_ms,
+        idle_silence_ms=args.idle_silence_ms,
+        pause_silence_ms=args.pause_silence_ms,
+        speculative_llm=True,
+        tts_executor=tts_executor,
+        segmenter_factory=TextSegmenter,
+        llm_base_url=llm_url,
+    )
+    assistant = session_manager.create_session("replay")
+
+    replay_start = time.perf_counter()
+    results = []
+    for name, audio in turns:
+        turn = replay_turn(
+            assistant, socketio, audio, args.tail_silence, args.speed, args.speech_threshold, args.timeout
+        )
+        turn["turn"] = name
+        results.append(turn)
+        print(
+            f"{name}: end of speech to first audio {turn['end_of_speech_to_first_audio_s']}, "
+            f"LLM TTFT {turn['llm_ttft_s']}, completed {turn['completed']}"
+        )
+    replay_s = time.perf_counter() - replay_start
+
+    session_manager.close_session("replay")
+    if fake_llm is not None:
+        fake_llm.stop()
+
+    fed_s = sum(len(audio) / SAMPLE_RATE + args.tail_silence for _, audio in turns)
+    stt_s = timings.total("vad", "speaker_verification", "online_asr", "offline_asr")
+    output = {
+        "commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("wavs", "output")},
+        "turns": results,
+        "summary": {
+            key: distribution([turn[key] for turn in results if turn[key] is not None])
+            for key in ("llm_ttft_s", "tts_first_chunk_s", "end_of_speech_to_llm_s", "end_of_speech_to_first_audio_s")
+        },
+        "stages": timings.summary(),
+        "real_time_factor": {
+            # Compute time over the duration of the audio streamed in, below 1 keeps up with the microphone
+            "stt": stt_s / fed_s if fed_s else None,
+            # Only measured when the segments are synthesized whole on the TTS workers
+            "tts": timings.total("tts") / socketio.audio_s if socketio.audio_s and args.tts_workers else None,
+            "replay": replay_s / fed_s if fed_s and args.speed > 0 else None,
+        },
+        "completed_turns": sum(turn["completed"] for turn in results),
+        "model_load_s": load_s,
+        # Kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if fake_llm is not None:
+        output["fake_llm"] = fake_llm.stats()
+
+    print(json.dumps({"summary": output["summary"], "real_time_factor": output["real_time_factor"]}, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Time to first audio and total synthesis time of LLM token streams, cut into TTS segments by the fixed 50
+character threshold the assistant used to use and by the latency-aware TextSegmenter.
+
+Every segment is synthesized with Kokoro once to measure it, then the answer is replayed on the token timing
+of the stream: a segment is synthesized once it is cut, on --workers threads, and played in order. Stalls are
+the time playback waits for the next segment after the first audio.
+
+The bundled tokenStreams.json holds sample answers at a typical 7B model token rate, record real ones with
+    ollama serve
+    python -m benchmarks.segmenterBenchmark --record --model wizardlm2:7b
+    python -m benchmarks.segmenterBenchmark --output segmenter.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from text_to_speech.textSegmenter import ThresholdSegmenter, TextSegmenter
+from utils import preprocess_before_generation
+
+STREAMS_PATH = os.path.join(os.path.dirname(__file__), "tokenStreams.json")
+
+PROMPTS = [
+    "How should I start learning the piano?",
+    "How long is the average commute in St. Louis compared to the rest of the U.S.?",
+    "How do I connect my phone to Wi-Fi? Give me the steps.",
+    "Can you explain what a chord is and how major and minor chords differ?",
+    "When did Tolkien write The Hobbit?",
+]
+
+
+def write_streams(path, model, streams):
+    # One stream per line keeps the file readable
+    lines = ",\n".join("  " + json.dumps(stream, ensure_ascii=False) for stream in streams)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'{{\n "model": {json.dumps(model)},\n "streams": [\n{lines}\n ]\n}}\n')
+
+
+def record(model, path):
+    from langchain_ollama import ChatOllama
+    from langchain_core.messages import SystemMessage, HumanMessage
+    from llm import AnswerGenerator
+
+    llm = ChatOllama(model=model)
+    streams = []
+    for prompt in PROMPTS:
+        tokens = []
+        last = time.perf_counter()
+        for chunk in llm.stream([SystemMessage(content=AnswerGenerator.INSTRUCTION), HumanMessage(content=prompt)]):
+            if chunk.content:
+                now = time.perf_counter()
+                tokens.append([round(now - last, 4), chunk.content])
+                last = now
+        streams.append({"text": "".join(token for _, token in tokens), "tokens": tokens})
+        print(f"recorded {len(tokens)} tokens for: {prompt}")
+    write_streams(path, model, streams)
+
+
+def segment_stream(segmenter, tokens):
+    """Return [(time the segment is cut, text)] for a token stream."""
+    segmenter.reset()
+    segments = []
+    now = 0.0
+    for delay, token in tokens:
+        now += delay
+        segments += [(now, segment) for segment in segmenter.push(token)]
+    segments += [(now, segment) for segment in segmenter.flush()]
+    return segments
+
+
+def replay(segments, synthesize, workers):
+    """Schedule the synthesis of the segments on the workers and play them back in order."""
+    free_at = [0.0] * workers
+    playback_end = None
+    first_audio = None
+    stalls = 0.0
+    synthesis_time = 0.0
+
+    for ready, text in segments:
+        synthesis_s, audio_s = synthesize(preprocess_before_generation(text))
+        synthesis_time += synthesis_s
+
+        worker = min(range(workers), key=free_at.__getitem__)
+        done = max(ready, free_at[worker]) + synthesis_s
+        free_at[worker] = done
+
+        if playback_end is None:
+            first_audio = done
+            playback_end = done + audio_s
+        else:
+            stalls += max(done - playback_end, 0.0)
+            playback_end = max(done, playback_end) + audio_s
+
+    return {
+        "segments": len(segments),
+        "time_to_first_audio_s": first_audio,
+        "synthesis_time_s": synthesis_time,
+        "playback_end_s": playback_end,
+        "stalls_s": stalls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", default=STREAMS_PATH)
+    parser.add_argument("--record", action="store_true", help="record new token streams from Ollama and exit")
+    parser.add_argument("--model", default="wizardlm2:7b")
+    parser.add_argument("--kokoro-model", default="kokoro/kokoro-v1.0.onnx")
+    parser.add_argument("--kokoro-voices", default="kokoro/voices-v1.0.bin")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.model, args.streams)
+        return
+
+    from text_to_speech.kokoroModel import kokoroModel
+
+    tts = kokoroModel(args.kokoro_model, args.kokoro_voices)
+    tts.synthesize_full("Warm up.")
+    measured = {}
+
+    def synthesize(text):
+        # Each distinct segment is synthesized once, both segmenters often cut the same sentences
+        if text not in measured:
+            start = time.perf_counter()
+            samples, sample_rate = tts.synthesize_full(text)
+            measured[text] = (time.perf_counter() - start, len(samples) / sample_rate)
+        return measured[text]
+
+    with open(args.streams, encoding="utf-8") as f:
+        streams = json.load(f)["streams"]
+
+    segmenters = {"threshold": ThresholdSegmenter(50), "latency_aware": TextSegmenter()}
+    results = {"workers": args.workers, "streams": len(streams)}
+    for name, segmenter in segmenters.items():
+        runs = [replay(segment_stream(segmenter, stream["tokens"]), synthesize, args.workers) for stream in streams]
+        results[name] = {
+            key: statistics.mean(run[key] for run in runs)
+            for key in ("segments", "time_to_first_audio_s", "synthesis_time_s", "playback_end_s", "stalls_s")
+        }
+        results[name]["per_stream"] = runs
+        print(
+            f"{name}: time to first audio {results[name]['time_to_first_audio_s']:.3f}s, "
+            f"synthesis {results[name]['synthesis_time_s']:.3f}s, stalls {results[name]['stalls_s']:.3f}s, "
+            f"{results[name]['segments']:.1f} segments"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Cheap stand-ins for the VAD, ASR, speaker verification and TTS models, to benchmark the pipeline around them
+(queues, threads, segmentation, transport) without loading anything. Speech is anything louder than a threshold.
+"""
+
+import asyncio
+import time
+import numpy as np
+from speech_to_text.asrInterface import IVADModel, IUnifiedTranscriptionModel, IVerificationModel
+from text_to_speech.ttsInterface import ITTSModel
+from utils import audio_rms, SAMPLE_RATE
+
+
+class StubVAD(IVADModel):
+    """Energy threshold VAD that measures the trailing silence like the streaming VAD, one state per session."""
+
+    def __init__(self, threshold=0.02, rate=SAMPLE_RATE):
+        self.threshold = threshold
+        self.rate = rate
+        self.silence_ms = 0.0
+
+    def detect(self, audio_data):
+        speech = audio_rms(audio_data) >= self.threshold
+        self.silence_ms = 0.0 if speech else self.silence_ms + 1000 * len(audio_data) / self.rate
+        return speech
+
+    def trailing_silence_ms(self):
+        return self.silence_ms
+
+    def fork(self):
+        return StubVAD(self.threshold, self.rate)
+
+
+class StubTranscription(IUnifiedTranscriptionModel):
+    """One word per online chunk, the offline pass returns a fixed question so answers are reproducible."""
+
+    def __init__(self, text="How should I start learning the piano?", compute_s=0.0):
+        self.text = text
+        self.compute_s = compute_s
+        self.language = "auto"
+
+    def online_transcribe(self, audio_data):
+        time.sleep(self.compute_s)
+        return "word "
+
+    def online_transcribe_batch(self, audio_list, language="auto"):
+        # What BatchedUnifiedTranscription calls, a batch costs as much as one chunk
+        time.sleep(self.compute_s)
+        return ["word "] * len(audio_list)
+
+    def offline_transcribe(self, audio_data):
+        time.sleep(self.compute_s)
+        return self.text
+
+    def set_language(self, language):
+        self.language = language
+
+    def fork(self):
+        return StubTranscription(self.text, self.compute_s)
+
+
+class StubSpeakerVerification(IVerificationModel):
+    def verify(self, audio_data, reference_audio=None, threshold=None):
+        return True
+
+
+class StubTTS(ITTSModel):
+    """A tone as long as the text would take to say, computed in real_time_factor of its duration."""
+
+    def __init__(self, sample_rate=24000, chars_per_second=15.0, real_time_factor=0.05):
+        self.sample_rate = sample_rate
+        self.chars_per_second = chars_per_second
+        self.real_time_factor = real_time_factor
+        self.voice = "stub"
+        self.speed = 1.0
+        self.language = "en-us"
+
+    def tone(self, text):
+        duration = max(len(text), 1) / self.chars_per_second
+        t = np.arange(int(duration * self.sample_rate)) / self.sample_rate
+        return (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32), duration
+
+    async def synthesize(self, text):
+        samples, duration = self.tone(text)
+        await asyncio.sleep(duration * self.real_time_factor)
+        yield samples, self.sample_rate
+
+    def synthesize_full(self, text):
+        samples, duration = self.tone(text)
+        time.sleep(duration * self.real_time_factor)
+        return samples, self.sample_rate
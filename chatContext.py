@@ -0,0 +1,118 @@
+import threading
+from langchain_core.messages import SystemMessage, HumanMessage
+
+
+class ChatContext:
+    """
+    Chat history sent to the LLM, kept under a token budget.
+
+    The prompt is [instruction, summary of the older turns (once there is one), recent turns...]. The instruction
+    lives in a single system message and turns are only ever appended, so the prompt prefix stays byte-identical
+    between turns and the server can reuse its prefix cache. When the history grows past summarize_ratio of the
+    budget, the older turns are folded into a rolling summary in the background, in one block, so the prefix
+    only changes when a fold lands. If the budget is exceeded before that, the oldest turns are dropped.
+    """
+
+    def __init__(
+        self,
+        llm,
+        instruction,
+        token_budget=2048,
+        summarize_ratio=0.75,
+        keep_recent_messages=4,
+    ):
+        self.llm = llm
+        self.system_message = SystemMessage(content=instruction)
+        self.token_budget = token_budget
+        self.summarize_ratio = summarize_ratio
+        self.keep_recent_messages = keep_recent_messages
+
+        self.summary_message = None
+        self.turns = []
+        self.lock = threading.Lock()
+        self.summarizing = False
+        self.dropped_messages = 0
+        self.summaries = 0
+
+    @staticmethod
+    def count_tokens(text):
+        # Rough estimate for English text, the server's tokenizer is not available here
+        return len(text) // 4 + 1
+
+    def prefix(self):
+        return [self.system_message] + ([self.summary_message] if self.summary_message is not None else [])
+
+    def messages(self, pending_message=None):
+        """The messages to send, optionally with a message that is not part of the history yet."""
+        with self.lock:
+            messages = self.prefix() + self.turns
+        return messages + ([pending_message] if pending_message is not None else [])
+
+    def token_count(self):
+        return sum(self.count_tokens(message.content) for message in self.prefix() + self.turns)
+
+    def add_message(self, message):
+        with self.lock:
+            self.turns.append(message)
+
+            # Hard limit, only reached when the summary could not keep up
+            while self.token_count() > self.token_budget and len(self.turns) > self.keep_recent_messages:
+                self.turns.pop(0)
+                self.dropped_messages += 1
+                while self.turns and not isinstance(self.turns[0], HumanMessage):
+                    self.turns.pop(0)
+                    self.dropped_messages += 1
+
+            if (
+                self.summarizing
+                or self.token_count() <= self.token_budget * self.summarize_ratio
+                or len(self.turns) <= self.keep_recent_messages
+            ):
+                return
+
+            # Fold whole exchanges, the kept part starts with a user message
+            fold = len(self.turns) - self.keep_recent_messages
+            while fold > 0 and not isinstance(self.turns[fold], HumanMessage):
+                fold -= 1
+            if fold == 0:
+                return
+
+            self.summarizing = True
+            folded = self.turns[:fold]
+            summary = self.summary_message.content if self.summary_message is not None else ""
+
+        threading.Thread(target=self.summarize, args=(folded, summary), daemon=True).start()
+
+    def summarize(self, folded, summary):
+        transcript = "\n".join(f"{message.type}: {message.content}" for message in folded)
+        prompt = (
+            "Update the summary of a conversation between a user and a voice assistant with the new messages. "
+            "Keep the facts, names and open questions, at most a few sentences.\n\n"
+            f"Current summary: {summary or '(none)'}\n\nNew messages:\n{transcript}\n\nUpdated summary:"
+        )
+
+        try:
+            new_summary = self.llm.invoke([HumanMessage(content=prompt)]).content.strip()
+        except Exception as e:
+            print(f"Summarizing the chat history failed: {e}")
+            with self.lock:
+                self.summarizing = False
+            return
+
+        with self.lock:
+            # Some of the folded turns may have been dropped by the hard limit in the meantime
+            while self.turns and any(self.turns[0] is message for message in folded):
+                self.turns.pop(0)
+            self.summary_message = SystemMessage(content=f"Summary of the earlier conversation: {new_summary}")
+            self.summaries += 1
+            self.summarizing = False
+
+    def stats(self):
+        with self.lock:
+            return {
+                "messages": len(self.turns),
+                "tokens": self.token_count(),
+                "token_budget": self.token_budget,
+                "summaries": self.summaries,
+                "dropped_messages": self.dropped_messages,
+            }
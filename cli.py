@@ -0,0 +1,382 @@
+"""
+Runs the assistant without the web stack: no Socket.IO, no browser, no audio encoding on the way.
+
+    python cli.py local                                    # microphone in, speakers out
+    python cli.py local --source turn.wav --sink wav:answer.wav
+    python cli.py local --source /tmp/mic.fifo             # raw 16 kHz mono int16, e.g.
+                                                           # arecord -f S16_LE -r 16000 -c 1 > /tmp/mic.fifo
+    python cli.py batch recordings/ --output answers.jsonl
+
+local drives one VoiceAssistant session from utils.record_audio, a WAV file or a raw PCM stream (a FIFO) and plays
+the answers on the speakers (or writes them to a WAV). Without echo cancellation, use a headset: the assistant
+hears itself otherwise. Transcriptions and answers are printed as JSON lines.
+
+batch transcribes every WAV file of a directory with the bulk offline transcription, as fast as the hardware
+allows, and answers each one on its own. One JSON line per file, the throughput goes to stderr.
+"""
+
+import argparse
+import glob
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain_ollama import ChatOllama
+from langchain_core.messages import SystemMessage, HumanMessage
+from audioTransport import AudioTransport
+from llm import AnswerGenerator
+from sessionManager import SessionManager
+from speech_to_text.speechRecognizer import internal_pause_silence_ms
+from startup import StartupOrchestrator, synthetic_speech
+from text_to_speech.textSegmenter import TextSegmenter
+from utils import preprocess_before_generation, read_wav, record_audio, write_wav, CHUNK_DURATION, CHUNK_SIZE
+
+ENDPOINT_SILENCE_MS = 500
+IDLE_SILENCE_MS = 1000
+PAUSE_SILENCE_MS = internal_pause_silence_ms(ENDPOINT_SILENCE_MS, CHUNK_DURATION * 1000)
+
+
+def load_models(names, warm_up=True):
+    """Load the named models concurrently, like the server does."""
+    from speech_to_text.funASR import FunASRStreamingVAD, FunASRUnifiedTranscription, FunASRSpeakerVerification
+    from text_to_speech.kokoroModel import kokoroModel
+
+    warm_up_audio = synthetic_speech()
+    loaders = {
+        "vad": (
+            lambda: FunASRStreamingVAD(model_name="fsmn-vad", max_end_silence_time=PAUSE_SILENCE_MS),
+            lambda model: model.warm_up(warm_up_audio),
+        ),
+        "asr": (
+            lambda: FunASRUnifiedTranscription(model_name="FunAudioLLM/SenseVoiceSmall"),
+            lambda model: model.warm_up(warm_up_audio),
+        ),
+        "speaker_verification": (
+            lambda: FunASRSpeakerVerification(model_name="iic/speech_campplus_sv_zh-cn_16k-common"),
+            lambda model: model.warm_up(warm_up_audio),
+        ),
+        "tts": (
+            lambda: kokoroModel("kokoro/kokoro-v1.0.onnx", "kokoro/voices-v1.0.bin"),
+            lambda model: model.warm_up(),
+        ),
+    }
+
+    startup = StartupOrchestrator(max_workers=len(names))
+    for name in names:
+        load, warm = loaders[name]
+        startup.add(name, load, warm if warm_up else None)
+    startup.run()
+    if startup.errors:
+        sys.exit(f"Loading the models failed: {startup.errors}")
+    return startup.models
+
+
+def print_json(record):
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+
+
+class PyAudioSink:
+    """Plays the answers on the default output device, dropping what is queued when the user barges in."""
+
+    # Written in pieces so a barge-in stops the audio within one of them
+    piece_s = 0.1
+
+    def __init__(self):
+        import pyaudio
+
+        self.pyaudio = pyaudio
+        self.audio = pyaudio.PyAudio()
+        self.stream = None
+        self.sample_rate = None
+        self.queue = queue.Queue()
+        self.generation = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def play(self, samples, sample_rate):
+        self.queue.put((self.generation, samples, sample_rate))
+
+    def stop(self):
+        self.generation += 1
+
+    def run(self):
+        while True:
+            generation, samples, sample_rate = self.queue.get()
+            if sample_rate != self.sample_rate:
+                if self.stream is not None:
+                    self.stream.close()
+                self.stream = self.audio.open(format=self.pyaudio.paFloat32, channels=1, rate=sample_rate, output=True)
+                self.sample_rate = sample_rate
+
+            piece = int(self.piece_s * sample_rate)
+            for start in range(0, len(samples), piece):
+                if generation != self.generation:
+                    break
+                self.stream.write(samples[start : start + piece].tobytes())
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+        self.audio.terminate()
+
+
+class WavSink:
+    """Writes the answers to a WAV file instead of playing them, e.g. to test a kiosk box without speakers."""
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = []
+        self.sample_rate = None
+
+    def play(self, samples, sample_rate):
+        self.sample_rate = sample_rate
+        self.chunks.append(samples)
+
+    def stop(self):
+        pass
+
+    def close(self):
+        if self.chunks:
+            write_wav(self.path, np.concatenate(self.chunks), self.sample_rate)
+
+
+class NullSink:
+    def play(self, samples, sample_rate):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def create_sink(spec):
+    if spec == "speakers":
+        return PyAudioSink()
+    if spec.startswith("wav:"):
+        return WavSink(spec[len("wav:") :])
+    if spec == "none":
+        return NullSink()
+    raise ValueError(f"Unknown sink {spec!r}, expected speakers, wav:<path> or none")
+
+
+class LocalEvents:
+    """Takes the place of Socket.IO: the audio goes to the sink, the transcriptions and answers to stdout."""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.started = time.monotonic()
+        self.answer = []
+        # Set while no turn is in progress: cleared when the user starts speaking, set once the answer is sent or
+        # when the turn turns out to have nothing to answer
+        self.speech_sent = threading.Event()
+        self.speech_sent.set()
+        # Offline transcription of the turn so far
+        self.turn_text = ""
+
+    def emit(self, event, data, **kwargs):
+        if event == "audio_frame":
+            self.sink.play(np.frombuffer(data["samples"], dtype=np.float32), data["samplerate"])
+        elif event == "listening_to_user" and data["listening"]:
+            # A new turn, possibly over the answer
+            self.speech_sent.clear()
+            self.sink.stop()
+        elif event == "llm_started":
+            self.speech_sent.clear()
+            self.turn_text = ""
+        elif event == "offline_transcription":
+            self.turn_text += data["message"]
+            if data["message"]:
+                self.print_event("transcription", data["message"])
+            elif not self.turn_text.strip():
+                # Noise taken for speech, no answer follows unless the user speaks again
+                self.speech_sent.set()
+        elif event == "llm_answer":
+            self.answer.append(data["message"])
+        elif event == "llm_stopped":
+            self.print_event("answer", "".join(self.answer))
+            self.answer = []
+        elif event == "all_speech_sent":
+            self.speech_sent.set()
+
+    def print_event(self, event, text):
+        print_json({"t": round(time.monotonic() - self.started, 3), "event": event, "text": text})
+
+    def wait_for_last_answer(self, audio_queue, timeout):
+        """Once the source is exhausted, wait for the chunks still queued and the answer to the last turn."""
+        deadline = time.monotonic() + timeout
+        while audio_queue.qsize() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.speech_sent.wait(max(deadline - time.monotonic(), 0))
+
+
+def stream_file(path, audio_queue, speed, tail_silence_s):
+    """Feed a WAV file at real-time pace (times speed), then silence so its last turn is endpointed."""
+    audio = np.concatenate([read_wav(path), np.zeros(int(tail_silence_s / CHUNK_DURATION) * CHUNK_SIZE, np.float32)])
+    started = time.monotonic()
+    for i, start in enumerate(range(0, len(audio), CHUNK_SIZE)):
+        delay = started + (i + 1) * CHUNK_DURATION / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        audio_queue.put(audio[start : start + CHUNK_SIZE])
+
+
+def stream_raw(path, audio_queue):
+    """Feed raw 16 kHz mono int16 from a FIFO (or file) as it is written, until its writer closes it."""
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(CHUNK_SIZE * 2)
+            if len(data) < 2:
+                return
+            audio_queue.put(np.frombuffer(data[: len(data) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768.0)
+
+
+def run_local(args):
+    sink = create_sink(args.sink or ("speakers" if args.source == "mic" else "none"))
+    models = load_models(["vad", "asr", "speaker_verification", "tts"], warm_up=not args.no_warm_up)
+
+    events = LocalEvents(sink)
+    session_manager = SessionManager(
+        vad_model=models["vad"],
+        unified_model=models["asr"],
+        sv_model=models["speaker_verification"],
+        tts_model=models["tts"],
+        llm_model=args.llm_model,
+        socketio=events,
+        endpoint_silence_ms=ENDPOINT_SILENCE_MS,
+        idle_silence_ms=IDLE_SILENCE_MS,
+        pause_silence_ms=PAUSE_SILENCE_MS,
+        speculative_llm=True,
+        tts_executor=ThreadPoolExecutor(max_workers=2, thread_name_prefix="tts"),
+        segmenter_factory=TextSegmenter,
+        llm_base_url=args.llm_url,
+    )
+    # Raw float32 frames, nothing to encode or decode locally
+    transport = AudioTransport(binary=True, sample_format="float32")
+    # The local operator names themselves
+    assistant = session_manager.create_session("local", user=args.user, transport=transport, user_authenticated=True)
+
+    try:
+        if args.source == "mic":
+            print("Listening, Ctrl+C to stop", file=sys.stderr)
+            record_audio(assistant.audio_queue)
+        elif args.source.endswith(".wav"):
+            stream_file(args.source, assistant.audio_queue, args.speed, args.tail_silence)
+            events.wait_for_last_answer(assistant.audio_queue, args.timeout)
+        else:
+            stream_raw(args.source, assistant.audio_queue)
+            events.wait_for_last_answer(assistant.audio_queue, args.timeout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session_manager.close_session("local")
+        sink.close()
+
+
+def answer(llm, text):
+    return llm.invoke([SystemMessage(content=AnswerGenerator.INSTRUCTION), HumanMessage(content=text)]).content
+
+
+def run_batch(args):
+    paths = sorted(glob.glob(os.path.join(args.directory, "**", "*.wav"), recursive=True))
+    if not paths:
+        sys.exit(f"No WAV files in {args.directory}")
+
+    names = ["asr"] + (["tts"] if args.synthesize else [])
+    models = load_models(names, warm_up=not args.no_warm_up)
+    asr, tts = models["asr"], models.get("tts")
+    llm = None if args.no_answer else ChatOllama(model=args.llm_model, base_url=args.llm_url)
+    if args.synthesize:
+        os.makedirs(args.synthesize, exist_ok=True)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.io_workers) as io_pool:
+        audio = dict(zip(paths, io_pool.map(read_wav, paths)))
+    load_s = time.perf_counter() - started
+
+    def answer_file(path, text):
+        record = {"file": path, "duration_s": len(audio[path]) / 16000, "transcription": text}
+        if llm is not None and text.strip():
+            start = time.perf_counter()
+            record["answer"] = answer(llm, text)
+            record["answer_s"] = time.perf_counter() - start
+            if tts is not None:
+                samples, sample_rate = tts.synthesize_full(preprocess_before_generation(record["answer"]))
+                name = os.path.splitext(os.path.relpath(path, args.directory))[0].replace(os.sep, "_")
+                record["audio"] = os.path.join(args.synthesize, name + ".wav")
+                write_wav(record["audio"], samples, sample_rate)
+        return record
+
+    # Similar durations in a batch keep the padding small, the answers run while the next batches are transcribed
+    by_duration = sorted(paths, key=lambda path: len(audio[path]))
+    futures = {}
+    transcribe_s = 0.0
+    with ThreadPoolExecutor(max_workers=args.llm_workers) as llm_pool:
+        for i in range(0, len(by_duration), args.batch_size):
+            batch = by_duration[i : i + args.batch_size]
+            start = time.perf_counter()
+            texts = asr.offline_transcribe_batch([audio[path] for path in batch])
+            transcribe_s += time.perf_counter() - start
+            for path, text in zip(batch, texts):
+                futures[path] = llm_pool.submit(answer_file, path, text)
+
+        output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            for path in paths:
+                output.write(json.dumps(futures[path].result(), ensure_ascii=False) + "\n")
+                output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+    wall_s = time.perf_counter() - started
+    audio_s = sum(len(samples) for samples in audio.values()) / 16000
+    summary = {
+        "files": len(paths),
+        "audio_s": audio_s,
+        "load_s": load_s,
+        "transcribe_s": transcribe_s,
+        "transcribe_rtf": transcribe_s / audio_s if audio_s else None,
+        "wall_s": wall_s,
+        "audio_s_per_s": audio_s / wall_s if wall_s else None,
+    }
+    print(json.dumps(summary), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-model", default="wizardlm2:7b")
+    parser.add_argument("--llm-url", default=os.environ.get("LLM_BASE_URL"), help="Ollama server, local by default")
+    parser.add_argument("--no-warm-up", action="store_true")
+    modes = parser.add_subparsers(dest="mode", required=True)
+
+    local = modes.add_parser("local", help="talk to the assistant through local audio devices or files")
+    local.add_argument("--source", default="mic", help="mic, a .wav file or a raw 16 kHz int16 stream (FIFO)")
+    local.add_argument("--sink", help="speakers, wav:<path> or none (default: speakers for the mic, none otherwise)")
+    local.add_argument("--user", help="enrolled speaker to verify against")
+    local.add_argument("--speed", type=float, default=1.0, help="replay speed of a WAV source")
+    local.add_argument("--tail-silence", type=float, default=2.0, help="silence after a WAV source (s)")
+    local.add_argument("--timeout", type=float, default=60.0, help="wait for the last answer of a file source (s)")
+
+    batch = modes.add_parser("batch", help="transcribe and answer a directory of WAV files")
+    batch.add_argument("directory")
+    batch.add_argument("--output", help="JSON lines file, stdout by default")
+    batch.add_argument("--batch-size", type=int, default=16)
+    batch.add_argument("--llm-workers", type=int, default=4, help="answers generated at once")
+    batch.add_argument("--io-workers", type=int, default=4)
+    batch.add_argument("--no-answer", action="store_true", help="only transcribe")
+    batch.add_argument("--synthesize", metavar="DIR", help="also speak the answers into WAV files in DIR")
+
+    args = parser.parse_args()
+    if args.mode == "local":
+        run_local(args)
+    else:
+        run_batch(args)
+
+
+if __name__ == "__main__":
+    main()
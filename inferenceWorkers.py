@@ -0,0 +1,416 @@
+import asyncio
+import importlib
+import itertools
+import multiprocessing
+import queue
+import threading
+import weakref
+from collections import Counter
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+import numpy as np
+from speech_to_text.asrInterface import IVADModel, IUnifiedTranscriptionModel, IVerificationModel
+from text_to_speech.ttsInterface import ITTSModel
+
+
+class ModelSpec:
+    """
+    How a worker process builds its model: "module:attribute" called with kwargs. Values of kwargs that are
+    ModelSpecs are built first, e.g. the profile store of the speaker verification model.
+    """
+
+    def __init__(self, target, **kwargs):
+        self.target = target
+        self.kwargs = kwargs
+
+    def build(self):
+        module_name, attribute = self.target.split(":")
+        factory = getattr(importlib.import_module(module_name), attribute)
+        kwargs = {key: value.build() if isinstance(value, ModelSpec) else value for key, value in self.kwargs.items()}
+        return factory(**kwargs)
+
+
+class ShmArray:
+    """Stands in for an array that was written to a shared memory slot, only this goes through the pipe."""
+
+    def __init__(self, offset, shape, dtype):
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+
+
+class SharedAudioRing:
+    """
+    A shared memory block split into fixed size slots, one per request in flight. The arrays of a request are
+    packed into its slot and the worker writes the arrays of the result back into the same slot. Arrays that do
+    not fit are pickled through the pipe instead.
+    """
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        else:
+            # Spawned workers share the resource tracker of the creating process, which unlinks the block
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        # Only used by the process that created the ring
+        self.free = queue.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.pickled_arrays = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def acquire(self):
+        # Blocks while every slot is in flight
+        return self.free.get()
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def buffer(self, slot):
+        return self.shm.buf[slot * self.slot_bytes : (slot + 1) * self.slot_bytes]
+
+    def pack(self, obj, buffer, offset=0):
+        """Write the arrays in obj (also inside lists and tuples) to buffer, return (packed obj, next offset)."""
+        if isinstance(obj, np.ndarray):
+            if offset + obj.nbytes > len(buffer):
+                self.pickled_arrays += 1
+                return obj, offset
+            view = np.ndarray(obj.shape, dtype=obj.dtype, buffer=buffer, offset=offset)
+            view[...] = obj
+            # Keep the next array aligned
+            return ShmArray(offset, obj.shape, obj.dtype.str), offset + (obj.nbytes + 7) // 8 * 8
+
+        if isinstance(obj, (list, tuple)):
+            packed = []
+            for item in obj:
+                item, offset = self.pack(item, buffer, offset)
+                packed.append(item)
+            return type(obj)(packed), offset
+
+        return obj, offset
+
+    def unpack(self, obj, buffer):
+        """Copy the arrays of a packed obj out of buffer, the slot is reused once the request is done."""
+        if isinstance(obj, ShmArray):
+            return np.ndarray(obj.shape, dtype=obj.dtype, buffer=buffer, offset=obj.offset).copy()
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self.unpack(item, buffer) for item in obj)
+        return obj
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def worker_main(spec, ring_name, slots, slot_bytes, conn):
+    """Loop of a worker process: build the model, then serve requests one at a time."""
+    ring = SharedAudioRing(slots, slot_bytes, name=ring_name)
+    try:
+        # Session 0 is the shared root model, forks live under the ids the pool hands out
+        sessions = {0: spec.build()}
+    except Exception as e:
+        conn.send(("ready", False, f"{type(e).__name__}: {e}"))
+        ring.close()
+        return
+    conn.send(("ready", True, None))
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+
+        request_id, session_id, op, name, args, slot = message
+        buffer = ring.buffer(slot)
+        try:
+            args = ring.unpack(args, buffer)
+            model = sessions[session_id]
+            if op == "call":
+                result = getattr(model, name)(*args)
+            elif op == "fork":
+                sessions[args[0]] = model.fork()
+                result = None
+            elif op == "release":
+                sessions.pop(session_id, None)
+                result = None
+            else:
+                result = getattr(model, name)
+
+            result, _ = ring.pack(result, buffer)
+            conn.send((request_id, True, result))
+        except Exception as e:
+            conn.send((request_id, False, f"{type(e).__name__}: {e}"))
+        finally:
+            del buffer
+
+    ring.close()
+
+
+class InferenceWorkerPool:
+    """
+    Worker processes that each load the model of spec and run its inference outside the main process' GIL.
+
+    Audio goes through a SharedAudioRing, the pipes only carry small messages. Stateful models are forked
+    inside a worker, and every call of the fork is routed to that worker (sticky sessions), new sessions go
+    to the worker with the fewest. Calls on the shared root model go to the worker with the fewest requests
+    in flight.
+    """
+
+    def __init__(self, spec, workers=1, slots_per_worker=4, slot_bytes=4 * 1024 * 1024, name="inference"):
+        self.spec = spec
+        self.name = name
+        self.ring = SharedAudioRing(workers * slots_per_worker, slot_bytes)
+
+        context = multiprocessing.get_context("spawn")
+        self.connections = []
+        self.processes = []
+        for _ in range(workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=worker_main,
+                args=(spec, self.ring.name, self.ring.slots, slot_bytes, child_conn),
+                name=f"{name}-worker",
+                daemon=True,
+            )
+            process.start()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+        self.closed = False
+        self.lock = threading.Lock()
+        self.send_locks = [threading.Lock() for _ in range(workers)]
+        self.request_ids = itertools.count()
+        self.session_ids = itertools.count(1)
+        self.futures = {}
+        self.session_workers = {}
+        self.sessions_per_worker = Counter()
+        self.inflight = Counter()
+        self.requests = Counter()
+
+        # Wait for every worker to load its model, they load in parallel
+        for conn in self.connections:
+            _, ok, error = conn.recv()
+            if not ok:
+                self.close()
+                raise RuntimeError(f"Loading the {name} worker model failed: {error}")
+        for worker in range(workers):
+            threading.Thread(target=self.receive, args=(worker,), name=f"{name}-receiver", daemon=True).start()
+
+    def receive(self, worker):
+        conn = self.connections[worker]
+        while True:
+            try:
+                request_id, ok, result = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            with self.lock:
+                _, future = self.futures.pop(request_id)
+                self.inflight[worker] -= 1
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(f"{self.name} worker: {result}"))
+
+        # The worker is gone, fail whatever it still had
+        with self.lock:
+            request_ids = [request_id for request_id, (w, _) in self.futures.items() if w == worker]
+            futures = [self.futures.pop(request_id)[1] for request_id in request_ids]
+        for future in futures:
+            future.set_exception(RuntimeError(f"{self.name} worker exited"))
+
+    def pick_worker(self, session_id):
+        with self.lock:
+            if session_id in self.session_workers:
+                return self.session_workers[session_id]
+            return min(range(len(self.processes)), key=self.inflight.__getitem__)
+
+    def request(self, worker, session_id, op, name=None, args=()):
+        slot = self.ring.acquire()
+        buffer = self.ring.buffer(slot)
+        try:
+            packed, _ = self.ring.pack(args, buffer)
+            future = Future()
+            with self.lock:
+                request_id = next(self.request_ids)
+                self.futures[request_id] = (worker, future)
+                self.inflight[worker] += 1
+                self.requests[worker] += 1
+            with self.send_locks[worker]:
+                self.connections[worker].send((request_id, session_id, op, name, packed, slot))
+
+            return self.ring.unpack(future.result(), buffer)
+        finally:
+            del buffer
+            self.ring.release(slot)
+
+    def call(self, session_id, name, *args):
+        return self.request(self.pick_worker(session_id), session_id, "call", name, args)
+
+    def get_attribute(self, session_id, name):
+        return self.request(self.pick_worker(session_id), session_id, "getattr", name)
+
+    def broadcast(self, name, *args):
+        """Call name on the root model of every worker, e.g. to warm them all up."""
+        return [self.request(worker, 0, "call", name, args) for worker in range(len(self.processes))]
+
+    def fork(self, session_id):
+        """Fork a session on the worker that holds it (any worker for the root), return the new session id."""
+        with self.lock:
+            worker = self.session_workers.get(session_id)
+            if worker is None:
+                worker = min(range(len(self.processes)), key=self.sessions_per_worker.__getitem__)
+            new_session_id = next(self.session_ids)
+            self.session_workers[new_session_id] = worker
+            self.sessions_per_worker[worker] += 1
+
+        self.request(worker, session_id, "fork", args=(new_session_id,))
+        return new_session_id
+
+    def release(self, session_id):
+        if self.closed:
+            return
+        with self.lock:
+            worker = self.session_workers.pop(session_id, None)
+            if worker is None:
+                return
+            self.sessions_per_worker[worker] -= 1
+
+        try:
+            self.request(worker, session_id, "release")
+        except Exception as e:
+            print(f"Releasing {self.name} session failed: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": len(self.processes),
+                "alive": sum(process.is_alive() for process in self.processes),
+                "sessions": [self.sessions_per_worker[worker] for worker in range(len(self.processes))],
+                "requests": [self.requests[worker] for worker in range(len(self.processes))],
+                "inflight": [self.inflight[worker] for worker in range(len(self.processes))],
+                "pickled_arrays": self.ring.pickled_arrays,
+            }
+
+    def close(self):
+        self.closed = True
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        self.ring.close()
+
+
+class RemoteModel:
+    """Proxy of one session of the model in an InferenceWorkerPool, forks release their worker state when dropped."""
+
+    def __init__(self, pool: InferenceWorkerPool, session_id=0):
+        self.pool = pool
+        self.session_id = session_id
+
+    def call(self, name, *args):
+        return self.pool.call(self.session_id, name, *args)
+
+    def fork(self):
+        session_model = self.forked(self.pool.fork(self.session_id))
+        weakref.finalize(session_model, self.pool.release, session_model.session_id)
+        return session_model
+
+    def forked(self, session_id):
+        return type(self)(self.pool, session_id)
+
+    def warm_up(self, *args):
+        # Every worker process has its own copy of the model to warm up
+        self.pool.broadcast("warm_up", *args)
+
+    def stats(self):
+        return self.pool.stats()
+
+
+class RemoteVAD(RemoteModel, IVADModel):
+    def detect(self, audio_data):
+        return self.call("detect", audio_data)
+
+    def trailing_silence_ms(self):
+        return self.call("trailing_silence_ms")
+
+    def can_skip(self):
+        return self.call("can_skip")
+
+    def skip(self, audio_data):
+        self.call("skip", audio_data)
+
+
+class RemoteUnifiedTranscription(RemoteModel, IUnifiedTranscriptionModel):
+    def __init__(self, pool, session_id=0):
+        super().__init__(pool, session_id)
+        # Mirrored here, the micro-batcher reads it for every chunk
+        self.language = "auto"
+
+    def online_transcribe(self, audio_data):
+        return self.call("online_transcribe", audio_data)
+
+    def online_transcribe_batch(self, audio_list, language="auto"):
+        return self.call("online_transcribe_batch", list(audio_list), language)
+
+    def offline_transcribe(self, audio_data):
+        text = self.call("offline_transcribe", audio_data)
+        # The offline pass detects the language
+        self.language = self.pool.get_attribute(self.session_id, "language")
+        return text
+
+    def set_language(self, language):
+        self.language = language
+        self.call("set_language", language)
+
+    def reset_online_cache(self):
+        self.call("reset_online_cache")
+
+
+class RemoteSpeakerVerification(RemoteModel, IVerificationModel):
+    """Each worker has its own SpeakerProfileStore on the same directory, a single worker keeps them in sync."""
+
+    def verify(self, audio_data):
+        return self.call("verify", audio_data)
+
+    def set_initial_reference(self, reference_audio):
+        self.call("set_initial_reference", reference_audio)
+
+    def set_speaker(self, name, persist=False):
+        self.call("set_speaker", name, persist)
+
+    def get_active_speaker(self):
+        return self.call("get_active_speaker")
+
+    def profile_count(self):
+        return self.call("profile_count")
+
+
+class RemoteTTSModel(RemoteModel, ITTSModel):
+    def __init__(self, pool, session_id=0):
+        super().__init__(pool, session_id)
+        # Read by the audio cache key
+        self.voice = pool.get_attribute(session_id, "voice")
+        self.speed = pool.get_attribute(session_id, "speed")
+        self.language = pool.get_attribute(session_id, "language")
+
+    def synthesize_full(self, text):
+        return self.call("synthesize_full", text)
+
+    async def synthesize(self, text):
+        # The whole segment at once, the worker process does not block the event loop meanwhile
+        yield await asyncio.get_running_loop().run_in_executor(None, self.synthesize_full, text)
+
+    def fork(self):
+        # Stateless, every session shares the root model
+        return self
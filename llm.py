@@ -1,39 +1,267 @@
+import http.client
+import json
+import socket
+import threading
+from urllib.parse import urlsplit
 from langchain_ollama import ChatOllama
 from langchain_core.messages import HumanMessage, AIMessage
 from utils import emit
+from chatContext import ChatContext
+from tracing import mark
+
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+class ChatStream:
+    """
+    One streamed Ollama /api/chat request on a connection of its own, iterating yields the answer tokens.
+
+    close() shuts the socket down from any thread, which wakes up a read blocked on the first token too, and
+    Ollama stops generating and frees the slot when its client goes away.
+    """
+
+    def __init__(self, model, messages, base_url=None):
+        url = urlsplit(base_url or DEFAULT_OLLAMA_URL)
+        connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.connection = connection_class(url.hostname, url.port)
+        self.path = url.path.rstrip("/") + "/api/chat"
+        self.body = json.dumps(
+            {
+                "model": model,
+                "messages": [{"role": ROLES[message.type], "content": message.content} for message in messages],
+                "stream": True,
+            }
+        )
+
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.connection.connect()
+
+        try:
+            self.connection.request("POST", self.path, self.body, {"Content-Type": "application/json"})
+            response = self.connection.getresponse()
+            if response.status != 200:
+                raise RuntimeError(f"Ollama answered {response.status}: {response.read()[:200]!r}")
+
+            for line in response:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"])
+                content = chunk.get("message", {}).get("content")
+                if content:
+                    yield content
+                if chunk.get("done"):
+                    return
+        finally:
+            self.connection.close()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            sock = self.connection.sock
+
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # Already closed by the reader
+                pass
+
+
+class GenerationHandle:
+    """
+    One streaming LLM request running in the background, its tokens are buffered as they arrive.
+
+    cancel() stops the tokens at once and aborts the request, see ChatStream.
+    """
+
+    def __init__(self, model, messages, transcription=None, base_url=None):
+        self.request = ChatStream(model, messages, base_url)
+        # The user message this answers, used to match speculative answers
+        self.transcription = transcription
+
+        self.buffer = []
+        self.done = False
+        self.cancelled = False
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            for token in self.request:
+                with self.condition:
+                    if self.cancelled:
+                        break
+                    self.buffer.append(token)
+                    self.condition.notify_all()
+        except Exception as e:
+            # Shutting the socket down under a running request ends up here
+            if not self.cancelled:
+                print(f"LLM generation failed: {e}")
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def cancel(self):
+        with self.condition:
+            if self.done or self.cancelled:
+                return
+            self.cancelled = True
+            self.condition.notify_all()
+
+        self.request.close()
+
+    def is_live(self):
+        with self.condition:
+            return not (self.done or self.cancelled)
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+    def tokens(self):
+        """Yield the buffered tokens, then the rest as they are generated, until done or cancelled."""
+        i = 0
+        while True:
+            with self.condition:
+                while i >= len(self.buffer) and not (self.done or self.cancelled):
+                    self.condition.wait()
+                if self.cancelled or i >= len(self.buffer):
+                    return
+                token = self.buffer[i]
+            i += 1
+            yield token
 
 
 class AnswerGenerator:
+    INSTRUCTION = "Only answer in English and do not use Markdown. Use normal punctuation."
+
     def __init__(
         self,
         model,
         interrupt_event,
         socketio=None,
+        token_budget=2048,
+        base_url=None,
+        tracer=None,
     ):
-        self.llm = ChatOllama(model=model)
-        self.chat_history = []
+        self.model = model
+        # None is the local Ollama server, benchmarks point it at a stand-in
+        self.base_url = base_url
+        self.llm = ChatOllama(model=model, base_url=base_url)
+        self.context = ChatContext(self.llm, self.INSTRUCTION, token_budget=token_budget)
+
         self.interrupt_event = interrupt_event
         self.socketio = socketio
+        self.tracer = tracer
 
-    def stream_answer(self, current_user_message):
-        self.chat_history.append(
-            HumanMessage(
-                content=current_user_message
-                + " Only answer in English and do not use Markdown. Use normal punctuation."
-            )
-        )
-        messages = [*self.chat_history]
+        # At most one generation per session is live, the answer being streamed or a speculative one
+        self.generation = None
+        self.speculation = None
+        self.speculation_counters = {"started": 0, "hits": 0, "misses": 0, "wasted_tokens": 0}
+
+    def build_user_message(self, current_user_message):
+        # The instruction is in the system message, so the history only holds what was actually said
+        return HumanMessage(content=current_user_message)
+
+    def start_generation(self, messages, transcription=None):
+        self.cancel()
+        self.discard_speculation()
+        return GenerationHandle(self.model, messages, transcription, self.base_url)
+
+    def cancel(self):
+        """Abort the live answer, e.g. when the user barges in."""
+        if self.generation is not None:
+            self.generation.cancel()
+            self.generation = None
+
+    def is_generating(self):
+        return self.generation is not None and self.generation.is_live()
+
+    def speculate(self, current_user_message):
+        """Start generating the answer to a transcription that may still change, without emitting anything."""
+        if self.speculation is not None and self.speculation.transcription == current_user_message:
+            return
+
+        messages = self.context.messages(self.build_user_message(current_user_message))
+        self.speculation = self.start_generation(messages, current_user_message)
+        self.speculation_counters["started"] += 1
+
+    def discard_speculation(self):
+        if self.speculation is None:
+            return
+
+        self.speculation.cancel()
+        self.speculation_counters["misses"] += 1
+        self.speculation_counters["wasted_tokens"] += len(self.speculation.buffer)
+        self.speculation = None
+
+    def take_speculation(self, current_user_message):
+        """Hand over the held answer if it was generated for this very transcription, discard it otherwise."""
+        if self.speculation is None:
+            return None
+
+        if self.speculation.transcription != current_user_message:
+            self.discard_speculation()
+            return None
+
+        speculation, self.speculation = self.speculation, None
+        self.speculation_counters["hits"] += 1
+        return speculation
+
+    def start_answer(self, current_user_message):
+        """Add the user message to the history and start the answer, releasing the speculative one if it matches."""
+        speculation = self.take_speculation(current_user_message)
+
+        self.context.add_message(self.build_user_message(current_user_message))
+        if speculation is not None:
+            self.generation = speculation
+        else:
+            self.generation = self.start_generation(self.context.messages(), current_user_message)
+        return self.generation
+
+    def add_cached_answer(self, current_user_message, answer):
+        """Record an answer served from the response cache as if it had been generated."""
+        self.cancel()
+        self.discard_speculation()
+
+        self.context.add_message(self.build_user_message(current_user_message))
+        self.context.add_message(AIMessage(content=answer))
+        emit(self.socketio, "llm_answer", {"message": answer})
+        emit(self.socketio, "llm_stopped", {"stopped": True})
+
+    def stream_answer(self, generation: GenerationHandle):
         response_buffer = ""
 
-        for chunk in self.llm.stream(messages):
+        for llm_generated_text in generation.tokens():
             if self.interrupt_event.is_set():
                 break
-            llm_generated_text = chunk.content
+            mark(self.tracer, "llm_first_token")
             yield llm_generated_text
             emit(self.socketio, "llm_answer", {"message": llm_generated_text})
             response_buffer += llm_generated_text
 
+        # Stop generating if the answer was interrupted
+        generation.cancel()
+
         if response_buffer:
-            self.chat_history.append(AIMessage(content=response_buffer))
+            self.context.add_message(AIMessage(content=response_buffer))
 
         emit(self.socketio, "llm_stopped", {"stopped": True})
+
+    def speculation_stats(self):
+        counters = dict(self.speculation_counters)
+        resolved = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / resolved if resolved else 0.0
+        return counters
@@ -0,0 +1,122 @@
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.messages import HumanMessage, AIMessage
+
+
+class CachedResponse:
+    def __init__(self, text, embedding=None):
+        self.text = text
+        # Synthesized speech as [(int16 samples, sample rate)], attached once TTS is done
+        self.audio = None
+        self.embedding = embedding
+        self.created = time.monotonic()
+
+
+class ResponseCache:
+    """
+    Answers to repeated questions, optionally with their synthesized audio, shared by all sessions.
+
+    Entries are keyed by the normalized transcript plus a fingerprint of the last context_messages of the
+    conversation, so an answer is only reused when what led up to the question is the same (e.g. both at the
+    start of a conversation). With embed_fn, a question that is not an exact match still hits an entry with the
+    same context whose embedding has a cosine similarity of at least similarity_threshold.
+    Entries expire after ttl_s, the least recently used ones are evicted beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        max_entries=256,
+        ttl_s=3600,
+        context_messages=2,
+        embed_fn=None,
+        similarity_threshold=0.92,
+    ):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.context_messages = context_messages
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "semantic_hits": 0, "audio_hits": 0, "misses": 0, "stores": 0}
+
+    @staticmethod
+    def normalize(text):
+        text = re.sub(r"[^\w\s']", " ", text.lower())
+        return " ".join(text.split())
+
+    def context_fingerprint(self, history):
+        turns = [message for message in history if isinstance(message, (HumanMessage, AIMessage))]
+        recent = turns[-self.context_messages :] if self.context_messages > 0 else []
+        context = "\n".join(f"{message.type}:{self.normalize(message.content)}" for message in recent)
+        return hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+    def embed(self, text):
+        embedding = np.asarray(self.embed_fn(text), dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) + 1e-8)
+
+    def evict_expired(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self.entries.items() if now - entry.created > self.ttl_s]:
+            del self.entries[key]
+
+    def lookup(self, transcript, history):
+        """Return the CachedResponse for the transcript asked after history, or None."""
+        fingerprint = self.context_fingerprint(history)
+        key = (fingerprint, self.normalize(transcript))
+        # Embed outside the lock, it may be a model call
+        embedding = self.embed(key[1]) if self.embed_fn is not None else None
+
+        with self.lock:
+            self.evict_expired()
+
+            entry = self.entries.get(key)
+            if entry is None and embedding is not None:
+                candidates = [
+                    (candidate_key, candidate)
+                    for candidate_key, candidate in self.entries.items()
+                    if candidate_key[0] == fingerprint and candidate.embedding is not None
+                ]
+                if candidates:
+                    scores = np.stack([candidate.embedding for _, candidate in candidates]) @ embedding
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        key, entry = candidates[best]
+                        self.counters["semantic_hits"] += 1
+
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            self.counters["audio_hits"] += entry.audio is not None
+            return entry
+
+    def store(self, transcript, history, text):
+        """Cache the answer to the transcript asked after history and return its entry, to attach audio later."""
+        normalized = self.normalize(transcript)
+        key = (self.context_fingerprint(history), normalized)
+        entry = CachedResponse(text, self.embed(normalized) if self.embed_fn is not None else None)
+
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.counters["stores"] += 1
+        return entry
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters["entries"] = len(self.entries)
+
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
@@ -0,0 +1,158 @@
+import threading
+from voiceAssistant import VoiceAssistant
+from speech_to_text.speechRecognizer import SpeechRecognizer
+from text_to_speech.speechGenerator import SpeechGenerator
+from llm import AnswerGenerator
+from utils import SessionSocketIO
+from tracing import Metrics, Tracer
+
+
+class SessionManager:
+    """
+    Keeps one VoiceAssistant per Socket.IO connection.
+
+    The heavy models (VAD, ASR, SV and TTS) are loaded once and handed in here. Each session gets its own
+    recognizer state, speech generator queue, chat history and interrupt event on top of them.
+    """
+
+    def __init__(
+        self,
+        vad_model,
+        unified_model,
+        sv_model,
+        tts_model,
+        llm_model,
+        socketio=None,
+        incremental_offline=True,
+        audio_queue_maxsize=0,
+        audio_queue_policy="block",
+        endpoint_silence_ms=None,
+        idle_silence_ms=None,
+        pause_silence_ms=None,
+        speculative_llm=False,
+        response_cache=None,
+        tts_executor=None,
+        tts_lookahead=2,
+        segmenter_factory=None,
+        llm_base_url=None,
+        metrics=None,
+        profiler=None,
+    ):
+        self.vad_model = vad_model
+        self.unified_model = unified_model
+        self.sv_model = sv_model
+        self.tts_model = tts_model
+        self.llm_model = llm_model
+        self.socketio = socketio
+        self.incremental_offline = incremental_offline
+        self.audio_queue_maxsize = audio_queue_maxsize
+        self.audio_queue_policy = audio_queue_policy
+        self.endpoint_silence_ms = endpoint_silence_ms
+        self.idle_silence_ms = idle_silence_ms
+        self.pause_silence_ms = pause_silence_ms
+        self.speculative_llm = speculative_llm
+        self.response_cache = response_cache
+        self.tts_executor = tts_executor
+        self.tts_lookahead = tts_lookahead
+        # Builds each session's text segmenter, None keeps the fixed threshold
+        self.segmenter_factory = segmenter_factory
+        self.llm_base_url = llm_base_url
+        # Turn latency histograms of all the sessions, and the optional profiler of their audio threads
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.profiler = profiler
+
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create_session(self, sid, user=None, transport=None, user_authenticated=False):
+        socketio = SessionSocketIO(self.socketio, sid) if self.socketio is not None else None
+        tracer = Tracer(self.metrics)
+
+        speech_recognizer = SpeechRecognizer(
+            vad_model=self.vad_model.fork(),
+            unified_model=self.unified_model.fork(),
+            sv_model=self.sv_model.fork(),
+            socketio=socketio,
+            incremental_offline=self.incremental_offline,
+            endpoint_silence_ms=self.endpoint_silence_ms,
+            idle_silence_ms=self.idle_silence_ms,
+            pause_silence_ms=self.pause_silence_ms,
+            tracer=tracer,
+        )
+        if user:
+            # Returning users are verified against their stored voice profile right away, only an authenticated
+            # user's voice updates it
+            speech_recognizer.sv_model.set_speaker(user, persist=user_authenticated)
+        interrupt_event = speech_recognizer.listening_to_user_event
+
+        speech_generator = SpeechGenerator(
+            model=self.tts_model,
+            interrupt_event=interrupt_event,
+            socketio=socketio,
+            executor=self.tts_executor,
+            lookahead=self.tts_lookahead,
+            segmenter=self.segmenter_factory() if self.segmenter_factory is not None else None,
+            transport=transport,
+            tracer=tracer,
+        )
+        answer_generator = AnswerGenerator(
+            model=self.llm_model,
+            interrupt_event=interrupt_event,
+            socketio=socketio,
+            base_url=self.llm_base_url,
+            tracer=tracer,
+        )
+
+        assistant = VoiceAssistant(
+            speech_recognizer,
+            speech_generator,
+            answer_generator,
+            socketio,
+            audio_queue_maxsize=self.audio_queue_maxsize,
+            audio_queue_policy=self.audio_queue_policy,
+            speculative_llm=self.speculative_llm,
+            response_cache=self.response_cache,
+            tracer=tracer,
+            profiler=self.profiler,
+            release_audio=transport.mic_buffer.release if transport is not None and transport.mic_buffer else None,
+        )
+        assistant.run().start()
+
+        with self.lock:
+            previous = self.sessions.pop(sid, None)
+            self.sessions[sid] = assistant
+
+        if previous is not None:
+            previous.stop()
+
+        return assistant
+
+    def get_session(self, sid):
+        with self.lock:
+            return self.sessions.get(sid)
+
+    def close_session(self, sid):
+        with self.lock:
+            assistant = self.sessions.pop(sid, None)
+
+        if assistant is not None:
+            assistant.stop()
+
+    def stats(self):
+        with self.lock:
+            sessions = dict(self.sessions)
+
+        return {
+            sid: {
+                "audio_queue": assistant.audio_queue.stats(),
+                "speculation": assistant.answer_generator.speculation_stats(),
+                "chat_context": assistant.answer_generator.context.stats(),
+                "barge_in": assistant.barge_in_stats(),
+                "traces": assistant.tracer.traces(),
+            }
+            for sid, assistant in sessions.items()
+        }
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
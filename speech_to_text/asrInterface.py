@@ -9,6 +9,34 @@ class IVADModel(ABC):
         """
         pass
 
+    def trailing_silence_ms(self):
+        """
+        Silence in milliseconds since the end of the last speech, 0 while speech is ongoing.
+        None if the model does not keep track of it across chunks.
+        """
+        return None
+
+    def can_skip(self):
+        """
+        True if a chunk found silent by a pre-gate may skip detect(), see skip(). A streaming VAD within a speech
+        segment has to see every chunk to close it.
+        """
+        return True
+
+    def skip(self, audio_data):
+        """
+        Account for a silent chunk that was not passed to detect().
+        """
+        pass
+
+    def fork(self):
+        # Stateless models can be shared by every session as is.
+        return self
+
+    def warm_up(self, audio_data):
+        # One inference on a throwaway session so the first user turn does not pay for lazy initialization.
+        self.fork().detect(audio_data)
+
 
 class IOnlineTranscriptionModel(ABC):
     @abstractmethod
@@ -21,12 +49,18 @@ class IOnlineTranscriptionModel(ABC):
     def reset_online_cache(self):
         pass
 
+    def fork(self):
+        return self
+
 
 class IOfflineTranscriptionModel(ABC):
     @abstractmethod
     def transcribe(self, audio_data):
         pass
 
+    def fork(self):
+        return self
+
 
 class IUnifiedTranscriptionModel(ABC):
     @abstractmethod
@@ -37,12 +71,24 @@ class IUnifiedTranscriptionModel(ABC):
     def offline_transcribe(self, audio_data):
         pass
 
+    def offline_transcribe_batch(self, audio_list):
+        # Bulk transcription of whole recordings, models that can batch them override this.
+        return [self.offline_transcribe(audio_data) for audio_data in audio_list]
+
     def set_language(self, language):
         pass
 
     def reset_online_cache(self):
         pass
 
+    def fork(self):
+        return self
+
+    def warm_up(self, audio_data):
+        session_model = self.fork()
+        session_model.online_transcribe(audio_data)
+        session_model.offline_transcribe(audio_data)
+
 
 class IVerificationModel(ABC):
     @abstractmethod
@@ -51,3 +97,18 @@ class IVerificationModel(ABC):
 
     def set_initial_reference(self, reference_audio):
         pass
+
+    def set_speaker(self, name, persist=False):
+        pass
+
+    def get_active_speaker(self):
+        return None
+
+    def profile_count(self):
+        return 0
+
+    def fork(self):
+        return self
+
+    def warm_up(self, audio_data):
+        self.fork().verify(audio_data)
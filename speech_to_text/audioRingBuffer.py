@@ -0,0 +1,116 @@
+import threading
+import numpy as np
+
+INT16_SCALE = np.float32(1 / 32768.0)
+
+
+class AudioRingBuffer:
+    """
+    Preallocated float32 slots the incoming int16 mic chunks are converted into, in place.
+
+    write() returns a view of a free slot, which is what the queue and the models get, so a chunk costs no
+    allocation in steady state. The slot stays taken until release() is called with the chunk, once it has been
+    processed (or merged or dropped by the queue). When every slot is taken, e.g. the consumer fell behind by more
+    than slots chunks, the chunk gets a new array instead of overwriting one still in use. So do chunks longer
+    than a slot.
+    """
+
+    def __init__(self, slots=24, chunk_size=9600):
+        self.chunk_size = chunk_size
+        self.buffer = np.zeros(slots * chunk_size, dtype=np.float32)
+        # The views are created once, slicing per chunk would allocate an array object every time
+        self.slots = [self.buffer[i * chunk_size : (i + 1) * chunk_size] for i in range(slots)]
+        self.address = self.buffer.__array_interface__["data"][0]
+        self.slot_bytes = chunk_size * self.buffer.itemsize
+        # Taken last, reused first: the slot is still in the CPU cache
+        self.free = list(range(slots - 1, -1, -1))
+        self.taken = [False] * slots
+        self.lock = threading.Lock()
+        self.oversized = 0
+        self.exhausted = 0
+
+    def write(self, samples):
+        """Convert int16 samples to float32 in [-1, 1) into a free slot and return a view of it."""
+        if len(samples) > self.chunk_size:
+            self.oversized += 1
+            return samples.astype(np.float32) * INT16_SCALE
+
+        with self.lock:
+            if not self.free:
+                self.exhausted += 1
+                index = None
+            else:
+                index = self.free.pop()
+                self.taken[index] = True
+        if index is None:
+            return samples.astype(np.float32) * INT16_SCALE
+
+        slot = self.slots[index]
+        if len(samples) < self.chunk_size:
+            slot = slot[: len(samples)]
+        # Cast then scale in place, np.multiply(samples, scale, out=slot) would allocate a cast buffer
+        np.copyto(slot, samples, casting="safe")
+        slot *= INT16_SCALE
+        return slot
+
+    def release(self, chunk):
+        """Make the slot of a chunk returned by write() free again, other arrays are ignored."""
+        if chunk is None or chunk.base is not self.buffer:
+            return
+
+        index = (chunk.__array_interface__["data"][0] - self.address) // self.slot_bytes
+        with self.lock:
+            if self.taken[index]:
+                self.taken[index] = False
+                self.free.append(index)
+
+    def stats(self):
+        with self.lock:
+            free = len(self.free)
+        return {
+            "slots": len(self.slots),
+            "free": free,
+            "chunk_size": self.chunk_size,
+            "oversized": self.oversized,
+            "exhausted": self.exhausted,
+        }
+
+
+class SpeechBuffer:
+    """
+    The speech of the current utterance, appended chunk by chunk into one preallocated float32 buffer instead of
+    a list concatenated for every offline pass. view() is the contiguous speech so far without a copy, snapshot()
+    a copy of it that outlives reset(), e.g. for the offline decode running in the background.
+    len() is the number of chunks appended, the buffer doubles when a long utterance does not fit.
+    """
+
+    def __init__(self, capacity_chunks=52, chunk_size=9600):
+        self.buffer = np.zeros(capacity_chunks * chunk_size, dtype=np.float32)
+        self.length = 0
+        self.chunks = 0
+        self.grown = 0
+
+    def append(self, chunk):
+        end = self.length + len(chunk)
+        if end > len(self.buffer):
+            buffer = np.zeros(max(end, 2 * len(self.buffer)), dtype=np.float32)
+            buffer[: self.length] = self.buffer[: self.length]
+            self.buffer = buffer
+            self.grown += 1
+
+        self.buffer[self.length : end] = chunk
+        self.length = end
+        self.chunks += 1
+
+    def view(self):
+        return self.buffer[: self.length]
+
+    def snapshot(self):
+        return self.buffer[: self.length].copy()
+
+    def reset(self):
+        self.length = 0
+        self.chunks = 0
+
+    def __len__(self):
+        return self.chunks
@@ -0,0 +1,98 @@
+import copy
+import threading
+import numpy as np
+from speech_to_text.asrInterface import IVADModel
+from utils import audio_rms
+
+
+class EnergyGateVAD(IVADModel):
+    """
+    Cheap pre-gate in front of a neural VAD.
+
+    Chunks whose RMS energy stays close to the adaptive noise floor, or whose zero-crossing rate is noise-like
+    at low energy, are answered as silence without calling the model. Everything else is escalated to the
+    wrapped VAD. The noise floor follows the energy of the chunks found silent, up to max_noise_floor (-40 dBFS)
+    so that quiet speech is never below the gate in a noisy room: the model decides there.
+
+    A streaming VAD is only skipped between its speech segments, and keeps measuring the silence.
+    """
+
+    def __init__(
+        self,
+        model: IVADModel,
+        min_rms=0.003,
+        noise_margin=2.0,
+        noise_adaptation=0.05,
+        max_silence_zcr=0.35,
+        initial_noise_floor=0.005,
+        max_noise_floor=0.01,
+    ):
+        self.model = model
+        self.min_rms = min_rms
+        self.noise_margin = noise_margin
+        self.noise_adaptation = noise_adaptation
+        self.max_silence_zcr = max_silence_zcr
+        self.initial_noise_floor = initial_noise_floor
+        self.max_noise_floor = max_noise_floor
+        self.noise_floor = initial_noise_floor
+
+        # Shared by all the sessions forked from this gate
+        self.counter_lock = threading.Lock()
+        self.counters = {"chunks": 0, "model_calls": 0}
+
+    @staticmethod
+    def zero_crossing_rate(audio_data):
+        if len(audio_data) < 2:
+            return 0.0
+        return np.count_nonzero(np.signbit(audio_data[1:]) != np.signbit(audio_data[:-1])) / (len(audio_data) - 1)
+
+    def is_silence(self, audio_data):
+        rms = audio_rms(audio_data)
+        if rms < self.min_rms or rms < self.noise_floor * self.noise_margin:
+            return True
+
+        # Broadband noise crosses zero far more often than voiced speech, only trust this at low energy
+        return rms < self.noise_floor * self.noise_margin * 2 and (
+            self.zero_crossing_rate(audio_data) > self.max_silence_zcr
+        )
+
+    def update_noise_floor(self, audio_data):
+        self.noise_floor += self.noise_adaptation * (audio_rms(audio_data) - self.noise_floor)
+        self.noise_floor = min(self.noise_floor, self.max_noise_floor)
+
+    def detect(self, audio_data):
+        skip = self.is_silence(audio_data) and self.model.can_skip()
+        with self.counter_lock:
+            self.counters["chunks"] += 1
+            self.counters["model_calls"] += not skip
+
+        if skip:
+            self.model.skip(audio_data)
+            self.update_noise_floor(audio_data)
+            return False
+
+        speech = self.model.detect(audio_data)
+        if not speech:
+            self.update_noise_floor(audio_data)
+        return speech
+
+    def trailing_silence_ms(self):
+        return self.model.trailing_silence_ms()
+
+    def fork(self):
+        # Every session adapts to its own microphone
+        session_model = copy.copy(self)
+        session_model.model = self.model.fork()
+        session_model.noise_floor = self.initial_noise_floor
+        return session_model
+
+    def stats(self):
+        with self.counter_lock:
+            chunks = self.counters["chunks"]
+            model_calls = self.counters["model_calls"]
+
+        return {
+            "chunks": chunks,
+            "model_calls": model_calls,
+            "model_calls_saved_fraction": (chunks - model_calls) / chunks if chunks else 0.0,
+        }
@@ -1,6 +1,11 @@
+import copy
+import threading
+import numpy as np
+import torch
 from funasr import AutoModel
 from modelscope.pipelines import pipeline
 from utils import postprocess_funasr_result, emit, extract_language_code
+from speech_to_text.speakerProfileStore import SpeakerProfileStore, normalize, rolling_average
 from speech_to_text.asrInterface import (
     IVADModel,
     IOnlineTranscriptionModel,
@@ -21,6 +26,86 @@ class FunASRVAD(IVADModel):
         return len(vad_res[0]["value"]) > 0
 
 
+class FunASRStreamingVAD(IVADModel):
+    """
+    fsmn-vad in streaming mode. The model cache is carried across the chunks of a session and the speech
+    start/end timestamps (ms since the start of the stream) are tracked, so the silence after the speech is known
+    with sub-chunk precision.
+    """
+
+    def __init__(self, model_name, max_end_silence_time=200, RATE=16000, verbose=False):
+        disable = not verbose
+        self.model = AutoModel(model=model_name, disable_log=disable, disable_pbar=disable, disable_update=disable)
+        # Silence the model waits for before it reports the end of a speech segment
+        self.max_end_silence_time = max_end_silence_time
+        self.RATE = RATE
+
+        self.cache = {}
+        self.stream_ms = 0.0
+        # Audio skipped by a pre-gate, the model timestamps only count the audio it was fed
+        self.skipped_ms = 0.0
+        self.in_speech = False
+        self.speech_start_ms = None
+        self.speech_end_ms = None
+
+    def detect_segments(self, audio_data):
+        """Feed the next chunk and return its segments as [start_ms, end_ms], -1 where a boundary is still open."""
+        chunk_ms = len(audio_data) * 1000 / self.RATE
+        # The model is shared by the sessions and inference() updates its kwargs in place, cache included, so
+        # every call gets its own copy. Without a VAD model of its own, generate() is inference()
+        vad_res = self.model.inference(
+            audio_data,
+            kwargs=dict(self.model.kwargs),
+            cache=self.cache,
+            is_final=False,
+            chunk_size=int(chunk_ms),
+            max_end_silence_time=self.max_end_silence_time,
+        )
+        self.stream_ms += chunk_ms
+
+        segments = vad_res[0]["value"] if vad_res else []
+        for start_ms, end_ms in segments:
+            if start_ms != -1:
+                self.in_speech = True
+                self.speech_start_ms = start_ms + self.skipped_ms
+            if end_ms != -1:
+                self.in_speech = False
+                self.speech_end_ms = end_ms + self.skipped_ms
+        return segments
+
+    def detect(self, audio_data):
+        # Speech carried over from the previous chunk counts as speech in this one
+        was_in_speech = self.in_speech
+        segments = self.detect_segments(audio_data)
+        return was_in_speech or len(segments) > 0
+
+    def trailing_silence_ms(self):
+        if self.in_speech:
+            return 0.0
+        if self.speech_end_ms is None:
+            return self.stream_ms
+        return max(0.0, self.stream_ms - self.speech_end_ms)
+
+    def can_skip(self):
+        return not self.in_speech
+
+    def skip(self, audio_data):
+        chunk_ms = len(audio_data) * 1000 / self.RATE
+        self.stream_ms += chunk_ms
+        self.skipped_ms += chunk_ms
+
+    def fork(self):
+        # Share the loaded model, every session streams with its own cache
+        session_model = copy.copy(self)
+        session_model.cache = {}
+        session_model.stream_ms = 0.0
+        session_model.skipped_ms = 0.0
+        session_model.in_speech = False
+        session_model.speech_start_ms = None
+        session_model.speech_end_ms = None
+        return session_model
+
+
 class FunASRUnifiedTranscription(IUnifiedTranscriptionModel):
     def __init__(self, model_name, verbose=False):
         disable = not verbose
@@ -36,51 +121,237 @@ class FunASRUnifiedTranscription(IUnifiedTranscriptionModel):
 
         self.language = "auto"
         self.online_cache = {}
+        # generate() writes the language and cache of the call into the kwargs of the model the sessions share,
+        # and runs its internal VAD before SenseVoice reads them back, so one call at a time
+        self.model_lock = threading.Lock()
 
     def online_transcribe(self, audio_data):
-        online_res = self.model.generate(
-            input=audio_data,
-            cache=self.online_cache,
-            language=self.language if self.language is not None else "auto",
-            use_itn=True,
-            batch_size_s=60,
-        )
+        with self.model_lock:
+            online_res = self.model.generate(
+                input=audio_data,
+                cache=self.online_cache,
+                language=self.language if self.language is not None else "auto",
+                use_itn=True,
+                batch_size_s=60,
+            )
 
         return postprocess_funasr_result(online_res, remove_punctuation=True)
 
-    def offline_transcribe(self, audio_data):
-        offline_res = self.model.generate(
-            input=audio_data,
-            cache={},
-            language="auto",
+    def online_transcribe_batch(self, audio_list, language="auto"):
+        # The chunks are already VAD positive, so skip the internal VAD and let SenseVoice pad them into one batch.
+        # Unlike online_transcribe, the whole chunk is decoded rather than the speech the internal VAD keeps of it,
+        # and the session's online cache is not passed, which SenseVoice does not read anyway: every chunk is
+        # decoded on its own. The result may differ at the edges of the speech, the offline pass replaces it
+        online_res = self.model.inference(
+            list(audio_list),
+            kwargs=self.call_kwargs(),
+            batch_size=len(audio_list),
+            language=language,
             use_itn=True,
-            batch_size_s=60,
         )
 
+        return [postprocess_funasr_result([res], remove_punctuation=True) for res in online_res]
+
+    def offline_transcribe(self, audio_data):
+        with self.model_lock:
+            offline_res = self.model.generate(
+                input=audio_data,
+                cache={},
+                language="auto",
+                use_itn=True,
+                batch_size_s=60,
+            )
+
         self.language = extract_language_code(offline_res[0]["text"])
 
         return postprocess_funasr_result(offline_res)
 
+    def offline_transcribe_batch(self, audio_list, max_batch_duration_s=30, rate=16000):
+        # Recordings short enough for one SenseVoice pass skip the VAD and are padded into a single batch, longer
+        # ones are split at their pauses one at a time. Callers sort by duration to keep the padding small
+        short = [i for i, audio_data in enumerate(audio_list) if len(audio_data) <= max_batch_duration_s * rate]
+        results = [None] * len(audio_list)
+        if short:
+            offline_res = self.model.inference(
+                [audio_list[i] for i in short],
+                kwargs=self.call_kwargs(),
+                batch_size=len(short),
+                language="auto",
+                use_itn=True,
+            )
+            for i, res in zip(short, offline_res):
+                results[i] = postprocess_funasr_result([res])
+
+        return [
+            result if result is not None else self.offline_transcribe(audio_data)
+            for result, audio_data in zip(results, audio_list)
+        ]
+
+    def call_kwargs(self):
+        # inference() updates the kwargs it is given in place, so direct calls get a copy of the shared ones,
+        # without the cache a generate() call of some session left in them
+        with self.model_lock:
+            return dict(self.model.kwargs, cache={})
+
     def set_language(self, language):
         self.language = language
 
     def reset_online_cache(self):
         self.online_cache = {}
 
+    def fork(self):
+        # Share the loaded model, but keep language and online cache per session
+        session_model = copy.copy(self)
+        session_model.language = "auto"
+        session_model.online_cache = {}
+        return session_model
+
 
 class FunASRSpeakerVerification(IVerificationModel):
-    def __init__(self, model_name, threshold=0.35):
+    def __init__(
+        self,
+        model_name,
+        threshold=0.35,
+        rolling_reference=False,
+        max_enrollments=10,
+        profile_store: SpeakerProfileStore = None,
+    ):
         self.pipeline = pipeline(task="speaker-verification", model=model_name)
-        self.reference_audio = None
         self.threshold = threshold
 
+        # The references are kept as normalized embeddings, one row per enrolled speaker,
+        # so each chunk only embeds the new audio and is compared against all of them at once
+        self.reference_embeddings = None
+        self.reference_names = []
+        self.enrollments = []
+        self.active_speaker = None
+        self.rolling_reference = rolling_reference
+        self.max_enrollments = max_enrollments
+
+        # Speaker of this session, profiles of returning users are loaded from the store. Only an authenticated
+        # speaker's enrollments are written back to it
+        self.profile_store = profile_store
+        self.speaker_name = None
+        self.persist_profile = False
+
+    def embed(self, audio_data):
+        wavs = self.pipeline.preprocess([audio_data])
+        with torch.no_grad():
+            embedding = self.pipeline.forward(wavs)[0]
+
+        return normalize(embedding.cpu().numpy().astype(np.float32))
+
+    def similarities(self, embedding):
+        # Cosine similarity against every enrolled speaker, all embeddings are normalized
+        return self.reference_embeddings @ embedding
+
     def verify(self, audio_data):
-        if self.reference_audio is None:
+        if self.reference_embeddings is None:
+            return True
+
+        embedding = self.embed(audio_data)
+        scores = self.similarities(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            self.active_speaker = self.reference_names[best]
             return True
 
-        result = self.pipeline([audio_data, self.reference_audio], thr=self.threshold)
-        return result.get("text", "").lower() == "yes"
+        # The session's own profile may have been enrolled or updated since it was loaded, other voices are ignored
+        name = self.match_stored_speaker(embedding)
+        if name is None:
+            return False
+
+        self.active_speaker = name
+        return True
+
+    def match_stored_speaker(self, embedding):
+        """Return the session speaker's name if the embedding matches their stored profile, or None."""
+        name = self.speaker_name
+        if self.profile_store is None or name is None:
+            return None
+
+        stored = self.profile_store.get(name)
+        if stored is None or float(normalize(stored) @ embedding) < self.threshold:
+            return None
+
+        if name in self.reference_names:
+            # The stored profile moved on since the session loaded it
+            self.reference_embeddings[self.reference_names.index(name)] = normalize(stored)
+        else:
+            self.add_speaker(name, stored)
+        return name
+
+    def warm_up(self, audio_data):
+        # verify() skips the model until a reference is set
+        self.embed(audio_data)
+
+    def get_active_speaker(self):
+        return self.active_speaker
+
+    def profile_count(self):
+        return len(self.profile_store) if self.profile_store is not None else 0
+
+    def add_speaker(self, name, embedding, enrollments=1):
+        embedding = normalize(np.asarray(embedding, dtype=np.float32))
+
+        if self.reference_embeddings is None:
+            self.reference_embeddings = embedding[np.newaxis, :]
+        else:
+            self.reference_embeddings = np.vstack([self.reference_embeddings, embedding])
+        self.reference_names.append(name)
+        self.enrollments.append(enrollments)
+
+        if self.active_speaker is None:
+            self.active_speaker = name
+
+    def set_speaker(self, name, persist=False):
+        """
+        Use name for enrollment, a returning user gets the stored profile and skips enrollment. The enrollments
+        only update the stored profile with persist, for a name the server authenticated rather than one the client
+        claims.
+        """
+        self.speaker_name = name
+        self.persist_profile = persist
+
+        if self.profile_store is not None and name not in self.reference_names:
+            embedding = self.profile_store.get(name)
+            if embedding is not None:
+                self.add_speaker(name, embedding)
 
     def set_initial_reference(self, reference_audio):
-        if self.reference_audio is None:
-            self.reference_audio = reference_audio
+        if self.reference_embeddings is None:
+            self.enroll(self.embed(reference_audio))
+        elif self.rolling_reference:
+            self.update_reference(reference_audio)
+
+    def enroll(self, embedding):
+        name = self.speaker_name
+        self.add_speaker(name, embedding)
+
+        if self.profile_store is not None and name is not None and self.persist_profile:
+            self.profile_store.enroll(name, embedding)
+
+    def update_reference(self, reference_audio):
+        """
+        Fold an enrolled segment into the active speaker's reference, as a rolling average over the last
+        max_enrollments segments.
+        """
+        embedding = self.embed(reference_audio)
+
+        i = self.reference_names.index(self.active_speaker)
+        self.enrollments[i] = min(self.enrollments[i] + 1, self.max_enrollments)
+        self.reference_embeddings[i] = rolling_average(self.reference_embeddings[i], embedding, self.enrollments[i])
+
+        if self.profile_store is not None and self.active_speaker == self.speaker_name and self.persist_profile:
+            self.profile_store.enroll(self.active_speaker, embedding)
+
+    def fork(self):
+        # Share the loaded pipeline and profile store, every session enrolls its own speakers
+        session_model = copy.copy(self)
+        session_model.reference_embeddings = None
+        session_model.reference_names = []
+        session_model.enrollments = []
+        session_model.active_speaker = None
+        session_model.speaker_name = None
+        session_model.persist_profile = False
+        return session_model
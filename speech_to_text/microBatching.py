@@ -0,0 +1,125 @@
+import copy
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from speech_to_text.asrInterface import IUnifiedTranscriptionModel
+
+
+class MicroBatcher:
+    """
+    Collects requests submitted from many threads (one per session) and runs them through batch_fn together.
+
+    A batch is closed once it holds max_batch_size items or max_wait_ms has passed since its first item arrived.
+    batch_fn receives the list of items and must return one result per item, in the same order.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=10, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.pending = []
+        self.condition = threading.Condition()
+        self.batch_sizes = Counter()
+
+        threading.Thread(target=self.run, name=name, daemon=True).start()
+
+    def submit(self, item):
+        """Block until the batch containing item has been processed and return its result."""
+        future = Future()
+        with self.condition:
+            self.pending.append((item, future))
+            self.condition.notify()
+        return future.result()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+
+                # Give other streams a short window to join the batch
+                deadline = time.monotonic() + self.max_wait
+                while len(self.pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batch = self.pending[: self.max_batch_size]
+                del self.pending[: self.max_batch_size]
+                self.batch_sizes[len(batch)] += 1
+
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        with self.condition:
+            batch_sizes = dict(self.batch_sizes)
+
+        batches = sum(batch_sizes.values())
+        items = sum(size * count for size, count in batch_sizes.items())
+        return {
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": items / batches if batches else 0.0,
+            "batch_size_histogram": {str(size): batch_sizes[size] for size in sorted(batch_sizes)},
+        }
+
+
+class BatchedUnifiedTranscription(IUnifiedTranscriptionModel):
+    """
+    Routes online_transcribe() calls of all sessions through one MicroBatcher in front of
+    model.online_transcribe_batch. The offline pass is left unbatched.
+
+    The batched chunks skip the model's own VAD, see FunASRUnifiedTranscription.online_transcribe_batch, so the
+    online transcripts may differ slightly from the unbatched ones. The VAD is not batched: fsmn-vad decodes one
+    stream per call.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait_ms=10):
+        self.model = model
+        self.batcher = MicroBatcher(self.transcribe_batch, max_batch_size, max_wait_ms, name="online-asr-batcher")
+
+    def transcribe_batch(self, requests):
+        # The language is a per-batch setting of the model, so run one batch per language
+        indices_by_language = {}
+        for i, (_, language) in enumerate(requests):
+            indices_by_language.setdefault(language, []).append(i)
+
+        results = [None] * len(requests)
+        for language, indices in indices_by_language.items():
+            texts = self.model.online_transcribe_batch([requests[i][0] for i in indices], language)
+            for i, text in zip(indices, texts):
+                results[i] = text
+        return results
+
+    def online_transcribe(self, audio_data):
+        language = self.model.language if self.model.language is not None else "auto"
+        return self.batcher.submit((audio_data, language))
+
+    def offline_transcribe(self, audio_data):
+        return self.model.offline_transcribe(audio_data)
+
+    def set_language(self, language):
+        self.model.set_language(language)
+
+    def reset_online_cache(self):
+        self.model.reset_online_cache()
+
+    def fork(self):
+        # Sessions share the batcher, only the wrapped per-session state is forked
+        session_model = copy.copy(self)
+        session_model.model = self.model.fork()
+        return session_model
+
+    def stats(self):
+        return self.batcher.stats()
@@ -0,0 +1,105 @@
+import os
+import json
+import threading
+import numpy as np
+
+
+def normalize(embedding):
+    return embedding / (np.linalg.norm(embedding, axis=-1, keepdims=True) + 1e-8)
+
+
+def rolling_average(reference, embedding, count):
+    """Average of the reference (built from count - 1 segments) and a new embedding, normalized."""
+    return normalize(reference + (embedding - reference) / count)
+
+
+class SpeakerProfileStore:
+    """
+    Enrolled voice embeddings per user on local disk.
+
+    The embeddings live in embeddings.npy (one normalized row per user) and are memory mapped at startup,
+    profiles.json keeps the user names and enrollment counts in row order.
+    """
+
+    def __init__(self, directory, max_enrollments=10):
+        self.directory = directory
+        self.max_enrollments = max_enrollments
+        self.embeddings_path = os.path.join(directory, "embeddings.npy")
+        self.profiles_path = os.path.join(directory, "profiles.json")
+
+        self.lock = threading.Lock()
+        self.names = []
+        self.enrollments = []
+        self.embeddings = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        if not (os.path.exists(self.embeddings_path) and os.path.exists(self.profiles_path)):
+            return
+
+        with open(self.profiles_path, encoding="utf-8") as f:
+            profiles = json.load(f)
+
+        self.names = [profile["name"] for profile in profiles]
+        self.enrollments = [profile["enrollments"] for profile in profiles]
+        self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
+
+    def save(self):
+        # Write to temporary files first so a crash never leaves a half written store behind
+        embeddings_tmp = self.embeddings_path + ".tmp"
+        profiles_tmp = self.profiles_path + ".tmp"
+
+        with open(embeddings_tmp, "wb") as f:
+            np.save(f, self.embeddings)
+        with open(profiles_tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                [{"name": name, "enrollments": count} for name, count in zip(self.names, self.enrollments)], f
+            )
+
+        os.replace(embeddings_tmp, self.embeddings_path)
+        os.replace(profiles_tmp, self.profiles_path)
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.names:
+                return None
+            return np.array(self.embeddings[self.names.index(name)])
+
+    def match(self, embedding):
+        """Return (name, cosine similarity) of the nearest stored profile, or (None, -1.0) if the store is empty."""
+        with self.lock:
+            if not self.names:
+                return None, -1.0
+
+            scores = self.embeddings @ embedding
+            best = int(np.argmax(scores))
+            return self.names[best], float(scores[best])
+
+    def enroll(self, name, embedding):
+        """Add a segment embedding to the profile of name (created if needed) and persist the store."""
+        embedding = normalize(np.asarray(embedding, dtype=np.float32))
+
+        with self.lock:
+            # Move the memory mapped rows into memory before modifying them
+            if self.embeddings is None:
+                embeddings = np.empty((0, embedding.shape[-1]), dtype=np.float32)
+            else:
+                embeddings = np.array(self.embeddings)
+
+            if name in self.names:
+                i = self.names.index(name)
+                self.enrollments[i] = min(self.enrollments[i] + 1, self.max_enrollments)
+                embeddings[i] = rolling_average(embeddings[i], embedding, self.enrollments[i])
+            else:
+                self.names.append(name)
+                self.enrollments.append(1)
+                embeddings = np.vstack([embeddings, embedding])
+
+            self.embeddings = embeddings
+            self.save()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.names)
@@ -1,7 +1,10 @@
-import numpy as np
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum, auto
-from utils import emit
+from utils import emit, join_transcriptions
+from tracing import mark, observe
+from speech_to_text.audioRingBuffer import SpeechBuffer
 from speech_to_text.asrInterface import (
     IVADModel,
     IOnlineTranscriptionModel,
@@ -11,6 +14,14 @@ from speech_to_text.asrInterface import (
 )
 
 
+def internal_pause_silence_ms(endpoint_silence_ms, chunk_ms, min_pause_ms=100):
+    """
+    Shortest silence taken for an internal pause. The silence is only measured at the end of each chunk, so a pause
+    is seen before the endpoint when it ends up to one chunk short of it.
+    """
+    return max(endpoint_silence_ms - chunk_ms, min_pause_ms)
+
+
 class SpeechRecognizerState(Enum):
     ONLINE = auto()
     OFFLINE = auto()
@@ -32,6 +43,11 @@ class SpeechRecognizer:
         accumulated_speech_threshold=50,
         is_ending_counter_threshold=2,
         is_idle_counter_threshold=8,
+        incremental_offline=False,
+        endpoint_silence_ms=None,
+        idle_silence_ms=None,
+        pause_silence_ms=None,
+        tracer=None,
     ):
         self.vad_model = vad_model
 
@@ -56,67 +72,177 @@ class SpeechRecognizer:
         self.is_idle_counter = 0
         self.is_idle_counter_threshold = is_idle_counter_threshold
 
+        # Silence (ms) after the speech that ends an utterance and a turn, used instead of the counters above
+        # when the VAD model measures it
+        self.endpoint_silence_ms = endpoint_silence_ms
+        self.idle_silence_ms = idle_silence_ms if idle_silence_ms is not None else endpoint_silence_ms
+        # Shorter silence that is an internal pause, where incremental_offline decodes the speech so far. The VAD
+        # must close its segments after that much silence to measure it
+        self.pause_silence_ms = pause_silence_ms
+
         self.text_2pass_offline = ""
         self.text_2pass_online = ""
 
         self.sv_model = sv_model
         self.initial_speaker = None
+        self.active_speaker = None
 
-        self.accumulated_speech = []
+        # Preallocated for a whole utterance, the offline pass gets a snapshot of it
+        self.accumulated_speech = SpeechBuffer(accumulated_speech_threshold + 2, CHUNK)
         self.accumulated_speech_threshold = accumulated_speech_threshold
 
+        # The offline pass runs on its own single worker so the audio thread keeps up with the microphone,
+        # the worker also keeps the results in order. With incremental_offline every segment delimited by an
+        # internal pause is decoded right away, so at the end of the turn only the last segment is left
+        self.incremental_offline = incremental_offline
+        self.offline_executor = ThreadPoolExecutor(max_workers=1)
+        # Closing may race with the audio thread's last chunk if it did not stop in time
+        self.offline_lock = threading.Lock()
+        self.closed = False
+        self.offline_segments = []
+        self.offline_result = None
+        self.transcription_lock = threading.Lock()
+
         self.socketio = socketio
+        self.tracer = tracer
 
     def process_audio_chunk(self, audio_data):
         """Process a single audio chunk using VAD and ASR models."""
         if audio_data is None:
             return
-        emit(self.socketio, "user_idle_counter", {"counter": self.is_idle_counter_threshold - self.is_idle_counter})
-        user_speaking = self.vad_model.detect(audio_data) and self.sv_model.verify(audio_data)
+        start = time.monotonic()
+        speech_detected = self.vad_model.detect(audio_data)
+        observe(self.tracer, "vad", time.monotonic() - start)
+        user_speaking = speech_detected and self.sv_model.verify(audio_data)
+
+        if user_speaking:
+            # A new turn starts with the first speech after the previous one went idle
+            if self.state == SpeechRecognizerState.IDLE and self.tracer is not None:
+                self.tracer.start_turn()
+            mark(self.tracer, "vad_speech")
+
+        # The SV model picks the closest of the enrolled speakers
+        active_speaker = self.sv_model.get_active_speaker()
+        if user_speaking and active_speaker != self.active_speaker:
+            self.active_speaker = active_speaker
+            emit(self.socketio, "active_speaker", {"speaker": active_speaker})
 
         # Online
         if user_speaking:
             online_transcription = self.online_model.online_transcribe(audio_data)
 
-            self.text_2pass_online += online_transcription
+            with self.transcription_lock:
+                self.text_2pass_online += online_transcription
+            mark(self.tracer, "online_transcript")
             self.accumulated_speech.append(audio_data)
             emit(self.socketio, "online_transcription", {"message": online_transcription})
 
             self.set_state(SpeechRecognizerState.ONLINE)
 
+        # With a streaming VAD the turn is endpointed on the measured silence, even within the chunk where the
+        # speech ended, instead of counting whole chunks
+        trailing_silence = self.vad_model.trailing_silence_ms() if self.endpoint_silence_ms is not None else None
+        if trailing_silence is not None:
+            speech_ending = trailing_silence >= self.endpoint_silence_ms
+            speech_idle = trailing_silence >= self.idle_silence_ms
+            pausing = self.state == SpeechRecognizerState.ONLINE and speech_ending
+            internal_pause = (
+                self.state == SpeechRecognizerState.ONLINE
+                and self.pause_silence_ms is not None
+                and self.pause_silence_ms <= trailing_silence < self.endpoint_silence_ms
+            )
+        else:
+            pausing = self.state == SpeechRecognizerState.ONLINE and not user_speaking
+            internal_pause = False
+            # The idle counter only means something to the client when the turns are endpointed on it
+            emit(
+                self.socketio, "user_idle_counter", {"counter": self.is_idle_counter_threshold - self.is_idle_counter}
+            )
+
         # Offline
-        if (self.state == SpeechRecognizerState.ONLINE and not user_speaking) or len(
-            self.accumulated_speech
-        ) > self.accumulated_speech_threshold:
+        if pausing or len(self.accumulated_speech) > self.accumulated_speech_threshold:
             self.is_ending_counter += 1
-            if (
-                self.is_ending_counter >= self.is_ending_counter_threshold
-                or len(self.accumulated_speech) > self.accumulated_speech_threshold
-            ):
-                audio_data = np.concatenate(self.accumulated_speech)
+            if trailing_silence is None:
+                speech_ending = self.is_ending_counter >= self.is_ending_counter_threshold
 
-                self.sv_model.set_initial_reference(audio_data)
-
-                offline_transcription = self.offline_model.offline_transcribe(audio_data)
-                self.text_2pass_online = ""
-                self.text_2pass_offline += offline_transcription
-                emit(self.socketio, "offline_transcription", {"message": offline_transcription})
+            if speech_ending or len(self.accumulated_speech) > self.accumulated_speech_threshold:
+                # The online transcription is superseded by the offline one, which lands in the background
+                self.finish_offline()
+                with self.transcription_lock:
+                    self.text_2pass_online = ""
 
                 self.set_state(SpeechRecognizerState.OFFLINE)
+            elif self.incremental_offline and self.accumulated_speech:
+                # Internal pause, the user may continue speaking
+                self.submit_offline_segment()
+        elif internal_pause and self.incremental_offline and self.accumulated_speech:
+            # The streaming VAD closed the speech segment, but the silence is still shorter than the endpoint
+            self.submit_offline_segment()
 
         # Idle
-        if not self.state == SpeechRecognizerState.IDLE and not user_speaking:
-            self.is_idle_counter += 1
-            if self.is_idle_counter >= self.is_idle_counter_threshold:
+        if not self.state == SpeechRecognizerState.IDLE:
+            if not user_speaking:
+                self.is_idle_counter += 1
+            if trailing_silence is None:
+                speech_idle = not user_speaking and self.is_idle_counter >= self.is_idle_counter_threshold
+            if speech_idle:
                 self.set_state(SpeechRecognizerState.IDLE)
 
+    def transcribe_segment(self, audio_data):
+        self.sv_model.set_initial_reference(audio_data)
+        return self.offline_model.offline_transcribe(audio_data)
+
+    def submit_offline(self, fn, *args):
+        with self.offline_lock:
+            if self.closed:
+                return None
+            return self.offline_executor.submit(fn, *args)
+
+    def submit_offline_segment(self):
+        audio_data = self.accumulated_speech.snapshot()
+        self.accumulated_speech.reset()
+        segment = self.submit_offline(self.transcribe_segment, audio_data)
+        if segment is not None:
+            self.offline_segments.append(segment)
+
+    def finish_offline(self):
+        """Queue the offline transcription of the whole utterance, it is merged into text_2pass_offline in order."""
+        if self.accumulated_speech:
+            self.submit_offline_segment()
+
+        segments, self.offline_segments = self.offline_segments, []
+        self.offline_result = self.submit_offline(self.merge_offline, segments)
+
+    def merge_offline(self, segments):
+        # Runs on the offline worker after all the segments of the utterance. SenseVoice splits its input at VAD
+        # pauses and decodes the parts on their own, so where the cuts match, joining the segments in order gives
+        # the transcription of one pass over it all
+        offline_transcription = join_transcriptions(segment.result() for segment in segments)
+
+        with self.transcription_lock:
+            self.text_2pass_offline = join_transcriptions([self.text_2pass_offline, offline_transcription])
+        # The last utterance of the turn is the one the answer waits for
+        mark(self.tracer, "offline_transcript", replace=True)
+        emit(self.socketio, "offline_transcription", {"message": offline_transcription})
+
+    def offline_pending(self):
+        # The worker runs in submission order, so the latest merge being done means all of them are
+        return self.offline_result is not None and not self.offline_result.done()
+
+    def close(self):
+        with self.offline_lock:
+            self.closed = True
+            self.offline_executor.shutdown(wait=False, cancel_futures=True)
+
     def get_transcription(self):
-        return self.text_2pass_offline + self.text_2pass_online
+        with self.transcription_lock:
+            return self.text_2pass_offline + self.text_2pass_online
 
     # For downstream processing to indicate that task has been completed
     def reset_external_transcription(self):
-        self.text_2pass_offline = ""
-        self.text_2pass_online = ""
+        with self.transcription_lock:
+            self.text_2pass_offline = ""
+            self.text_2pass_online = ""
         emit(self.socketio, "reset_transcription", {"reset": True})
 
     def update_display(self):
@@ -130,12 +256,13 @@ class SpeechRecognizer:
             emit(self.socketio, "listening_to_user", {"listening": True})
         else:
             self.listening_to_user_event.clear()
+            mark(self.tracer, "idle")
 
     def reset_flags(self):
         if self.state == SpeechRecognizerState.IDLE:
             self.is_idle_counter = 0
         elif self.state == SpeechRecognizerState.OFFLINE:
-            self.accumulated_speech = []
+            self.accumulated_speech.reset()
             self.is_ending_counter = 0
             self.is_idle_counter = 0
             self.online_model.reset_online_cache()
@@ -0,0 +1,109 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+def synthetic_speech(seconds=1.0, rate=16000):
+    """A voiced-like signal (harmonics with a slow envelope plus noise), enough to drive every model's full path."""
+    t = np.arange(int(seconds * rate)) / rate
+    envelope = 0.5 * (1 - np.cos(2 * np.pi * t / seconds))
+    voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 8))
+    noise = np.random.default_rng(0).normal(0, 0.01, len(t))
+    return (0.2 * envelope * voice + noise).astype(np.float32)
+
+
+class StartupOrchestrator:
+    """
+    Loads the models concurrently in the background and warms each one up with a synthetic inference.
+
+    Models are registered with add(name, load, warm_up), load returns the model and warm_up(model) runs one
+    inference. Once every model is loaded and warm, on_ready(models) builds whatever depends on them and the
+    instance reports ready. status() has the per-model load and warm-up times for the readiness endpoint.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.loaders = {}
+        self.models = {}
+        self.timings = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.ready_event = threading.Event()
+        self.started = None
+        self.ready_after_s = None
+
+    def add(self, name, load, warm_up=None):
+        self.loaders[name] = (load, warm_up)
+        self.timings[name] = {"state": "pending", "load_s": None, "warm_up_s": None}
+
+    def set_timing(self, name, **values):
+        with self.lock:
+            self.timings[name].update(values)
+
+    def load(self, name):
+        load, warm_up = self.loaders[name]
+
+        self.set_timing(name, state="loading")
+        start = time.perf_counter()
+        model = load()
+        self.set_timing(name, state="warming_up", load_s=time.perf_counter() - start)
+
+        if warm_up is not None:
+            start = time.perf_counter()
+            warm_up(model)
+            self.set_timing(name, warm_up_s=time.perf_counter() - start)
+
+        self.set_timing(name, state="ready")
+        print(f"Model {name} ready: {self.timings[name]}")
+        return model
+
+    def run(self, on_ready=None):
+        self.started = time.perf_counter()
+
+        # The models are independent, torch and ONNX Runtime release the GIL for most of the loading
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="startup") as executor:
+            futures = {name: executor.submit(self.load, name) for name in self.loaders}
+
+        for name, future in futures.items():
+            try:
+                self.models[name] = future.result()
+            except Exception as e:
+                self.errors[name] = str(e)
+                self.set_timing(name, state="failed")
+                print(f"Loading model {name} failed: {e}")
+
+        if self.errors:
+            return
+
+        if on_ready is not None:
+            try:
+                on_ready(self.models)
+            except Exception as e:
+                self.errors["on_ready"] = str(e)
+                print(f"Startup failed: {e}")
+                return
+        self.ready_after_s = time.perf_counter() - self.started
+        self.ready_event.set()
+        print(f"All models ready after {self.ready_after_s:.1f}s")
+
+    def start(self, on_ready=None):
+        """Run the startup in a background thread, so the server can answer readiness checks meanwhile."""
+        thread = threading.Thread(target=self.run, args=(on_ready,), daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self):
+        return self.ready_event.is_set()
+
+    def status(self):
+        with self.lock:
+            models = {name: dict(timing) for name, timing in self.timings.items()}
+
+        return {
+            "ready": self.is_ready(),
+            "failed": bool(self.errors),
+            "errors": dict(self.errors),
+            "ready_after_s": self.ready_after_s,
+            "models": models,
+        }
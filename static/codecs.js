@@ -0,0 +1,155 @@
+// Audio codecs matching audioCodecs.py, the codec is negotiated on connect (see websocket.js)
+
+const MULAW_MU = 255;
+
+function supportedCodecs() {
+  const codecs = [];
+  if ('AudioEncoder' in window && 'AudioDecoder' in window) {
+    codecs.push('opus');
+  }
+  return codecs.concat(['mulaw', 'pcm16']);
+}
+
+function mulawEncode(int16Array) {
+  const encoded = new Uint8Array(int16Array.length);
+  const scale = Math.log1p(MULAW_MU);
+  for (let i = 0; i < int16Array.length; i++) {
+    const x = int16Array[i] / 32768.0;
+    const y = Math.sign(x) * Math.log1p(MULAW_MU * Math.abs(x)) / scale;
+    encoded[i] = Math.round((y + 1) * 127.5);
+  }
+  return encoded;
+}
+
+// All 256 mu-law values decoded once
+const MULAW_TABLE = new Float32Array(256).map((_, i) => {
+  const y = i / 127.5 - 1;
+  return Math.sign(y) * Math.expm1(Math.abs(y) * Math.log1p(MULAW_MU)) / MULAW_MU;
+});
+
+function mulawDecode(bytes) {
+  const decoded = new Float32Array(bytes.length);
+  for (let i = 0; i < bytes.length; i++) {
+    decoded[i] = MULAW_TABLE[bytes[i]];
+  }
+  return decoded;
+}
+
+// A payload is the Opus packets of one chunk, each prefixed with its uint16 little-endian length
+function packPackets(packets) {
+  const length = packets.reduce((sum, packet) => sum + 2 + packet.length, 0);
+  const payload = new Uint8Array(length);
+  const view = new DataView(payload.buffer);
+  let offset = 0;
+  for (const packet of packets) {
+    view.setUint16(offset, packet.length, true);
+    payload.set(packet, offset + 2);
+    offset += 2 + packet.length;
+  }
+  return payload;
+}
+
+function unpackPackets(buffer) {
+  const bytes = new Uint8Array(buffer);
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  const packets = [];
+  let offset = 0;
+  while (offset < bytes.length) {
+    const length = view.getUint16(offset, true);
+    packets.push(bytes.subarray(offset + 2, offset + 2 + length));
+    offset += 2 + length;
+  }
+  return packets;
+}
+
+// Encodes mic chunks with WebCodecs, chunks are encoded one after the other so the packets stay in order
+class OpusEncoderStream {
+  constructor(sampleRate) {
+    this.sampleRate = sampleRate;
+    this.timestamp = 0;
+    this.packets = [];
+    this.pending = Promise.resolve();
+    this.encoder = new AudioEncoder({
+      output: chunk => {
+        const packet = new Uint8Array(chunk.byteLength);
+        chunk.copyTo(packet);
+        this.packets.push(packet);
+      },
+      error: e => console.error('Opus encoding failed:', e),
+    });
+    this.encoder.configure({ codec: 'opus', sampleRate, numberOfChannels: 1, bitrate: 24000 });
+  }
+
+  encode(float32Array) {
+    const encoded = this.pending.then(async () => {
+      this.encoder.encode(new AudioData({
+        format: 'f32',
+        sampleRate: this.sampleRate,
+        numberOfFrames: float32Array.length,
+        numberOfChannels: 1,
+        timestamp: this.timestamp,
+        data: float32Array,
+      }));
+      this.timestamp += float32Array.length * 1e6 / this.sampleRate;
+      await this.encoder.flush();
+      const payload = packPackets(this.packets);
+      this.packets = [];
+      return payload;
+    });
+    this.pending = encoded.catch(() => {});
+    return encoded;
+  }
+}
+
+// Decodes audio frames with WebCodecs, in the order they arrive
+class OpusDecoderStream {
+  constructor() {
+    this.sampleRate = null;
+    this.decoder = null;
+    this.timestamp = 0;
+    this.frames = [];
+    this.pending = Promise.resolve();
+  }
+
+  configure(sampleRate) {
+    this.sampleRate = sampleRate;
+    this.decoder = new AudioDecoder({
+      output: audioData => {
+        const samples = new Float32Array(audioData.numberOfFrames);
+        audioData.copyTo(samples, { planeIndex: 0, format: 'f32-planar' });
+        audioData.close();
+        this.frames.push(samples);
+      },
+      error: e => console.error('Opus decoding failed:', e),
+    });
+    this.decoder.configure({ codec: 'opus', sampleRate, numberOfChannels: 1 });
+  }
+
+  decode(buffer, sampleRate, length) {
+    const decoded = this.pending.then(async () => {
+      if (this.sampleRate !== sampleRate) {
+        this.configure(sampleRate);
+      }
+      for (const packet of unpackPackets(buffer)) {
+        this.decoder.decode(new EncodedAudioChunk({ type: 'key', timestamp: this.timestamp, data: packet }));
+        this.timestamp += 20000;
+      }
+      await this.decoder.flush();
+
+      // Join the frames and drop the padding of the last one
+      const samples = new Float32Array(length);
+      let offset = 0;
+      for (const frame of this.frames) {
+        if (offset >= length) break;
+        samples.set(frame.subarray(0, Math.max(0, length - offset)), offset);
+        offset += frame.length;
+      }
+      this.frames = [];
+      return samples;
+    });
+    this.pending = decoded.catch(() => {});
+    return decoded;
+  }
+}
+
+export { supportedCodecs, mulawEncode, mulawDecode, OpusEncoderStream, OpusDecoderStream };
@@ -1,4 +1,5 @@
-import { socket } from './websocket.js';
+import { socket, AUDIO_TRANSPORT } from './websocket.js';
+import { mulawDecode, OpusDecoderStream } from './codecs.js';
 import {resetInterruptedable} from './ui.js';
 
 let audioQueue = [];
@@ -6,6 +7,11 @@ let isPlaying = false;
 let stopPlayback = false;
 let currentSource = null;
 let stopWhenDone = false;
+// Highest audio frame sequence number received
+let lastSeq = 0;
+// Frames are decoded one after the other, so they are queued in the order they arrived
+let decoding = Promise.resolve();
+let opusDecoder = null;
 
 // Create a persistent AudioContext
 const audioCtx = new (window.AudioContext || window.webkitAudioContext)();
@@ -17,6 +23,8 @@ socket.on("listening_to_user", (data) => {
         stopPlayback = true;
         resetInterruptedable();
         audioQueue = []; // Clear the queue
+        // The dropped frames count as played for the server's flow control
+        ackFrame(lastSeq);
         if (currentSource) {
             currentSource.stop();
             currentSource = null;
@@ -39,13 +47,71 @@ socket.on("audio_stream", (data) => {
     const { samplerate, samples } = data;
     const { byteArray, sampleRate } = decodeBase64Audio(samples, samplerate);
 
-    audioQueue.push({ byteArray, sampleRate });
+    enqueueAudio({ samples: int16ToFloat32(byteArray), sampleRate, seq: data.seq });
+});
+
+// Handle incoming binary audio frames, the samples arrive as an ArrayBuffer
+socket.on("audio_frame", (data) => {
+    const { seq, samplerate, format, samples } = data;
+    if (seq <= lastSeq) {
+        console.warn(`Dropping out of order audio frame ${seq}`);
+        return;
+    }
+    if (seq > lastSeq + 1 && lastSeq > 0) {
+        console.warn(`Missing audio frames ${lastSeq + 1} to ${seq - 1}`);
+    }
+    lastSeq = seq;
+
+    decoding = decoding
+        .then(() => decodeFrame(data))
+        .then(float32 => {
+            if (stopPlayback) {
+                ackFrame(seq);
+            } else {
+                enqueueAudio({ samples: float32, sampleRate: samplerate, seq });
+            }
+        })
+        .catch(e => console.error(`Decoding audio frame ${seq} failed:`, e));
+});
+
+function decodeFrame({ codec, format, samplerate, length, samples }) {
+    if (codec === 'opus') {
+        opusDecoder = opusDecoder || new OpusDecoderStream();
+        return opusDecoder.decode(samples, samplerate, length);
+    }
+    if (codec === 'mulaw') {
+        return Promise.resolve(mulawDecode(new Uint8Array(samples)));
+    }
+    return Promise.resolve(
+        format === 'float32' ? new Float32Array(samples) : int16ToFloat32(new Int16Array(samples))
+    );
+}
+
+function enqueueAudio(frame) {
+    if (frame.seq != null) {
+        lastSeq = Math.max(lastSeq, frame.seq);
+    }
+    audioQueue.push(frame);
 
     // Start playback if not already playing
     if (!isPlaying) {
         playQueue();
     }
-});
+}
+
+function ackFrame(seq) {
+    if (AUDIO_TRANSPORT.flow_control && seq) {
+        socket.emit("audio_frame_ack", { seq });
+    }
+}
+
+function int16ToFloat32(int16Array) {
+    const float32 = new Float32Array(int16Array.length);
+    for (let i = 0; i < int16Array.length; i++) {
+        float32[i] = int16Array[i] / 32767.0; // Normalize PCM data
+    }
+    return float32;
+}
 
 // Function to decode Base64 PCM audio
 function decodeBase64Audio(base64String, sampleRate) {
@@ -72,16 +138,21 @@ function playQueue() {
         resetInterruptedable();
         return;
     }
+    if (audioQueue.length == 0) {
+        // The next frame is still on its way, enqueueAudio restarts playback
+        isPlaying = false;
+        return;
+    }
 
     isPlaying = true;
-    const { byteArray, sampleRate } = audioQueue.shift();
+    const { samples, sampleRate, seq } = audioQueue.shift();
 
     // Create an audio buffer
-    const buffer = audioCtx.createBuffer(1, byteArray.length, sampleRate);
-    const channelData = buffer.getChannelData(0);
-    for (let i = 0; i < byteArray.length; i++) {
-        channelData[i] = byteArray[i] / 32767.0; // Normalize PCM data
-    }
+    const buffer = audioCtx.createBuffer(1, samples.length, sampleRate);
+    buffer.copyToChannel(samples, 0);
+
+    // Let the server send the next frame while this one plays
+    ackFrame(seq);
 
     // Stop previous audio source if needed
     if (currentSource) {
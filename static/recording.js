@@ -1,4 +1,5 @@
-import { socket } from './websocket.js';
+import { socket, AUDIO_TRANSPORT, negotiated } from './websocket.js';
+import { mulawEncode, OpusEncoderStream } from './codecs.js';
 
 const TARGET_SAMPLE_RATE = 16000;
 const SEND_FRAME_SIZE = 9600; // 600ms frame at 16kHz
@@ -10,6 +11,24 @@ let isRecording = false;
 let inputBuffer = new Float32Array(0);
 let pcmBuffer = new Int16Array(0);
 
+// Mic chunks sent and acknowledged by the server, with flow control at most a window of them is in flight
+let sentSeq = 0;
+let ackedSeq = 0;
+
+// Created on the first chunk once the codec is known
+let opusEncoder = null;
+
+socket.on('audio_ack', data => {
+  if (data.seq != null) {
+    ackedSeq = Math.max(ackedSeq, data.seq);
+    sendPendingChunks();
+  }
+});
+
+function canSend() {
+  return !AUDIO_TRANSPORT.flow_control || sentSeq - ackedSeq < AUDIO_TRANSPORT.flow_control_window;
+}
+
 async function startRecording() {
   try {
     if (!audioContext) {
@@ -63,8 +82,12 @@ async function handleAudioData(float32Array) {
   combined.set(pcmFrame, pcmBuffer.length);
   pcmBuffer = combined;
 
-  // Send chunks of appropriate size
-  while (pcmBuffer.length >= SEND_FRAME_SIZE) {
+  sendPendingChunks();
+}
+
+function sendPendingChunks() {
+  // Send chunks of appropriate size, the rest waits in the buffer for acks
+  while (pcmBuffer.length >= SEND_FRAME_SIZE && canSend()) {
     const chunk = pcmBuffer.slice(0, SEND_FRAME_SIZE);
     pcmBuffer = pcmBuffer.slice(SEND_FRAME_SIZE);
     sendAudioChunk(chunk);
@@ -99,8 +122,27 @@ function convertFloat32ToInt16(float32Array) {
 
 function sendAudioChunk(chunk) {
   if (chunk.length > 0) {
-    socket.emit('audio_data', chunk.buffer);
+    if (AUDIO_TRANSPORT.audio_transport === 'binary') {
+      // The samples go out as a binary attachment next to the sequence number
+      const seq = ++sentSeq;
+      encodeChunk(chunk).then(samples => socket.emit('audio_data', { seq, samples }));
+    } else {
+      socket.emit('audio_data', chunk.buffer);
+    }
+  }
+}
+
+function encodeChunk(chunk) {
+  // Resolves in the order the chunks were sent, the Opus encoder works through them one by one
+  if (negotiated.codec === 'opus') {
+    opusEncoder = opusEncoder || new OpusEncoderStream(TARGET_SAMPLE_RATE);
+    const float32 = Float32Array.from(chunk, sample => sample / 32768.0);
+    return opusEncoder.encode(float32).then(payload => payload.buffer);
+  }
+  if (negotiated.codec === 'mulaw') {
+    return Promise.resolve(mulawEncode(chunk).buffer);
   }
+  return Promise.resolve(chunk.buffer);
 }
 
 function flushBuffers() {
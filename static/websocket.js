@@ -1,12 +1,35 @@
-const socket = io.connect('http://127.0.0.1:8080');
+import { supportedCodecs } from './codecs.js';
+
+// Audio transport negotiated with the server on connect, see AudioTransport in audioTransport.py
+const AUDIO_TRANSPORT = {
+  audio_transport: 'binary',   // 'binary' attachments or the legacy base64 JSON
+  audio_format: 'float32',     // format of the TTS samples sent to us, 'int16' or 'float32'
+  flow_control: true,          // ack every frame in both directions
+  flow_control_window: 8,      // frames that may be unacked at once
+  audio_codecs: supportedCodecs(), // in order of preference, the server picks the first it supports
+};
+
+// The codec the server picked, used in both directions
+const negotiated = { codec: 'pcm16' };
+
+const socket = io.connect('http://127.0.0.1:8080', { auth: AUDIO_TRANSPORT });
 
 // Server communication handlers
 socket.on('audio_ack', data => {
-  console.log('Server acknowledgment:', data.message);
+  console.debug('Server acknowledged mic chunk', data.seq);
+});
+
+socket.on('audio_codec', data => {
+  negotiated.codec = data.codec;
+  console.log('Audio codec:', data.codec);
 });
 
 socket.on('connect_error', error => {
   console.error('WebSocket connection error:', error);
+  // The server refuses connections until its models are warm, keep trying
+  if (!socket.active) {
+    setTimeout(() => socket.connect(), 2000);
+  }
 });
 
-export { socket };
\ No newline at end of file
+export { socket, AUDIO_TRANSPORT, negotiated };
@@ -0,0 +1,66 @@
+import numpy as np
+from text_to_speech.audioCache import AudioCache
+
+
+def samples(value, length=1000):
+    return np.full(length, value, dtype=np.int16)
+
+
+def test_only_prewarmed_and_recurring_phrases_are_written_to_disk(tmp_path):
+    cache = AudioCache(directory=str(tmp_path), flush_interval=60)
+    cache.put("once", samples(1), 24000)
+    cache.put("prewarmed", samples(2), 24000, persist=True)
+    cache.put("twice", samples(3), 24000)
+    assert cache.get("twice") is not None
+
+    cache.flush()
+    assert sorted(cache.disk_index) == ["prewarmed", "twice"]
+
+    # A restart finds them on disk
+    reloaded = AudioCache(directory=str(tmp_path), flush_interval=60)
+    assert "once" not in reloaded
+    restored, sample_rate = reloaded.get("twice")
+    assert sample_rate == 24000 and np.all(restored == 3)
+
+
+def test_the_index_is_written_once_per_flush(tmp_path, monkeypatch):
+    cache = AudioCache(directory=str(tmp_path), flush_interval=60)
+    saves = []
+    save_index = cache.save_index
+    monkeypatch.setattr(cache, "save_index", lambda index: saves.append(len(index)) or save_index(index))
+
+    for i in range(20):
+        cache.put(f"phrase {i}", samples(i), 24000, persist=True)
+    assert saves == []
+
+    cache.flush()
+    assert saves == [20]
+
+
+def test_compaction_drops_the_least_used_entries(tmp_path):
+    # Room for 4 entries of 2000 bytes
+    cache = AudioCache(directory=str(tmp_path), max_disk_bytes=8000, flush_interval=60)
+    for i in range(4):
+        cache.put(f"phrase {i}", samples(i), 24000, persist=True)
+    cache.flush()
+    for _ in range(3):
+        cache.get("phrase 1")
+        cache.get("phrase 2")
+
+    cache.put("new", samples(9), 24000, persist=True)
+    cache.flush()
+
+    stats = cache.stats()
+    assert stats["compactions"] == 1
+    assert stats["disk_bytes"] <= 8000 * AudioCache.compact_ratio
+    assert sorted(cache.disk_index) == ["new", "phrase 1", "phrase 2"]
+    assert np.all(cache.get("phrase 2")[0] == 2)
+
+    reloaded = AudioCache(directory=str(tmp_path), flush_interval=60)
+    assert np.all(reloaded.get("new")[0] == 9)
+    assert np.all(reloaded.get("phrase 1")[0] == 1)
+
+
+def test_keys_keep_the_case_of_the_text():
+    assert AudioCache.key("US", "af", 1.0, "en-us") != AudioCache.key("us", "af", 1.0, "en-us")
+    assert AudioCache.key(" Sure,  I can.", "af", 1.0, "en-us") == AudioCache.key("Sure, I can.", "af", 1.0, "en-us")
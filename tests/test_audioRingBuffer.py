@@ -0,0 +1,53 @@
+import numpy as np
+from audioIngest import AudioIngestQueue
+from speech_to_text.audioRingBuffer import AudioRingBuffer, INT16_SCALE
+
+CHUNK_SIZE = 160
+
+
+def chunk(value):
+    return np.full(CHUNK_SIZE, value, dtype=np.int16)
+
+
+def test_producer_ahead_of_the_consumer_does_not_overwrite_queued_chunks():
+    ring = AudioRingBuffer(slots=4, chunk_size=CHUNK_SIZE)
+    audio_queue = AudioIngestQueue(release=ring.release)
+
+    # The consumer falls more than slots chunks behind
+    for value in range(1, 11):
+        audio_queue.put(ring.write(chunk(value)))
+    assert ring.stats()["exhausted"] == 6
+
+    for value in range(1, 11):
+        audio = audio_queue.get()
+        assert np.all(audio == np.float32(value) * INT16_SCALE)
+        audio_queue.release(audio)
+    assert ring.stats()["free"] == 4
+
+
+def test_released_slots_are_reused():
+    ring = AudioRingBuffer(slots=2, chunk_size=CHUNK_SIZE)
+
+    for value in range(10):
+        audio = ring.write(chunk(value))
+        assert audio.base is ring.buffer
+        ring.release(audio)
+    assert ring.stats()["exhausted"] == 0
+
+    # Twice or with arrays that are not slots, nothing happens
+    ring.release(audio)
+    ring.release(np.zeros(CHUNK_SIZE, dtype=np.float32))
+    assert ring.stats()["free"] == 2
+
+
+def test_coalesced_chunks_free_their_slots():
+    ring = AudioRingBuffer(slots=4, chunk_size=CHUNK_SIZE)
+    audio_queue = AudioIngestQueue(maxsize=1, policy="coalesce", release=ring.release)
+
+    for value in range(1, 4):
+        audio_queue.put(ring.write(chunk(value)))
+    # Merged into one new array when put
+    assert ring.stats()["free"] == 4
+
+    audio = audio_queue.get()
+    assert np.allclose(audio * 32768, np.repeat([1, 2, 3], CHUNK_SIZE))
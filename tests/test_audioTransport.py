@@ -0,0 +1,67 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from audioCodecs import MulawCodec
+from audioTransport import AudioTransport, to_float32
+
+
+def payload(value):
+    return MulawCodec().encode(np.full(160, value, dtype=np.int16))
+
+
+def test_a_blocked_session_does_not_stall_the_codec_pool():
+    executor = ThreadPoolExecutor(max_workers=1)
+    blocked = AudioTransport(binary=True, codec="mulaw", executor=executor)
+    other = AudioTransport(binary=True, codec="mulaw", executor=executor)
+
+    # Like a put on a full audio queue
+    release = threading.Event()
+    thread = threading.Thread(target=blocked.decode_mic, args=(payload(1000), lambda seq, audio: release.wait()))
+    thread.start()
+
+    decoded = []
+    other.decode_mic({"seq": 7, "samples": payload(1000)}, lambda seq, audio: decoded.append(seq))
+    assert decoded == [7]
+
+    release.set()
+    thread.join(1.0)
+    assert not thread.is_alive()
+    executor.shutdown()
+
+
+def test_compressed_chunks_are_delivered_in_order():
+    executor = ThreadPoolExecutor(max_workers=4)
+    transport = AudioTransport(binary=True, codec="mulaw", executor=executor)
+
+    delivered = []
+
+    def deliver(seq, audio):
+        # The first handler is the slowest to hand its chunk over
+        if seq == 0:
+            time.sleep(0.2)
+        delivered.append(seq)
+
+    threads = []
+    for seq in range(10):
+        thread = threading.Thread(target=transport.decode_mic, args=({"seq": seq, "samples": payload(seq)}, deliver))
+        thread.start()
+        threads.append(thread)
+        # The handlers of successive events run concurrently once their chunk is submitted
+        while transport.uplink_submitted <= seq:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(1.0)
+
+    assert delivered == list(range(10))
+    executor.shutdown()
+
+
+def test_int16_is_scaled_the_same_on_every_path():
+    samples = np.array([-32768, -1, 0, 1, 16384, 32767], dtype=np.int16)
+    expected = samples.astype(np.float32) / 32768
+
+    assert np.array_equal(to_float32(samples), expected)
+    for mic_buffer_slots in [0, 4]:
+        transport = AudioTransport(binary=True, codec="pcm16", mic_buffer_slots=mic_buffer_slots)
+        assert np.array_equal(transport.decode_payload(samples.tobytes()), expected)
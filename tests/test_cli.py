@@ -0,0 +1,81 @@
+import argparse
+import json
+import time
+import numpy as np
+import cli
+from benchmarks.fakeOllama import FakeOllama
+from benchmarks.stubModels import StubVAD, StubTranscription, StubSpeakerVerification, StubTTS
+from utils import write_wav, SAMPLE_RATE
+
+
+def tone(seconds):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 200 * t)).astype(np.float32)
+
+
+def test_local_wav_source_answers_every_utterance(tmp_path, monkeypatch, capsys):
+    models = {
+        "vad": StubVAD(),
+        "asr": StubTranscription(),
+        "speaker_verification": StubSpeakerVerification(),
+        "tts": StubTTS(real_time_factor=0.0),
+    }
+    monkeypatch.setattr(cli, "load_models", lambda names, warm_up=True: {name: models[name] for name in names})
+
+    source = tmp_path / "two_turns.wav"
+    write_wav(str(source), np.concatenate([tone(1.2), np.zeros(6 * SAMPLE_RATE, np.float32), tone(1.2)]), SAMPLE_RATE)
+
+    # The second answer comes after the end of the file
+    fake = FakeOllama(ttft_s=1.0, token_interval_s=0.0)
+    fake.start()
+    try:
+        args = argparse.Namespace(
+            source=str(source),
+            sink=f"wav:{tmp_path / 'answers.wav'}",
+            user=None,
+            speed=3.0,
+            tail_silence=2.0,
+            timeout=20.0,
+            llm_model="fake",
+            llm_url=fake.base_url,
+            no_warm_up=True,
+        )
+        cli.run_local(args)
+    finally:
+        fake.stop()
+
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert [event["event"] for event in events] == ["transcription", "answer", "transcription", "answer"]
+    assert all(event["text"] for event in events)
+    assert fake.stats()["completed"] == 2
+    assert (tmp_path / "answers.wav").exists()
+
+
+def test_local_source_without_words_does_not_wait_for_an_answer(tmp_path, monkeypatch, capsys):
+    # Speech for the VAD that the offline pass finds no words in
+    models = {
+        "vad": StubVAD(),
+        "asr": StubTranscription(text=""),
+        "speaker_verification": StubSpeakerVerification(),
+        "tts": StubTTS(real_time_factor=0.0),
+    }
+    monkeypatch.setattr(cli, "load_models", lambda names, warm_up=True: {name: models[name] for name in names})
+
+    source = tmp_path / "cough.wav"
+    write_wav(str(source), tone(1.2), SAMPLE_RATE)
+    args = argparse.Namespace(
+        source=str(source),
+        sink="none",
+        user=None,
+        speed=6.0,
+        tail_silence=2.0,
+        timeout=20.0,
+        llm_model="fake",
+        llm_url="http://127.0.0.1:9",
+        no_warm_up=True,
+    )
+    started = time.monotonic()
+    cli.run_local(args)
+
+    assert time.monotonic() - started < 5.0
+    assert not [line for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
@@ -0,0 +1,84 @@
+import numpy as np
+from speech_to_text.asrInterface import IVADModel
+from speech_to_text.energyGateVAD import EnergyGateVAD
+from speech_to_text.funASR import FunASRStreamingVAD
+from utils import CHUNK_SIZE, SAMPLE_RATE, audio_rms
+
+rng = np.random.default_rng(0)
+
+
+def noise(rms):
+    return rng.normal(0, rms, CHUNK_SIZE).astype(np.float32)
+
+
+def quiet_vowel(rms):
+    # A 120 Hz voice with a few harmonics
+    t = np.arange(CHUNK_SIZE) / SAMPLE_RATE
+    audio = sum(np.sin(2 * np.pi * 120 * k * t) / k for k in range(1, 6))
+    return (audio * rms / audio_rms(audio)).astype(np.float32)
+
+
+class RecordingVAD(IVADModel):
+    def __init__(self, speech_rms):
+        self.speech_rms = speech_rms
+        self.calls = 0
+
+    def detect(self, audio_data):
+        self.calls += 1
+        return audio_rms(audio_data) >= self.speech_rms
+
+
+def test_quiet_speech_in_a_noisy_room_reaches_the_model():
+    model = RecordingVAD(speech_rms=0.02)
+    gate = EnergyGateVAD(model)
+    # The noise floor adapts to the room
+    for _ in range(100):
+        assert not gate.detect(noise(0.015))
+
+    for rms in [0.025, 0.03, 0.04]:
+        calls = model.calls
+        assert gate.detect(quiet_vowel(rms))
+        assert model.calls == calls + 1
+
+
+def test_silence_is_still_gated():
+    model = RecordingVAD(speech_rms=0.02)
+    gate = EnergyGateVAD(model)
+    for _ in range(20):
+        assert not gate.detect(noise(0.001))
+    assert model.calls == 0
+
+
+class ScriptedFsmnVAD:
+    """Returns the given segments per fed chunk, in the timeline of the audio it was fed."""
+
+    def __init__(self, script):
+        self.kwargs = {}
+        self.script = list(script)
+
+    def inference(self, input, kwargs=None, **cfg):
+        return [{"value": self.script.pop(0)}]
+
+
+def test_streaming_vad_is_only_skipped_between_segments():
+    vad = FunASRStreamingVAD.__new__(FunASRStreamingVAD)
+    vad.model = ScriptedFsmnVAD([[[300, -1]], [], [[-1, 1400]]])
+    vad.max_end_silence_time = 500
+    vad.RATE = SAMPLE_RATE
+    gate = EnergyGateVAD(vad.fork())
+
+    # Two silent chunks skipped, then speech starts 300 ms into the next one
+    assert not gate.detect(noise(0.001))
+    assert not gate.detect(noise(0.001))
+    assert gate.detect(quiet_vowel(0.05))
+    assert gate.model.speech_start_ms == 1500
+
+    # Within the segment a quiet chunk is passed on, the model closes the segment
+    assert gate.detect(noise(0.001))
+    assert gate.detect(noise(0.001))
+    assert gate.trailing_silence_ms() == 400
+
+    # Skipped from then on, the silence still grows
+    assert not gate.detect(noise(0.001))
+    assert gate.trailing_silence_ms() == 1000
+    assert gate.stats()["model_calls"] == 3
@@ -0,0 +1,138 @@
+import threading
+import time
+import numpy as np
+from speech_to_text.funASR import (
+    FunASRStreamingVAD,
+    FunASRUnifiedTranscription,
+    FunASRSpeakerVerification,
+)
+from speech_to_text.speakerProfileStore import SpeakerProfileStore, normalize
+
+
+class SharedKwargsModel:
+    """Like AutoModel.inference: the call settings go into the kwargs it is given, its own ones by default."""
+
+    def __init__(self):
+        self.kwargs = {"model": "fsmn-vad"}
+        self.caches = []
+
+    def inference(self, input, kwargs=None, **cfg):
+        kwargs = self.kwargs if kwargs is None else kwargs
+        kwargs.update(cfg)
+        self.caches.append(kwargs["cache"])
+        return [{"value": []}]
+
+
+def test_streaming_vad_sessions_do_not_share_the_model_kwargs():
+    vad = FunASRStreamingVAD.__new__(FunASRStreamingVAD)
+    vad.model = SharedKwargsModel()
+    vad.max_end_silence_time = 500
+    vad.RATE = 16000
+    first, second = vad.fork(), vad.fork()
+
+    first.detect(np.zeros(9600, np.float32))
+    second.detect(np.zeros(9600, np.float32))
+
+    assert vad.model.kwargs == {"model": "fsmn-vad"}
+    assert vad.model.caches[0] is first.cache and vad.model.caches[1] is second.cache
+
+
+class SharedKwargsSenseVoice:
+    """Like AutoModel.generate with a VAD model: the settings go into its own kwargs, read back after the VAD."""
+
+    def __init__(self):
+        self.kwargs = {"model": "SenseVoiceSmall"}
+
+    def generate(self, input, **cfg):
+        self.kwargs.update(cfg)
+        time.sleep(0.005)
+        return [{"text": self.kwargs["language"]}]
+
+
+def test_sessions_decode_with_their_own_language():
+    transcription = FunASRUnifiedTranscription.__new__(FunASRUnifiedTranscription)
+    transcription.model = SharedKwargsSenseVoice()
+    transcription.model_lock = threading.Lock()
+    results = {}
+
+    def transcribe(language):
+        session = transcription.fork()
+        session.set_language(language)
+        results[language] = {session.online_transcribe(np.zeros(160)) for _ in range(10)}
+
+    threads = [threading.Thread(target=transcribe, args=(language,)) for language in ["en", "zh", "ja", "ko"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"en": {"en"}, "zh": {"zh"}, "ja": {"ja"}, "ko": {"ko"}}
+
+
+class ScriptedSpeakerVerification(FunASRSpeakerVerification):
+    """The embedding of a chunk is the voice its first sample names."""
+
+    voices = {1: [1.0, 0.0, 0.0], 2: [0.0, 1.0, 0.0], 3: [0.0, 0.0, 1.0]}
+
+    def __init__(self, profile_store):
+        self.threshold = 0.35
+        self.rolling_reference = False
+        self.max_enrollments = 10
+        self.profile_store = profile_store
+        self.reference_embeddings = None
+        self.reference_names = []
+        self.enrollments = []
+        self.active_speaker = None
+        self.speaker_name = None
+        self.persist_profile = False
+
+    def embed(self, audio_data):
+        return normalize(np.array(self.voices[int(audio_data[0])], dtype=np.float32))
+
+
+def voice(number):
+    return np.full(160, number, dtype=np.float32)
+
+
+def test_other_stored_speakers_do_not_pass_a_named_session(tmp_path):
+    store = SpeakerProfileStore(str(tmp_path))
+    store.enroll("alice", ScriptedSpeakerVerification.voices[1])
+    store.enroll("bob", ScriptedSpeakerVerification.voices[2])
+
+    verification = ScriptedSpeakerVerification(store)
+    verification.set_speaker("alice")
+    assert verification.verify(voice(1)) and verification.get_active_speaker() == "alice"
+    assert not verification.verify(voice(2))
+    assert not verification.verify(voice(3))
+    assert verification.reference_names == ["alice"]
+
+
+def test_unnamed_sessions_do_not_adopt_stored_profiles(tmp_path):
+    store = SpeakerProfileStore(str(tmp_path))
+    store.enroll("alice", ScriptedSpeakerVerification.voices[1])
+
+    verification = ScriptedSpeakerVerification(store)
+    verification.set_initial_reference(voice(1))
+    assert verification.reference_names == [None]
+    assert store.names == ["alice"]
+
+
+def test_only_authenticated_speakers_update_their_stored_profile(tmp_path):
+    store = SpeakerProfileStore(str(tmp_path))
+
+    # A name the client claims is used for the session, but is not written to the store
+    claimed = ScriptedSpeakerVerification(store)
+    claimed.set_speaker("alice")
+    claimed.set_initial_reference(voice(2))
+    assert claimed.reference_names == ["alice"]
+    assert store.get("alice") is None
+
+    authenticated = ScriptedSpeakerVerification(store)
+    authenticated.set_speaker("alice", persist=True)
+    authenticated.set_initial_reference(voice(1))
+    assert np.allclose(store.get("alice"), ScriptedSpeakerVerification.voices[1])
+    assert claimed.profile_count() == 1
+
+    # The claimed session picks up the profile enrolled since, the claimant's own voice is not in it
+    assert claimed.verify(voice(1))
+    assert np.allclose(store.get("alice"), ScriptedSpeakerVerification.voices[1])
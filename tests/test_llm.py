@@ -0,0 +1,45 @@
+import time
+from langchain_core.messages import HumanMessage, SystemMessage
+from benchmarks.fakeOllama import FakeOllama
+from llm import GenerationHandle
+
+MESSAGES = [SystemMessage(content="Be brief."), HumanMessage(content="How should I start learning the piano?")]
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_generation_streams_the_answer():
+    fake = FakeOllama(ttft_s=0.0, token_interval_s=0.0)
+    fake.start()
+    try:
+        generation = GenerationHandle("fake", MESSAGES, base_url=fake.base_url)
+        assert "".join(generation.tokens()).startswith("Sure. Start with")
+        assert fake.stats()["completed"] == 1
+    finally:
+        fake.stop()
+
+
+def test_cancel_before_the_first_token_releases_the_server_stream():
+    fake = FakeOllama(ttft_s=3.0)
+    fake.start()
+    try:
+        generation = GenerationHandle("fake", MESSAGES, base_url=fake.base_url)
+        assert wait_for(lambda: fake.stats()["requests"] == 1)
+
+        start = time.monotonic()
+        generation.cancel()
+        generation.join(1.0)
+        assert not generation.thread.is_alive()
+        assert list(generation.tokens()) == []
+
+        # Long before the first token would have been sent
+        assert wait_for(lambda: fake.stats()["cancelled"] == 1, timeout=1.0)
+        assert time.monotonic() - start < 1.0
+        assert fake.stats()["tokens"] == 0
+    finally:
+        fake.stop()
@@ -0,0 +1,53 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from benchmarks.stubModels import StubTTS
+from text_to_speech.speechGenerator import SpeechGenerator
+from text_to_speech.textSegmenter import ThresholdSegmenter
+
+
+def wait_for_first_frame(generator, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while generator.seq == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return generator.seq > 0
+
+
+def speech_generator(executor):
+    return SpeechGenerator(
+        StubTTS(real_time_factor=0.0), threading.Event(), executor=executor, segmenter=ThresholdSegmenter(10)
+    )
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_speaking_from_the_first_segment_until_the_answer_is_sent(workers):
+    executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+    generator = speech_generator(executor)
+    generator.start()
+
+    generator.add_text("The first sentence of the answer. ")
+    # Emitted, while the LLM is still streaming the rest of the answer
+    assert wait_for_first_frame(generator)
+    time.sleep(0.1)
+    assert generator.is_speaking()
+
+    generator.add_text("And the last one.", buffered=False)
+    assert generator.idle_event.wait(2.0)
+    generator.close()
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_interrupted_answer_goes_idle(workers):
+    executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+    generator = speech_generator(executor)
+    generator.start()
+
+    generator.add_text("The first sentence of the answer. ")
+    assert wait_for_first_frame(generator)
+    assert generator.is_speaking()
+
+    # The user barges in, the rest of the answer never comes
+    generator.interrupt_event.set()
+    assert generator.idle_event.wait(2.0)
+    generator.close()
@@ -0,0 +1,141 @@
+import numpy as np
+from benchmarks.stubModels import StubVAD, StubTranscription, StubSpeakerVerification
+from speech_to_text.asrInterface import IVADModel, IUnifiedTranscriptionModel
+from speech_to_text.speechRecognizer import SpeechRecognizer, SpeechRecognizerState, internal_pause_silence_ms
+from utils import CHUNK_SIZE, SAMPLE_RATE
+
+
+def speech():
+    return np.full(CHUNK_SIZE, 0.1, dtype=np.float32)
+
+
+class ScriptedStreamingVAD(IVADModel):
+    """Reports like FunASRStreamingVAD: speech in the chunk, and the silence since the last segment closed."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.silence_ms = 0.0
+
+    def detect(self, audio_data):
+        speech, self.silence_ms = self.script.pop(0)
+        return speech
+
+    def trailing_silence_ms(self):
+        return self.silence_ms
+
+
+class RecordingTranscription(StubTranscription):
+    def __init__(self):
+        super().__init__()
+        self.offline_lengths = []
+
+    def offline_transcribe(self, audio_data):
+        self.offline_lengths.append(len(audio_data))
+        return super().offline_transcribe(audio_data)
+
+
+def streaming_recognizer(script):
+    transcription = RecordingTranscription()
+    recognizer = SpeechRecognizer(
+        vad_model=ScriptedStreamingVAD(script),
+        unified_model=transcription,
+        sv_model=StubSpeakerVerification(),
+        incremental_offline=True,
+        endpoint_silence_ms=200,
+        idle_silence_ms=500,
+        pause_silence_ms=100,
+    )
+    for _ in script:
+        recognizer.process_audio_chunk(speech())
+    recognizer.offline_result.result()
+    return recognizer, transcription
+
+
+def test_streaming_vad_pause_submits_the_segment_so_far():
+    # Speech, speech ending 150 ms before the end of the chunk, speech again, then the endpoint
+    recognizer, transcription = streaming_recognizer([(True, 0.0), (True, 150.0), (True, 0.0), (False, 750.0)])
+
+    assert transcription.offline_lengths == [2 * CHUNK_SIZE, CHUNK_SIZE]
+    assert recognizer.get_transcription() == f"{transcription.text} {transcription.text}"
+
+
+def test_streaming_vad_without_pause_decodes_the_utterance_once():
+    recognizer, transcription = streaming_recognizer([(True, 0.0), (True, 0.0), (True, 0.0), (False, 750.0)])
+
+    assert transcription.offline_lengths == [3 * CHUNK_SIZE]
+
+
+class PauseSplittingTranscription(IUnifiedTranscriptionModel):
+    """
+    Like SenseVoice behind its VAD: the input is cut at its pauses, every part is decoded on its own into a
+    punctuated sentence and the sentences are joined with a space. A word is a run of samples of the same value.
+    """
+
+    words = {1: "hello", 2: "world", 3: "how", 4: "are", 5: "you"}
+    min_pause = SAMPLE_RATE // 10
+
+    def __init__(self):
+        self.calls = 0
+
+    def online_transcribe(self, audio_data):
+        return ""
+
+    def offline_transcribe(self, audio_data):
+        self.calls += 1
+        sentences, words, silence, previous = [], [], 0, 0
+        for value in audio_data.astype(int):
+            silence = silence + 1 if value == 0 else 0
+            if silence == self.min_pause and words:
+                sentences.append(" ".join(words).capitalize() + ".")
+                words = []
+            if value and value != previous:
+                words.append(self.words[value])
+            previous = value
+        if words:
+            sentences.append(" ".join(words).capitalize() + ".")
+        return " ".join(sentences)
+
+
+def test_incremental_offline_matches_one_pass_over_the_utterance():
+    def chunk(*parts):
+        # (word, samples) parts, completed with silence
+        audio = np.concatenate([np.full(length, word, np.float32) for word, length in parts])
+        return np.concatenate([audio, np.zeros(CHUNK_SIZE - len(audio), np.float32)])
+
+    chunks = [
+        chunk((3, 4800), (4, 4800)),
+        # A 300 ms pause after "you"
+        chunk((5, 4800)),
+        chunk((1, 4800), (2, 4800)),
+    ]
+    transcription = PauseSplittingTranscription()
+    recognizer = SpeechRecognizer(
+        vad_model=ScriptedStreamingVAD([(True, 0.0), (True, 300.0), (True, 0.0), (False, 600.0)]),
+        unified_model=transcription,
+        sv_model=StubSpeakerVerification(),
+        incremental_offline=True,
+        endpoint_silence_ms=500,
+        idle_silence_ms=1000,
+        pause_silence_ms=internal_pause_silence_ms(500, 600),
+    )
+    for audio in chunks + [np.zeros(CHUNK_SIZE, np.float32)]:
+        recognizer.process_audio_chunk(audio)
+    recognizer.offline_result.result()
+
+    # Decoded in two segments, as the user spoke
+    assert transcription.calls == 2
+    assert recognizer.get_transcription() == transcription.offline_transcribe(np.concatenate(chunks))
+    assert recognizer.get_transcription() == "How are you. Hello world."
+
+
+def test_offline_submissions_after_close_are_ignored():
+    recognizer = SpeechRecognizer(
+        vad_model=StubVAD(), unified_model=StubTranscription(), sv_model=StubSpeakerVerification()
+    )
+    recognizer.process_audio_chunk(speech())
+    assert recognizer.state == SpeechRecognizerState.ONLINE
+
+    # The audio thread still on its last chunk when the session is closed
+    recognizer.close()
+    recognizer.finish_offline()
+    assert not recognizer.offline_pending()
@@ -0,0 +1,37 @@
+from benchmarks.stubModels import StubTTS
+from text_to_speech.audioCache import AudioCache, CachedTTSModel
+from text_to_speech.textSegmenter import TextSegmenter
+from utils import preprocess_before_generation
+
+
+def stream(segmenter, answer):
+    segments = []
+    for token in answer.split(" "):
+        segments += segmenter.push(token + " ")
+    return segments + segmenter.flush()
+
+
+def test_short_first_sentences_are_merged_into_the_first_segment():
+    segments = stream(TextSegmenter(), "Sure. The capital of France is Paris, on the Seine.")
+    assert segments[0].strip() == "Sure. The capital of France is Paris,"
+
+
+def test_a_known_phrase_is_the_first_segment():
+    segmenter = TextSegmenter(known_phrases=["Sure.", "Of course!"])
+    segments = stream(segmenter, "Sure. The capital of France is Paris, on the Seine.")
+    assert segments[0] == "Sure."
+
+    # Only at the start of the answer
+    segmenter.reset()
+    segments = stream(segmenter, "The capital of France is Paris. Sure. Of course!")
+    assert "Sure." not in [segment.strip() for segment in segments]
+
+
+def test_prewarmed_phrases_are_served_from_the_cache():
+    phrases = ["Sure.", "Of course!", "Yes."]
+    tts = CachedTTSModel(StubTTS(real_time_factor=0.0), AudioCache())
+    tts.prewarm(phrases)
+
+    segments = stream(TextSegmenter(known_phrases=phrases), "Of course! Here is how to start.")
+    tts.synthesize_full(preprocess_before_generation(segments[0]))
+    assert tts.cache.stats()["hits"] == 1
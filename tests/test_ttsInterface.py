@@ -0,0 +1,18 @@
+import asyncio
+import numpy as np
+from text_to_speech.ttsInterface import ITTSModel
+
+
+class StreamingOnlyTTS(ITTSModel):
+    async def synthesize(self, text):
+        for word in text.split():
+            await asyncio.sleep(0)
+            yield np.full(len(word), 0.5, dtype=np.float32), 24000
+
+
+def test_synthesize_full_defaults_to_the_streamed_chunks():
+    samples, sample_rate = StreamingOnlyTTS().synthesize_full("one three")
+
+    assert sample_rate == 24000
+    assert len(samples) == len("one") + len("three")
+    assert np.all(samples == 0.5)
@@ -0,0 +1,311 @@
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from text_to_speech.ttsInterface import ITTSModel
+from audioTransport import to_int16
+
+
+class AudioCache:
+    """
+    Synthesized audio of short phrases, keyed by (text with normalized whitespace, voice, speed, language). The case
+    is kept, it can change the pronunciation ("US" and "us").
+
+    Samples are kept as int16 in memory up to max_bytes, the least recently used ones are evicted first. With
+    a directory, the phrases worth keeping across restarts, the prewarmed ones and the ones used a second time,
+    are also appended to audio.bin (index.json maps the keys to their offsets and hit counts). It is memory mapped
+    at startup so the cache survives restarts without loading it all into memory.
+
+    Disk writes are batched on a background thread, flush_interval seconds after the first one is queued. When
+    audio.bin would grow over max_disk_bytes it is compacted: the least used entries are dropped.
+    """
+
+    # Compaction frees more than needed, so it does not run again for every new phrase
+    compact_ratio = 0.75
+
+    def __init__(
+        self, max_bytes=64 * 1024 * 1024, directory=None, max_disk_bytes=512 * 1024 * 1024, flush_interval=2.0
+    ):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.directory = directory
+        self.flush_interval = flush_interval
+
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "disk_writes": 0,
+            "disk_evictions": 0,
+            "compactions": 0,
+        }
+
+        # key: [offset, length, sample_rate, hits]
+        self.disk_index = {}
+        self.disk_bytes = 0
+        self.disk_audio = None
+        # Entries waiting for the writer, and whether the hit counts of the index changed
+        self.pending = {}
+        self.index_dirty = False
+        self.flush_lock = threading.Lock()
+        self.flush_requested = threading.Event()
+        if directory is not None:
+            self.audio_path = os.path.join(directory, "audio.bin")
+            self.index_path = os.path.join(directory, "index.json")
+            os.makedirs(directory, exist_ok=True)
+            self.load()
+            threading.Thread(target=self.write_loop, daemon=True).start()
+
+    @staticmethod
+    def key(text, voice, speed, language):
+        return f"{voice}|{speed}|{language}|{' '.join(text.split())}"
+
+    def load(self):
+        if not (os.path.exists(self.audio_path) and os.path.exists(self.index_path)):
+            return
+
+        with open(self.index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        # Indexes written before the hit counts were kept
+        self.disk_index = {key: (location + [0])[:4] for key, location in index.items()}
+        # Entries appended after a crash but missing from the index are simply ignored
+        self.disk_bytes = os.path.getsize(self.audio_path)
+        self.map_disk_audio()
+
+    def map_disk_audio(self):
+        self.disk_audio = np.memmap(self.audio_path, dtype=np.int16, mode="r") if self.disk_bytes else None
+
+    def save_index(self, index):
+        # Write to a temporary file first so a crash never leaves a half written index behind
+        index_tmp = self.index_path + ".tmp"
+        with open(index_tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(index_tmp, self.index_path)
+
+    def get(self, key):
+        """Return (int16 samples, sample rate) or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                self.record_use(key, entry)
+                return entry
+
+            location = self.disk_index.get(key)
+            if location is None:
+                self.counters["misses"] += 1
+                return None
+
+            offset, length, sample_rate, _ = location
+            if self.disk_audio is None or offset + length > len(self.disk_audio):
+                # Appended since the file was mapped
+                self.map_disk_audio()
+            entry = (np.array(self.disk_audio[offset : offset + length]), sample_rate)
+            self.counters["disk_hits"] += 1
+            self.record_use(key, entry)
+            self.add_entry(key, entry)
+            return entry
+
+    def record_use(self, key, entry):
+        # A phrase used again is worth keeping on disk, the ones already there count their hits for compaction
+        if self.directory is None:
+            return
+        if key in self.disk_index:
+            self.disk_index[key][3] += 1
+            self.index_dirty = True
+        elif key not in self.pending:
+            self.pending[key] = entry
+        self.flush_requested.set()
+
+    def add_entry(self, key, entry):
+        if entry[0].nbytes > self.max_bytes:
+            return
+
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[0].nbytes
+
+        self.entries[key] = entry
+        self.bytes += entry[0].nbytes
+        while self.bytes > self.max_bytes:
+            _, (samples, _) = self.entries.popitem(last=False)
+            self.bytes -= samples.nbytes
+            self.counters["evictions"] += 1
+
+    def put(self, key, samples, sample_rate, persist=False):
+        """Cache the audio in memory, and on disk right away with persist (otherwise once it is used again)."""
+        samples = to_int16(samples)
+        with self.lock:
+            self.add_entry(key, (samples, sample_rate))
+            self.counters["stores"] += 1
+
+            if persist and self.directory is not None and key not in self.disk_index:
+                self.pending[key] = (samples, sample_rate)
+                self.flush_requested.set()
+
+    def write_loop(self):
+        while True:
+            self.flush_requested.wait()
+            # Whatever is queued meanwhile goes out in the same write
+            time.sleep(self.flush_interval)
+            self.flush_requested.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Writing the TTS cache failed: {e}")
+
+    def flush(self):
+        """Append the queued entries to audio.bin and save the index, compacting first when it would be too big."""
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                if not pending and not self.index_dirty:
+                    return
+                self.index_dirty = False
+                new_bytes = sum(samples.nbytes for samples, _ in pending.values())
+                compact = self.disk_bytes + new_bytes > self.max_disk_bytes
+
+            if compact:
+                self.compact(pending)
+                return
+
+            # Only this thread writes the file, readers map what is indexed
+            with open(self.audio_path, "ab") as f:
+                for samples, _ in pending.values():
+                    f.write(samples.tobytes())
+
+            with self.lock:
+                offset = self.disk_bytes // 2
+                for key, (samples, sample_rate) in pending.items():
+                    self.disk_index[key] = [offset, len(samples), sample_rate, 1]
+                    offset += len(samples)
+                self.disk_bytes += new_bytes
+                self.counters["disk_writes"] += len(pending)
+                index = {key: list(location) for key, location in self.disk_index.items()}
+            self.save_index(index)
+
+    def compact(self, pending):
+        """Rewrite audio.bin with the new entries and the most used ones, within compact_ratio of the limit."""
+        with self.lock:
+            # Including what was appended since it was last mapped
+            self.map_disk_audio()
+            disk_audio = self.disk_audio
+            # Most hits first, the most recently written first among equals
+            ranked = sorted(self.disk_index.items(), key=lambda item: (item[1][3], item[1][0]), reverse=True)
+
+        candidates = [(key, samples, sample_rate) for key, (samples, sample_rate) in pending.items()]
+        candidates += [
+            (key, disk_audio[offset : offset + length], sample_rate)
+            for key, (offset, length, sample_rate, _) in ranked
+        ]
+
+        # Written from the old mapping to a new file, then swapped in
+        budget = int(self.max_disk_bytes * self.compact_ratio)
+        audio_tmp = self.audio_path + ".tmp"
+        index = {}
+        offset = 0
+        with open(audio_tmp, "wb") as f:
+            for key, samples, sample_rate in candidates:
+                if samples.nbytes > budget:
+                    continue
+                budget -= samples.nbytes
+                f.write(samples.tobytes())
+                index[key] = [offset, len(samples), sample_rate, 1]
+                offset += len(samples)
+
+        with self.lock:
+            # With the hits counted meanwhile
+            for key, location in index.items():
+                if key in self.disk_index:
+                    location[3] = self.disk_index[key][3]
+            self.counters["disk_evictions"] += len(self.disk_index) + len(pending) - len(index)
+            self.counters["disk_writes"] += sum(1 for key in pending if key in index)
+            self.counters["compactions"] += 1
+            os.replace(audio_tmp, self.audio_path)
+            self.disk_index = index
+            self.disk_bytes = 2 * offset
+            self.map_disk_audio()
+            index = {key: list(location) for key, location in index.items()}
+        self.save_index(index)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries or key in self.disk_index or key in self.pending
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters["entries"] = len(self.entries)
+            counters["bytes"] = self.bytes
+            counters["disk_entries"] = len(self.disk_index)
+            counters["disk_bytes"] = self.disk_bytes
+            counters["disk_pending"] = len(self.pending)
+
+        lookups = counters["hits"] + counters["disk_hits"] + counters["misses"]
+        counters["hit_rate"] = (counters["hits"] + counters["disk_hits"]) / lookups if lookups else 0.0
+        return counters
+
+
+class CachedTTSModel(ITTSModel):
+    """Serves phrases of at most max_text_chars from an AudioCache and caches what the wrapped model synthesizes."""
+
+    def __init__(self, model: ITTSModel, cache: AudioCache, max_text_chars=120):
+        self.model = model
+        self.cache = cache
+        self.max_text_chars = max_text_chars
+
+    def cache_key(self, text):
+        if len(text) > self.max_text_chars:
+            return None
+        return self.cache.key(text, self.model.voice, self.model.speed, self.model.language)
+
+    async def synthesize(self, text):
+        key = self.cache_key(text)
+        cached = self.cache.get(key) if key is not None else None
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        async for samples, sample_rate in self.model.synthesize(text):
+            chunks.append(samples)
+            yield samples, sample_rate
+
+        # Only reached when the whole phrase was consumed, an interrupted one is not cached
+        if key is not None and chunks:
+            self.cache.put(key, np.concatenate(chunks), sample_rate)
+
+    def synthesize_full(self, text):
+        key = self.cache_key(text)
+        cached = self.cache.get(key) if key is not None else None
+        if cached is not None:
+            return cached
+
+        samples, sample_rate = self.model.synthesize_full(text)
+        if key is not None:
+            self.cache.put(key, samples, sample_rate)
+        return samples, sample_rate
+
+    def prewarm(self, phrases):
+        """Synthesize the phrases that are not cached yet, e.g. common first sentences, at startup."""
+        synthesized = 0
+        for phrase in phrases:
+            key = self.cache_key(phrase)
+            if key is None or key in self.cache:
+                continue
+            samples, sample_rate = self.model.synthesize_full(phrase)
+            self.cache.put(key, samples, sample_rate, persist=True)
+            synthesized += 1
+        return synthesized
+
+    def __getattr__(self, name):
+        # voice, speed, language... of the wrapped model
+        return getattr(self.model, name)
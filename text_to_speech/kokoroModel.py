@@ -12,3 +12,7 @@ class kokoroModel(ITTSModel):
     def synthesize(self, text):
         # Stream audio creation asynchronously in the background, yielding chunks as they are processed.
         return self.model.create_stream(text, voice=self.voice, speed=self.speed, lang=self.language)
+
+    def synthesize_full(self, text):
+        # Blocking, ONNX Runtime releases the GIL so several segments can be synthesized on a thread pool.
+        return self.model.create(text, voice=self.voice, speed=self.speed, lang=self.language)
@@ -1,8 +1,10 @@
 import asyncio
 import threading
-import base64
 from utils import preprocess_before_generation, emit
+from audioTransport import AudioTransport, to_int16
 from text_to_speech.ttsInterface import ITTSModel
+from text_to_speech.textSegmenter import ThresholdSegmenter
+from tracing import mark
 
 
 class SpeechGenerator:
@@ -12,19 +14,40 @@ class SpeechGenerator:
         interrupt_event,
         socketio=None,
         buffer_threshold=50,
+        executor=None,
+        lookahead=2,
+        segmenter=None,
+        transport=None,
+        tracer=None,
     ):
         self.model = model
+        # Decides where the streamed text is cut into segments to synthesize
+        self.segmenter = segmenter if segmenter is not None else ThresholdSegmenter(buffer_threshold)
+        # With an executor, up to lookahead segments are synthesized while the current one is emitted
+        self.executor = executor
+        self.lookahead = lookahead
+        self.interrupt_poll_interval = 0.02
+        # Encoding and flow control of the audio sent to the client
+        self.transport = transport if transport is not None else AudioTransport()
+        self.seq = 0
+        self.acked_seq = 0
+        self.ack_event = asyncio.Event()
 
         self.socketio = socketio
-        self.buffer_threshold = buffer_threshold
+        self.tracer = tracer
 
-        self.text_buffer = ""
         self.text_queue = asyncio.Queue()
         self.interrupt_event = interrupt_event
 
         self.loop = None
         self.loop_ready = threading.Event()  # New event to signal that the loop is ready
-        self.last_task_event = asyncio.Event()
+        # Cleared from the first segment of an answer until it has all been emitted or is interrupted
+        self.idle_event = threading.Event()
+        self.idle_event.set()
+
+        # Audio emitted for the current answer, collected when the caller wants it once all speech is sent
+        self.captured_audio = None
+        self.on_all_speech_sent = None
 
         # Start the asyncio loop in a dedicated thread.
         def run_loop():
@@ -38,41 +61,176 @@ class SpeechGenerator:
     async def generate_speech(self, text):
         text = preprocess_before_generation(text)
 
+        self.idle_event.clear()
         stream = self.model.synthesize(text)
 
         async for samples, sample_rate in stream:
             if self.interrupt_event.is_set():
                 break
-            # Convert samples to int16 PCM format.
-            samples = (samples * 32767).astype("int16")
-            audio_base64 = base64.b64encode(samples.tobytes()).decode("utf-8")
-            emit(self.socketio, "audio_stream", {"samplerate": sample_rate, "samples": audio_base64, "stopped": False})
+            await self.send_audio(samples, sample_rate)
 
-    async def process_queue(self):
-        while not self.interrupt_event.is_set():
+    def emit_audio(self, samples, sample_rate):
+        if self.captured_audio is not None:
+            self.captured_audio.append((to_int16(samples), sample_rate))
+
+        self.seq += 1
+        event, payload = self.transport.encode_audio(samples, sample_rate, self.seq)
+        emit(self.socketio, event, payload)
+        mark(self.tracer, "first_audio")
+
+    async def send_audio(self, samples, sample_rate):
+        # With flow control, wait until the client has caught up with all but window frames
+        while (
+            self.transport.flow_control
+            and self.seq - self.acked_seq >= self.transport.window
+            and not self.interrupt_event.is_set()
+        ):
+            self.ack_event.clear()
+            try:
+                await asyncio.wait_for(self.ack_event.wait(), self.interrupt_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        if self.interrupt_event.is_set():
+            return
+
+        if self.transport.compressed and self.transport.executor is not None:
+            # Encoding a chunk takes a few ms, keep it off the loop. Chunks are awaited one by one, so the
+            # stateful encoder still sees them in order
+            await self.loop.run_in_executor(self.transport.executor, self.emit_audio, samples, sample_rate)
+        else:
+            self.emit_audio(samples, sample_rate)
+
+    def ack(self, seq):
+        """The client played (or dropped) the audio frames up to seq, called from the Socket.IO handler."""
+        self.loop_ready.wait()
+        self.loop.call_soon_threadsafe(self.on_ack, seq)
+
+    def on_ack(self, seq):
+        self.acked_seq = max(self.acked_seq, seq)
+        self.ack_event.set()
+
+    async def play_audio(self, chunks):
+        """Emit already synthesized int16 chunks, e.g. a cached answer."""
+        self.idle_event.clear()
+        try:
+            for samples, sample_rate in chunks:
+                if self.interrupt_event.is_set():
+                    return
+                await self.send_audio(samples, sample_rate)
+                # Let the loop breathe between chunks
+                await asyncio.sleep(0)
+            emit(self.socketio, "all_speech_sent", {"all_sent": True})
+            mark(self.tracer, "all_audio_sent")
+        finally:
+            self.idle_event.set()
+
+    def is_speaking(self):
+        return not self.idle_event.is_set()
+
+    def speech_sent(self):
+        emit(self.socketio, "all_speech_sent", {"all_sent": True})
+        mark(self.tracer, "all_audio_sent")
+        if self.on_all_speech_sent is not None:
+            self.on_all_speech_sent(self.captured_audio)
+
+    async def dispatch_segments(self, pending):
+        """Start synthesizing the queued text segments on the executor, in order."""
+        while True:
             text = await self.text_queue.get()
-            await self.generate_speech(text)
             self.text_queue.task_done()
 
-            if self.last_task_event.is_set() and self.text_queue.empty():
-                emit(self.socketio, "all_speech_sent", {"all_sent": True})
-                break
+            if text is None:
+                await pending.put(None)
+                return
+
+            text = preprocess_before_generation(text)
+            if not text.strip():
+                continue
+
+            self.idle_event.clear()
+            # Blocks once lookahead segments are waiting to be emitted
+            await pending.put(self.loop.run_in_executor(self.executor, self.model.synthesize_full, text))
 
-        self.stop()
+    async def emit_segments(self, pending):
+        """Emit the synthesized segments strictly in the order they were queued."""
+        while True:
+            future = await pending.get()
+            if future is None:
+                self.speech_sent()
+                return
+
+            samples, sample_rate = await future
+            if self.interrupt_event.is_set():
+                return
+            await self.send_audio(samples, sample_rate)
+
+    async def process_queue_pipelined(self):
+        pending = asyncio.Queue(maxsize=self.lookahead)
+        tasks = [
+            asyncio.ensure_future(self.dispatch_segments(pending)),
+            asyncio.ensure_future(self.emit_segments(pending)),
+        ]
+
+        try:
+            # The emitter finishes the answer, the interrupt is a threading.Event so poll it
+            while not tasks[1].done() and not self.interrupt_event.is_set():
+                await asyncio.wait(tasks, timeout=self.interrupt_poll_interval, return_when=asyncio.FIRST_EXCEPTION)
+                if tasks[0].done() and not tasks[0].cancelled() and tasks[0].exception() is not None:
+                    break
+
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    print(f"Speech synthesis failed: {task.exception()}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Segments that did not start yet are dropped from the executor
+            while not pending.empty():
+                future = pending.get_nowait()
+                if future is not None:
+                    future.cancel()
+            self.idle_event.set()
+            self.stop()
+
+    async def process_queue(self):
+        if self.executor is not None:
+            await self.process_queue_pipelined()
+            return
+
+        try:
+            while not self.interrupt_event.is_set():
+                # The interrupt is a threading.Event, poll it while the answer is still being generated
+                try:
+                    text = await asyncio.wait_for(self.text_queue.get(), self.interrupt_poll_interval)
+                except asyncio.TimeoutError:
+                    continue
+                self.text_queue.task_done()
+
+                # None marks the end of the answer
+                if text is None:
+                    self.speech_sent()
+                    break
+
+                await self.generate_speech(text)
+        finally:
+            self.idle_event.set()
+            self.stop()
 
     def add_text(self, text, buffered=True):
         # Wait until the event loop is ready.
         self.loop_ready.wait()
-        self.text_buffer += text
 
-        if buffered:
-            self.last_task_event.set()
+        segments = self.segmenter.push(text)
+        if not buffered:
+            segments += self.segmenter.flush()
+        if segments:
+            mark(self.tracer, "tts_segment_queued")
+        for segment in segments:
+            asyncio.run_coroutine_threadsafe(self.text_queue.put(segment), self.loop)
 
-        if self.text_buffer and (
-            not buffered or (len(self.text_buffer) >= self.buffer_threshold and self.text_buffer[-1] in " ,:;.!?\n")
-        ):
-            asyncio.run_coroutine_threadsafe(self.text_queue.put(self.text_buffer), self.loop)
-            self.text_buffer = ""
+        if not buffered:
+            asyncio.run_coroutine_threadsafe(self.text_queue.put(None), self.loop)
 
     def stop(self):
         # Use get_nowait() to clear the queue without awaiting.
@@ -81,8 +239,28 @@ class SpeechGenerator:
                 self.text_queue.get_nowait()
         except asyncio.QueueEmpty:
             pass
-        self.text_buffer = ""
+        self.segmenter.reset()
 
-    def start(self):
-        self.last_task_event.clear()
+    def start(self, on_all_speech_sent=None):
+        """
+        Start speaking the text added from now on. on_all_speech_sent, if given, is called with the emitted audio
+        once the whole answer has been sent without interruption.
+        """
+        self.loop_ready.wait()
+        self.segmenter.reset()
+        # Frames of an interrupted answer the client dropped without acking do not count
+        self.acked_seq = self.seq
+        self.captured_audio = [] if on_all_speech_sent is not None else None
+        self.on_all_speech_sent = on_all_speech_sent
         asyncio.run_coroutine_threadsafe(self.process_queue(), self.loop)
+
+    def play(self, chunks):
+        self.loop_ready.wait()
+        self.acked_seq = self.seq
+        self.captured_audio = None
+        asyncio.run_coroutine_threadsafe(self.play_audio(chunks), self.loop)
+
+    def close(self):
+        # Stop the dedicated event loop, its thread exits with it.
+        self.loop_ready.wait()
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -0,0 +1,161 @@
+import re
+
+# Words whose trailing period does not end a sentence
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "approx", "fig", "inc", "ltd",
+    "jan", "feb", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+}
+
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*(?=\s)")
+CLAUSE_END = re.compile(r"[,;:](?=\s)")
+WORD_BEFORE = re.compile(r"([\w.]+)$")
+
+
+class ThresholdSegmenter:
+    """Flush the text once it is at least threshold characters long and ends in punctuation or a space."""
+
+    def __init__(self, threshold=50):
+        self.threshold = threshold
+        self.buffer = ""
+
+    def reset(self):
+        self.buffer = ""
+
+    def push(self, text):
+        self.buffer += text
+        if self.buffer and len(self.buffer) >= self.threshold and self.buffer[-1] in " ,:;.!?\n":
+            return self.flush()
+        return []
+
+    def flush(self):
+        segment, self.buffer = self.buffer, ""
+        return [segment] if segment else []
+
+
+class TextSegmenter:
+    """
+    Split streamed LLM text into segments for TTS, trading time to first audio against synthesis efficiency.
+
+    The first segment of an answer ends at the first clause boundary after first_min_chars, so speech starts
+    early. Later segments end at sentence boundaries (or a paragraph break) and may hold several sentences,
+    their target length grows by growth per segment up to max_chars. A period after an abbreviation, an
+    initial or a list number does not end a sentence, and no segment ends inside inline code, a code block,
+    emphasis or a link, which preprocess_before_generation could not strip once split.
+
+    An answer starting with one of known_phrases, e.g. the phrases prewarmed in the TTS cache, gets it as its first
+    segment even when it is shorter than first_min_chars, its audio is then ready at once.
+    """
+
+    def __init__(
+        self, first_min_chars=12, first_max_chars=60, min_chars=60, max_chars=300, growth=2.0, known_phrases=()
+    ):
+        self.first_min_chars = first_min_chars
+        self.first_max_chars = first_max_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.growth = growth
+        self.known_phrases = {" ".join(phrase.split()) for phrase in known_phrases}
+        self.reset()
+
+    def reset(self):
+        self.buffer = ""
+        self.segments = 0
+
+    def target_chars(self):
+        return min(self.max_chars, int(self.min_chars * self.growth ** max(self.segments - 1, 0)))
+
+    @staticmethod
+    def open_markdown(text):
+        """Whether text ends inside a markdown span."""
+        if text.count("```") % 2:
+            return True
+        # Inline code, bold and links, outside code blocks
+        text = re.sub(r"```.*?```", "", text, flags=re.DOTALL)
+        if text.count("`") % 2 or text.count("**") % 2 or text.count("[") > text.count("]"):
+            return True
+        return text.rfind("](") > text.rfind(")")
+
+    @staticmethod
+    def ends_sentence(text, match):
+        """Whether the punctuation matched by SENTENCE_END really ends a sentence."""
+        if "." not in match.group() or "!" in match.group() or "?" in match.group():
+            return True
+        word = WORD_BEFORE.search(text[: match.start()])
+        if word is None:
+            return True
+        word = word.group(1).lower()
+        if word in ABBREVIATIONS:
+            return False
+        # An initial, e.g. "J. R. R. Tolkien"
+        if len(word) == 1 and word.isalpha():
+            return False
+        # A list number at the start of a line, e.g. "1. "
+        line_start = text.rfind("\n", 0, match.start()) + 1
+        return not (word.isdigit() and not text[line_start : match.start() - len(word)].strip())
+
+    def boundaries(self, pattern):
+        return [
+            match.end()
+            for match in pattern.finditer(self.buffer)
+            if (pattern is not SENTENCE_END or self.ends_sentence(self.buffer, match))
+            and not self.open_markdown(self.buffer[: match.end()])
+        ]
+
+    def paragraph_boundaries(self):
+        return [
+            match.end()
+            for match in re.finditer(r"\n\s*\n|\n(?=\s*(?:[-*+]|\d+\.)\s)", self.buffer)
+            if not self.open_markdown(self.buffer[: match.end()])
+        ]
+
+    def word_boundary(self, limit):
+        """The last space before limit outside markdown, to split text without any punctuation."""
+        for match in reversed(list(re.finditer(r"\s+", self.buffer[:limit]))):
+            if match.start() > 0 and not self.open_markdown(self.buffer[: match.start()]):
+                return match.end()
+        return None
+
+    def split_at(self):
+        if self.segments == 0:
+            clauses = sorted(self.boundaries(SENTENCE_END) + self.boundaries(CLAUSE_END) + self.paragraph_boundaries())
+            known = [end for end in clauses if " ".join(self.buffer[:end].split()) in self.known_phrases]
+            if known:
+                return known[0]
+            clauses = [end for end in clauses if end >= self.first_min_chars]
+            if clauses and clauses[0] <= self.first_max_chars:
+                return clauses[0]
+            if len(self.buffer) > self.first_max_chars:
+                return (clauses[0] if clauses else None) or self.word_boundary(self.first_max_chars)
+            return None
+
+        target = self.target_chars()
+        sentences = [end for end in self.boundaries(SENTENCE_END) + self.paragraph_boundaries() if end >= target]
+        sentences = [end for end in sentences if end <= self.max_chars] or sentences[:1]
+        if sentences:
+            return max(sentences)
+
+        if len(self.buffer) > self.max_chars:
+            clauses = [end for end in self.boundaries(CLAUSE_END) if self.min_chars <= end <= self.max_chars]
+            return max(clauses) if clauses else self.word_boundary(self.max_chars)
+        return None
+
+    def push(self, text):
+        """Add streamed text and return the segments that are ready to be synthesized."""
+        self.buffer += text
+        segments = []
+        while True:
+            end = self.split_at()
+            if not end:
+                return segments
+            segment, self.buffer = self.buffer[:end], self.buffer[end:]
+            self.segments += 1
+            if segment.strip():
+                segments.append(segment)
+
+    def flush(self):
+        """Return what is left at the end of the answer."""
+        segment, self.buffer = self.buffer, ""
+        if not segment.strip():
+            return []
+        self.segments += 1
+        return [segment]
@@ -1,4 +1,6 @@
+import asyncio
 from abc import ABC, abstractmethod
+import numpy as np
 
 
 class ITTSModel(ABC):
@@ -6,3 +8,19 @@ class ITTSModel(ABC):
     def synthesize(self, text):
         # Stream audio creation asynchronously in the background, yielding chunks as they are processed.
         pass
+
+    def synthesize_full(self, text):
+        # Synthesize the whole text at once and return (samples, sample_rate), called from worker threads.
+        # Models that only stream get their chunks collected on an event loop of the calling thread.
+        async def collect():
+            chunks, sample_rate = [], None
+            async for samples, sample_rate in self.synthesize(text):
+                chunks.append(samples)
+            return chunks, sample_rate
+
+        chunks, sample_rate = asyncio.run(collect())
+        return (np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)), sample_rate
+
+    def warm_up(self, text="Hello, how can I help you?"):
+        # One synthesis at startup, the first one pays for the ONNX graph optimization.
+        self.synthesize_full(text)
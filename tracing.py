@@ -0,0 +1,239 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# Handoffs of a turn, in the order they usually happen. Each is recorded once per turn with a monotonic timestamp
+HANDOFFS = (
+    "chunk_received",
+    "vad_speech",
+    "online_transcript",
+    "offline_transcript",
+    "idle",
+    "answer_started",
+    "llm_first_token",
+    "tts_segment_queued",
+    "first_audio",
+    "barge_in",
+    "all_audio_sent",
+)
+
+# Marks of the answer, ignored until the answer of the turn started so a late frame of an interrupted answer does
+# not land in the next turn
+ANSWER_HANDOFFS = ("llm_first_token", "tts_segment_queued", "first_audio", "all_audio_sent")
+
+# Histograms of the time between two handoffs of a turn: (name, from, to)
+SPANS = (
+    ("vad_decision", "chunk_received", "vad_speech"),
+    ("online_transcript", "vad_speech", "online_transcript"),
+    ("endpoint", "offline_transcript", "idle"),
+    ("llm_first_token", "idle", "llm_first_token"),
+    ("first_segment", "llm_first_token", "tts_segment_queued"),
+    ("tts_first_audio", "tts_segment_queued", "first_audio"),
+    ("response", "idle", "first_audio"),
+    ("barge_in_detection", "chunk_received", "barge_in"),
+    ("turn", "chunk_received", "all_audio_sent"),
+)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Histograms (seconds) and counters shared by every session, rendered in the Prometheus text format, e.g.
+
+        assistant_response_seconds_bucket{le="0.5"} 12
+        assistant_response_seconds_sum 7.9
+        assistant_response_seconds_count 20
+    """
+
+    def __init__(self, prefix="assistant"):
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def render(self, gauges=None):
+        lines = []
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{self.prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.sum}")
+                lines.append(f"{metric}_count {histogram.count}")
+
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+                lines.append(f"{self.prefix}_{name}_total {value}")
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {self.prefix}_{name} gauge")
+            lines.append(f"{self.prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class TurnTrace:
+    def __init__(self, turn):
+        self.turn = turn
+        self.marks = {}
+
+    def spans(self):
+        return {
+            name: self.marks[end] - self.marks[start]
+            for name, start, end in SPANS
+            if start in self.marks and end in self.marks
+        }
+
+    def as_dict(self):
+        started = min(self.marks.values(), default=0.0)
+        return {
+            "turn": self.turn,
+            "marks_ms": {
+                name: round(1000 * (self.marks[name] - started), 1) for name in HANDOFFS if name in self.marks
+            },
+            "spans_s": self.spans(),
+            "completed": "all_audio_sent" in self.marks,
+        }
+
+
+class Tracer:
+    """
+    Per-session trace of the current turn, from the first chunk of the user's speech to the last audio frame of
+    the answer. Finished turns feed the spans into the shared Metrics and the last keep ones are kept for /stats.
+    Marks come from the audio, LLM and speech generation threads.
+    """
+
+    def __init__(self, metrics: Metrics, keep=10):
+        self.metrics = metrics
+        self.current = None
+        self.turns = 0
+        self.recent = deque(maxlen=keep)
+        self.lock = threading.Lock()
+
+    def start_turn(self):
+        with self.lock:
+            self.finish_locked()
+            self.turns += 1
+            self.current = TurnTrace(self.turns)
+
+    def mark(self, name, t=None, replace=False):
+        t = time.monotonic() if t is None else t
+        with self.lock:
+            trace = self.current
+            if trace is None or (name in ANSWER_HANDOFFS and "answer_started" not in trace.marks):
+                return
+            if replace or name not in trace.marks:
+                trace.marks[name] = t
+            if name == "all_audio_sent":
+                self.finish_locked()
+
+    def finish(self):
+        with self.lock:
+            self.finish_locked()
+
+    def finish_locked(self):
+        trace, self.current = self.current, None
+        if trace is None:
+            return
+
+        for name, duration in trace.spans().items():
+            self.metrics.observe(name, duration)
+        self.metrics.increment("turns" if "all_audio_sent" in trace.marks else "unfinished_turns")
+        self.recent.append(trace.as_dict())
+
+    def observe(self, name, value):
+        self.metrics.observe(name, value)
+
+    def traces(self):
+        with self.lock:
+            return list(self.recent)
+
+
+def mark(tracer, name, t=None, replace=False):
+    if tracer is not None:
+        tracer.mark(name, t, replace)
+
+
+def observe(tracer, name, value):
+    if tracer is not None:
+        tracer.observe(name, value)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the registered threads (e.g. the audio threads) every interval seconds. collapsed()
+    returns them in the folded format of flamegraph.pl and speedscope, one "outer;...;inner count" per line.
+    """
+
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.threads = set()
+        self.samples = Counter()
+        self.lock = threading.Lock()
+        self.running = False
+
+    def add_thread(self, ident=None):
+        with self.lock:
+            self.threads.add(threading.get_ident() if ident is None else ident)
+
+    def remove_thread(self, ident=None):
+        with self.lock:
+            self.threads.discard(threading.get_ident() if ident is None else ident)
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.run, name="profiler", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        while self.running:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                stacks = [self.stack(frames[ident]) for ident in self.threads if ident in frames]
+                self.samples.update(stacks)
+
+    def stack(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def collapsed(self):
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
@@ -2,6 +2,7 @@ import os
 import json
 import re
 import string
+import wave
 import pyaudio
 import numpy as np
 
@@ -29,6 +30,39 @@ def record_audio(audio_queue, rate=SAMPLE_RATE, chunk_size=CHUNK_SIZE):
         audio.terminate()
 
 
+def read_wav(path):
+    """Mono float32 samples at SAMPLE_RATE, other rates are resampled linearly (good enough for speech)."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM is supported")
+        channels, rate = f.getnchannels(), f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).astype(np.float32) / 32768.0
+
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        positions = np.arange(0, len(samples) * SAMPLE_RATE // rate) * rate / SAMPLE_RATE
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    return samples
+
+
+def write_wav(path, samples, rate):
+    """Write float32 or int16 mono samples as 16-bit PCM."""
+    if samples.dtype != np.int16:
+        samples = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+
+
+def audio_rms(audio_data):
+    """Root mean square energy of a float32 chunk, without allocating a temporary array."""
+    if len(audio_data) == 0:
+        return 0.0
+    return float(np.sqrt(np.dot(audio_data, audio_data) / len(audio_data)))
+
+
 def process_hotwords(hotword_file):
     fst_dict = {}
     hotword_msg = ""
@@ -64,6 +98,11 @@ def postprocess_funasr_result(result, remove_punctuation=False):
     return text
 
 
+def join_transcriptions(texts):
+    # The way SenseVoice joins the texts of the segments its VAD cut the input into
+    return " ".join(text.strip() for text in texts if text.strip())
+
+
 def remove_markdown(text):
     # Remove headers (e.g., #, ##, ###)
     text = re.sub(r"#{1,6}\s*", "", text)
@@ -90,6 +129,17 @@ def preprocess_before_generation(text):
     return text
 
 
+class SessionSocketIO:
+    """Socket.IO handle that sends every event to a single client (the room named after its sid)."""
+
+    def __init__(self, socketio, sid):
+        self.socketio = socketio
+        self.sid = sid
+
+    def emit(self, event, data, **kwargs):
+        self.socketio.emit(event, data, to=self.sid, **kwargs)
+
+
 def emit(socketio, event, data):
     if socketio is not None:
         # print(f"Emitting event: {event} with data: {data}")
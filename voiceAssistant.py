@@ -3,7 +3,11 @@ from text_to_speech.speechGenerator import SpeechGenerator
 from llm import AnswerGenerator
 import queue
 import threading
+import time
+from collections import deque
 from utils import emit
+from audioIngest import AudioIngestQueue
+from tracing import mark, observe
 
 
 class VoiceAssistant:
@@ -13,6 +17,13 @@ class VoiceAssistant:
         speech_generator: SpeechGenerator,
         answer_generator: AnswerGenerator,
         socketio=None,
+        audio_queue_maxsize=0,
+        audio_queue_policy="block",
+        speculative_llm=False,
+        response_cache=None,
+        tracer=None,
+        profiler=None,
+        release_audio=None,
     ):
         """Initialize the personal assistant with ASR, TTS, and LLM systems."""
         self.speech_recognizer = speech_recognizer
@@ -20,19 +31,79 @@ class VoiceAssistant:
         self.answer_generator = answer_generator
         self.socketio = socketio
 
-        self.audio_queue = queue.Queue()
+        # release_audio frees the buffer slot of a mic chunk once it has been processed
+        self.audio_queue = AudioIngestQueue(
+            maxsize=audio_queue_maxsize, policy=audio_queue_policy, release=release_audio
+        )
         self.threads = []
+        self.offline_poll_interval = 0.02
+        self.stop_timeout = 2.0
+        self.speculative_llm = speculative_llm
+        self.response_cache = response_cache
+        # Per-turn handoff timestamps, and the optional sampling profiler of the audio thread
+        self.tracer = tracer
+        self.profiler = profiler
+
+        self.llm_thread = None
+        self.answer_active = False
+        self.barge_in_lock = threading.Lock()
+        # The latest barge-in latencies, the count is of the whole session
+        self.barge_in_latencies = deque(maxlen=100)
+        self.barge_in_count = 0
 
     def process_audio(self):
         """Process audio chunks from the queue and handle transcription."""
+        if self.profiler is not None:
+            self.profiler.add_thread()
+        try:
+            self.process_audio_chunks()
+        finally:
+            if self.profiler is not None:
+                self.profiler.remove_thread()
+
+    def process_audio_chunks(self):
         while True:
-            # Since queue.get() is a blocking operation, the while loop is not busy-waiting
-            audio_data = self.audio_queue.get()
+            # Since queue.get() is a blocking operation, the while loop is not busy-waiting.
+            # While the offline pass of a finished turn is running, check back for it between chunks
+            offline_pending = self.speech_recognizer.offline_pending()
+            try:
+                audio_data = self.audio_queue.get(timeout=self.offline_poll_interval if offline_pending else None)
+            except queue.Empty:
+                pass
+            else:
+                if audio_data is None:
+                    break
+                observe(self.tracer, "audio_queue_wait", self.audio_queue.last_lag)
+                start = time.monotonic()
+                self.speech_recognizer.process_audio_chunk(audio_data)
+                observe(self.tracer, "chunk_processing", time.monotonic() - start)
+                # The accumulated speech is a copy, nothing refers to the chunk anymore
+                self.audio_queue.release(audio_data)
+                # Only the first chunk of the turn is kept
+                mark(self.tracer, "chunk_received", self.audio_queue.last_put_time)
+
+            state = self.speech_recognizer.state
+            if state == SpeechRecognizerState.ONLINE and self.answer_active:
+                self.answer_active = False
+                if self.answer_generator.is_generating() or self.speech_generator.is_speaking():
+                    self.barge_in()
+
+            if self.speculative_llm and state == SpeechRecognizerState.ONLINE:
+                # The user resumed speaking, the transcription will change
+                self.answer_generator.discard_speculation()
+
+            # Wait for the offline pass running in the background before answering
+            if state == SpeechRecognizerState.ONLINE or self.speech_recognizer.offline_pending():
+                continue
 
-            self.speech_recognizer.process_audio_chunk(audio_data)
             transcription = self.speech_recognizer.get_transcription().strip()
+            if state == SpeechRecognizerState.OFFLINE:
+                # Hide the LLM time to first token behind the idle wait
+                if self.speculative_llm and transcription:
+                    self.answer_generator.speculate(transcription)
+                continue
 
-            if transcription and self.speech_recognizer.state == SpeechRecognizerState.IDLE:
+            if transcription:
                 print("Processing with LLM...")
                 emit(self.socketio, "llm_started", {"started": True})
                 self.speech_recognizer.reset_external_transcription()
@@ -40,27 +111,111 @@ class VoiceAssistant:
 
     def process_with_llm(self, transcription):
         """Process the transcription with the LLM and generate a response."""
-        for thread in threading.enumerate():
-            print(thread)
+        mark(self.tracer, "answer_started")
 
-        # Start the speech generation thread
         # Allow playback at client side
         emit(self.socketio, "listening_to_user", {"listening": False})
-        self.speech_generator.start()
+
+        history = self.answer_generator.context.messages()
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(transcription, history)
+            if cached is not None:
+                self.answer_from_cache(transcription, cached)
+                return
+
+        # Keep the synthesized audio of a cacheable answer once all of it has been sent
+        cache_entry = None
+
+        def attach_audio(audio):
+            if cache_entry is not None and audio:
+                cache_entry.audio = audio
+
+        # Start the speech generation thread
+        self.speech_generator.start(on_all_speech_sent=attach_audio if self.response_cache is not None else None)
+
+        generation = self.answer_generator.start_answer(transcription)
 
         def llm_thread():
+            nonlocal cache_entry
             print("LLM thread started")
-            for token in self.answer_generator.stream_answer(transcription):
+            answer = ""
+            for token in self.answer_generator.stream_answer(generation):
                 self.speech_generator.add_text(token)
+                answer += token
 
             # Process any remaining content in the buffer
             if not self.speech_generator.interrupt_event.is_set():
+                # Only complete answers are cached, the audio is attached when the speech generator is done
+                if self.response_cache is not None and answer and not generation.cancelled:
+                    cache_entry = self.response_cache.store(transcription, history, answer)
                 self.speech_generator.add_text("", buffered=False)
 
-        llm_thread_instance = threading.Thread(target=llm_thread)
-        llm_thread_instance.start()
+        self.llm_thread = threading.Thread(target=llm_thread, daemon=True)
+        self.llm_thread.start()
+        self.answer_active = True
+
+    def answer_from_cache(self, transcription, cached):
+        """Answer with a cached response, replaying its audio when it was kept, without calling the LLM."""
+        print("Answering from the response cache")
+        self.answer_generator.add_cached_answer(transcription, cached.text)
+
+        if cached.audio is not None:
+            self.speech_generator.play(cached.audio)
+        else:
+            self.speech_generator.start(on_all_speech_sent=lambda audio: setattr(cached, "audio", audio or None))
+            self.speech_generator.add_text(cached.text, buffered=False)
+
+        self.llm_thread = None
+        self.answer_active = True
+
+    def barge_in(self):
+        """The user spoke over the answer: abort the generation at once and measure how long until silence."""
+        # Measured from the arrival of the chunk the user was detected in
+        started = self.audio_queue.last_put_time
+        mark(self.tracer, "barge_in")
+        self.answer_generator.cancel()
+        threading.Thread(target=self.measure_barge_in, args=(started, self.llm_thread), daemon=True).start()
+
+    def measure_barge_in(self, started, llm_thread):
+        if llm_thread is not None:
+            llm_thread.join()
+        self.speech_generator.idle_event.wait()
+
+        latency = time.monotonic() - started
+        with self.barge_in_lock:
+            self.barge_in_latencies.append(latency)
+            self.barge_in_count += 1
+        observe(self.tracer, "barge_in", latency)
+
+    def barge_in_stats(self):
+        with self.barge_in_lock:
+            latencies = list(self.barge_in_latencies)
+            count = self.barge_in_count
+
+        return {
+            "count": count,
+            "latency_last_s": latencies[-1] if latencies else 0.0,
+            "latency_mean_s": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_max_s": max(latencies, default=0.0),
+        }
 
     def run(self):
         process_audio_thread = threading.Thread(target=self.process_audio)
         self.threads.append(process_audio_thread)
         return process_audio_thread
+
+    def stop(self):
+        """Stop the audio thread and any ongoing answer, e.g. when the client disconnects."""
+        # Setting the interrupt stops the speech generation
+        self.speech_recognizer.listening_to_user_event.set()
+        self.answer_generator.cancel()
+        self.answer_generator.discard_speculation()
+        self.audio_queue.put(None)
+        # Let the audio thread finish its chunk, it may still submit to the offline worker
+        for thread in self.threads:
+            if thread is not threading.current_thread() and thread.is_alive():
+                thread.join(self.stop_timeout)
+        self.speech_generator.close()
+        self.speech_recognizer.close()
+        if self.tracer is not None:
+            self.tracer.finish()